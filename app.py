@@ -1,8 +1,11 @@
 import gradio as gr
 import re
 import json
+import asyncio
+import uuid
 from graph.graph import Subgraph, MainGraph
-from tools.tools import EVENT_PERFORMANCE_TOOL, SEASON_PERFORMANCE_TOOL, EVENT_SUMMARY_TOOL
+from graph.utils import tool_call_parameters
+from tools.tools import EVENT_PERFORMANCE_TOOL, SEASON_PERFORMANCE_TOOL, EVENT_SUMMARY_TOOL, SEASON_LEADERBOARD_TOOL, SIMILAR_PLAYERS_TOOL
 from graph.config import (
     ANALYZE_GAME_TOOL_CALLER_SYSTEM_MESSAGE,
     ANALYZE_PLAYER_TOOL_CALLER_SYSTEM_MESSAGE,
@@ -10,13 +13,14 @@ from graph.config import (
     ROUTER_SYSTEM_MESSAGE,
     ROUTER_MODEL_NAME,
 )
-from config import USER_INFO
+from config import USER_INFO, APP_CONCURRENCY_LIMIT
+from tools.helper.streaming import progress_callback, describe_result
 from langchain_community.tools.ddg_search.tool import DuckDuckGoSearchResults
 
 
 # Initialize Graphs
 player_analyze_subgraph = Subgraph(
-    tools=[EVENT_PERFORMANCE_TOOL, SEASON_PERFORMANCE_TOOL],
+    tools=[EVENT_PERFORMANCE_TOOL, SEASON_PERFORMANCE_TOOL, SEASON_LEADERBOARD_TOOL, SIMILAR_PLAYERS_TOOL],
     name='analyze-player',
     tool_caller_system_message=ANALYZE_PLAYER_TOOL_CALLER_SYSTEM_MESSAGE,
     interrupt=['analyze_tools']
@@ -43,35 +47,84 @@ main_graph = MainGraph(
 )
 
 # State to manage feedback
-# State management
+# State management, one instance per browser session
 class GradioState():
     def __init__(self):
         self.feedback_pending = False
         self.pending_tool_call = None
         self.selected_subgraph = None
         self.parameters = []
-        self.config = {"configurable": {"thread_id": "1"}}
-        
-gr_state = GradioState()
-
-def handle_user_input(user_message: str, chat_history: list):
+        self.config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+        # A session runs one request at a time, its requests change the same thread
+        self.lock = asyncio.Lock()
+
+async def run_with_progress(stream_function, *args, **kwargs):
+    """
+    Run a graph stream as a task on the app's event loop and report the tool results it collects and the answer as it is written.
+
+    Yields:
+        ("progress", str) for every tool result that is ready and ("token", str) for every piece of the answer, in the order they arrive.
+    """
+    updates = asyncio.Queue()
+
+    async def consume():
+        async for chunk in stream_function(*args, **kwargs):
+            updates.put_nowait(("token", chunk))
+
+    # The task copies the current context, so the async tools it runs report to this queue
+    with progress_callback(lambda item: updates.put_nowait(("progress", describe_result(item)))):
+        task = asyncio.ensure_future(consume())
+
+    try:
+        while not task.done():
+            getter = asyncio.ensure_future(updates.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+            else:
+                getter.cancel()
+        while not updates.empty():
+            yield updates.get_nowait()
+    finally:
+        if not task.done():
+            task.cancel()
+
+    # Raise what the graph raised
+    task.result()
+
+def progress_message(ready_count: int, latest: str) -> str:
+    return f"Fetching data... {ready_count} result(s) ready. Latest: {latest}"
+
+async def handle_user_input(user_message: str, chat_history: list, gr_state: GradioState):
     """Process user input and update sidebar values"""
-    #config = {"configurable": {"thread_id": "1"}}
-
-    response = main_graph.process_message(user_input=user_message, config=gr_state.config, app_state=gr_state)
-    if gr_state.feedback_pending:
-        # Parse parameters from state
-        gr_state.parameters = gr_state.pending_tool_call["args"]["parameters"]
-        tool_call_updated = json.dumps(gr_state.parameters[0], indent=4)  # Format as JSON with indentation
-        # Display the JSON string and make it visible
-        chat_history.append((user_message, "I've parsed your request. You can modify the values in the sidebar."))
-        return "", chat_history, gr.update(value=tool_call_updated, visible=True, interactive=True)  # Update the JSON Textbox
-    else:
-        chat_history.append((user_message, response))
-        return "", chat_history, gr.update(value='', visible=False, interactive=True)
-
-
-def update_tool_call(chat_history: list, tool_params_feedback: str):
+    async with gr_state.lock:
+        # A new question drops a tool call that was never confirmed
+        gr_state.feedback_pending = False
+        response = ''
+        ready_count = 0
+        async for kind, value in run_with_progress(main_graph.astream_message, user_input=user_message, config=gr_state.config, app_state=gr_state):
+            if kind == "progress":
+                ready_count += 1
+                yield "", chat_history + [(user_message, progress_message(ready_count, value))], gr.update(), gr_state
+            elif not gr_state.feedback_pending:
+                # The answer is shown as it is written, the feedback prompt is replaced by the sidebar below
+                response += value
+                yield "", chat_history + [(user_message, response)], gr.update(), gr_state
+
+        if gr_state.feedback_pending:
+            # Parse parameters from state
+            # Tools with flat arguments (leaderboard, similar players) are edited as a whole
+            gr_state.parameters = [tool_call_parameters(gr_state.pending_tool_call)]
+            tool_call_updated = json.dumps(gr_state.parameters[0], indent=4)  # Format as JSON with indentation
+            # Display the JSON string and make it visible
+            chat_history.append((user_message, "I've parsed your request. You can modify the values in the sidebar."))
+            yield "", chat_history, gr.update(value=tool_call_updated, visible=True, interactive=True), gr_state  # Update the JSON Textbox
+        else:
+            chat_history.append((user_message, response))
+            yield "", chat_history, gr.update(value='', visible=False, interactive=True), gr_state
+
+
+async def update_tool_call(chat_history: list, tool_params_feedback: str, gr_state: GradioState):
     """Process updated values from sidebar"""
     if tool_params_feedback == '':
         updated_params = {}
@@ -80,26 +133,39 @@ def update_tool_call(chat_history: list, tool_params_feedback: str):
             updated_params = json.loads(tool_params_feedback)  # Parse the updated JSON input
         except (ValueError, TypeError, json.JSONDecodeError):
             chat_history.append((None, "Please enter valid JSON"))
-        
-    #config = {"configurable": {"thread_id": "1"}}
-    selected_subgraph = gr_state.selected_subgraph
-    if selected_subgraph:
-        new_gr_state = selected_subgraph.update_tool_message(app_state=gr_state, tool_call_feedback=updated_params)
-        response = selected_subgraph.stream_graph_updates(user_input=None, config=new_gr_state.config)
-        chat_history.append((None, response))
-    
-    if '[Tool Error]' in response:
-        return chat_history, gr.update(value=tool_params_feedback, interactive=True, visible=True) , gr_state
-    
-    else:
-        gr_state.feedback_pending = False
-        gr_state.pending_tool_call = None
-        gr_state.selected_subgraph = None
-        gr_state.parameters = []
-            
-        return chat_history, gr.update(visible=False)
-
-def create_app(gr_state):
+            yield chat_history, gr.update(value=tool_params_feedback, interactive=True, visible=True), gr_state
+            return
+
+    async with gr_state.lock:
+        response = ''
+        selected_subgraph = gr_state.selected_subgraph
+        if selected_subgraph:
+            new_gr_state = await selected_subgraph.aupdate_tool_message(app_state=gr_state, tool_call_feedback=updated_params)
+            # The approved tool call runs here, show its results as they arrive
+            ready_count = 0
+            async for kind, value in run_with_progress(selected_subgraph.astream_answer, user_input=None, config=new_gr_state.config):
+                if kind == "progress":
+                    ready_count += 1
+                    yield chat_history + [(None, progress_message(ready_count, value))], gr.update(), gr_state
+                else:
+                    response += value
+                    yield chat_history + [(None, response)], gr.update(), gr_state
+            chat_history.append((None, response))
+            if response and '[Tool Error]' not in response:
+                selected_subgraph.aschedule_compaction(new_gr_state.config)
+
+        if response and '[Tool Error]' in response:
+            yield chat_history, gr.update(value=tool_params_feedback, interactive=True, visible=True), gr_state
+
+        else:
+            gr_state.feedback_pending = False
+            gr_state.pending_tool_call = None
+            gr_state.selected_subgraph = None
+            gr_state.parameters = []
+
+            yield chat_history, gr.update(visible=False), gr_state
+
+def create_app(concurrency_limit: int = APP_CONCURRENCY_LIMIT):
     with gr.Blocks(css="""
         #sidebar {
             max-height: 700px;
@@ -121,23 +187,28 @@ def create_app(gr_state):
                 tool_params_textbox = gr.Textbox(label="Tool Call JSON", visible=False, interactive=True, lines=16)
                 update_btn = gr.Button("Update")
 
+        # Every session gets its own state and thread id, the callable is run when a session loads
+        session_state = gr.State(GradioState)
+
         # Handle initial user input
         msg.submit(
             handle_user_input,
-            inputs=[msg, chatbot],
-            outputs=[msg, chatbot, tool_params_textbox]
+            inputs=[msg, chatbot, session_state],
+            outputs=[msg, chatbot, tool_params_textbox, session_state]
         )
 
         # Handle update button click
         #if tool_params_textbox.visible:
         update_btn.click(
             update_tool_call,
-            inputs=[chatbot, tool_params_textbox],
-            outputs=[chatbot, tool_params_textbox]
+            inputs=[chatbot, tool_params_textbox, session_state],
+            outputs=[chatbot, tool_params_textbox, session_state]
         )
 
+    # Requests of different sessions run side by side on the event loop, up to the limit
+    demo.queue(default_concurrency_limit=concurrency_limit)
     return demo
 
 if __name__ == "__main__":
-    app = create_app(gr_state)
+    app = create_app()
     app.launch()
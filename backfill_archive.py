@@ -0,0 +1,89 @@
+import argparse
+import json
+from decimal import Decimal
+from config import *
+from tools.helper.streaming import iter_completed
+from tools.helper.season_stats import get_player_property, create_url_params, request_player_season_stats
+from tools.helper.season_ratings import request_player_season_ratings
+from tools.helper.season_archive import SEASON_ARCHIVE, season_finished
+
+
+def fetch_season(param: dict) -> tuple | None:
+    player_id, tournament_id, unique_season_id = param["PLAYER_ID"], param["TOURNAMENT_ID"], param["UNIQUE_SEASON_ID"]
+    try:
+        return (
+            param,
+            request_player_season_stats(player_id, tournament_id, unique_season_id),
+            request_player_season_ratings(player_id, tournament_id, unique_season_id),
+        )
+    except Exception as e:
+        print(f"Error fetching season {unique_season_id} of player {player_id}: {e}")
+        return None
+
+def backfill(parameters: list) -> int:
+    """
+    Fetch the finished seasons of every parameter set that are not archived yet and write them to the archive.
+
+    Args:
+        parameters (list): Dictionaries with "player_name" and the optional "tournament_name", "tournament_country"
+            and "season_year", like the inputs of the season performance tool.
+
+    Returns:
+        int: The number of seasons added to the archive.
+    """
+    jobs = []
+    for params in parameters:
+        player_name = params["player_name"]
+        player_id = get_player_property(player_name=player_name, col_name="PLAYER_ID")
+        if player_id is None or isinstance(player_id, list):
+            print(f"Skipping '{player_name}': the name is unknown or not unique.")
+            continue
+        if isinstance(player_id, Decimal):
+            player_id = int(player_id)
+
+        url_params = create_url_params(
+            player_id=player_id,
+            tournament_name=params.get("tournament_name"),
+            tournament_country=params.get("tournament_country"),
+            season_year=params.get("season_year"),
+            table_name="dim_unique_seasons"
+        )
+        for param in url_params:
+            if season_finished(param.get("SEASON_YEAR")) and not SEASON_ARCHIVE.has(param["PLAYER_ID"], param["UNIQUE_SEASON_ID"]):
+                jobs.append(((player_name, param["UNIQUE_SEASON_ID"]), fetch_season, (param,)))
+
+    seasons = []
+    for (player_name, unique_season_id), season in iter_completed(jobs):
+        if season is None:
+            continue
+        seasons.append(season)
+        print(f"Fetched {player_name} - {season[0].get('TOURNAMENT_NAME')} {season[0].get('SEASON_YEAR')}")
+    if not seasons:
+        return 0
+    return SEASON_ARCHIVE.write(seasons)
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive the stats and ratings of finished seasons so they are no longer fetched from Sofascore.")
+    parser.add_argument("--player", action="append", default=[], help="Player name, can be repeated.")
+    parser.add_argument("--tournament", help="Tournament name, every tournament of the season year when omitted.")
+    parser.add_argument("--country", help="Tournament country, for tournaments with the same name.")
+    parser.add_argument("--season-year", type=int, help="Season year, every finished season of the tournament when omitted.")
+    parser.add_argument("--file", help="JSON file with a list of parameter sets, used in addition to --player.")
+    args = parser.parse_args()
+
+    parameters = [
+        {"player_name": player, "tournament_name": args.tournament, "tournament_country": args.country, "season_year": args.season_year}
+        for player in args.player
+    ]
+    if args.file:
+        with open(args.file, encoding="utf-8") as file:
+            parameters += json.load(file)
+    if not parameters:
+        parser.error("Give at least one --player or a --file.")
+
+    added = backfill(parameters)
+    logger.info(f"Season archive: {added} seasons added, generation {SEASON_ARCHIVE.generation}")
+    print(f"{added} seasons added to {SEASON_ARCHIVE_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,77 @@ USE_PROXIES = False
 if USE_PROXIES:
     PROXIES = os.getenv("PROXIES")
 
+# Event stats of a match are read from one `lineups` response when at least this many of its players are requested
+LINEUPS_STATS_MIN_PLAYERS = 2
+# Number of finished matches whose `lineups` response is kept in memory
+LINEUPS_CACHE_SIZE = 256
+# Number of Sofascore requests a tool call runs at the same time
+MAX_FETCH_WORKERS = 8
+# Number of requests the async tools of one process run at the same time, across all sessions
+MAX_ASYNC_FETCHES = 64
+# Number of chat requests the Gradio app handles at the same time, across all sessions
+APP_CONCURRENCY_LIMIT = 8
+# Seconds a tool call may spend fetching before it returns what it has, marked as partial. None disables the limit.
+TOOL_TIME_BUDGET = 45
+# Timeout in seconds of a single query/scan lambda request
+LAMBDA_TIMEOUT = 30
+# Seconds a thread's fetched responses are reused when an edited or approved tool call runs again. A new question fetches anew.
+EXECUTION_CACHE_TTL = 900
+# Maximum number of responses kept per conversation thread
+EXECUTION_CACHE_SIZE = 2048
+# Maximum number of conversation threads whose responses are kept
+EXECUTION_CACHE_THREADS = 64
+# Earlier team scans kept per thread and team, narrower date ranges and filters of an edited call are served from them
+EXECUTION_CACHE_SCANS_PER_TEAM = 4
+# Weight of the latest match in the exponentially weighted form rating
+FORM_EWMA_ALPHA = 0.3
+# Number of (player, season) rating series whose form is kept in memory and extended with new matches
+FORM_CACHE_SIZE = 512
+# Number of fetched (player, season) stats and ratings kept in memory for percentiles, leaderboards and similarity search
+SEASON_STATS_CACHE_SIZE = 5000
+# Add percentiles within tournament, season and position to the season stats results
+SEASON_PERCENTILES = False
+# Players with fewer minutes in a season are left out of its percentile index
+PERCENTILE_MIN_MINUTES = 450
+# Serialize tool results as compact tables before they become tool messages
+COMPACT_TOOL_OUTPUT = True
+# Add per 90 rates, ratios and team shares to the compact tables of several players, computed column-wise by the stats frames
+COMPARISON_METRICS = True
+# Number of players a leaderboard returns unless asked otherwise
+LEADERBOARD_SIZE = 10
+# Players with fewer minutes are left out of stat leaderboards
+LEADERBOARD_MIN_MINUTES = 450
+# Players with fewer rated matches are left out of rating leaderboards
+LEADERBOARD_MIN_GAMES = 5
+# Number of players a similar players search returns unless asked otherwise
+SIMILAR_PLAYERS_COUNT = 5
+# Rows of the similarity matrix multiplied at once by a similar players search
+SIMILARITY_BLOCK_ROWS = 4096
+# Directory the similarity index is saved to and memory-mapped from at startup
+SIMILARITY_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "similarity_index")
+# Seconds a change of the similarity index waits before it is saved, with every other change made meanwhile
+SIMILARITY_INDEX_SAVE_SECONDS = 60
+# Directory of the memory-mapped archive of finished season stats and ratings, filled by backfill_archive.py
+SEASON_ARCHIVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "season_archive")
+# Month the new season starts in, seasons of earlier years count as finished from then on
+SEASON_ARCHIVE_NEW_SEASON_MONTH = 7
+# How big games are told apart in season ratings: "elo" for the team strength model, "market_value" for the dim_teams scan
+OPPONENT_STRENGTH_MODEL = "elo"
+# First match day of the dim_events history the Elo ratings are computed from
+TEAM_STRENGTH_HISTORY_START = "2023-07-01"
+# Seconds between two scans for new results
+TEAM_STRENGTH_REFRESH_SECONDS = 3600
+# Seconds before a failed scan is tried again
+TEAM_STRENGTH_RETRY_SECONDS = 300
+# Elo parameters: rating of a new team, weight of a result and rating points of playing at home
+ELO_INITIAL_RATING = 1500
+ELO_K_FACTOR = 20
+ELO_HOME_ADVANTAGE = 60
+# Opponents rated at most this many points below the player's team count as big games
+ELO_BIG_GAME_MARGIN = 100
+# Opponent strength bands, strongest first, split by rating quantiles
+TEAM_STRENGTH_BANDS = ("top", "upper", "lower", "bottom")
+
 USER_INFO = """
 
 ## How to Use the Football Performance Analysis App :soccer:
@@ -0,0 +1,319 @@
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import WRITES_IDX_MAP, ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import MemorySaver
+from config import logger
+from graph.config import (
+    CHECKPOINTER,
+    CHECKPOINT_DIR,
+    CHECKPOINTS_PER_THREAD,
+    CHECKPOINT_IDLE_SECONDS,
+    CHECKPOINT_FLUSH_SECONDS,
+    CHECKPOINT_BATCH_SIZE,
+    CHECKPOINT_USAGE_LOG_SECONDS
+)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+# Wakes the writer up to evict idle threads when no checkpoints are written
+_EVICTION_INTERVAL = 60.0
+
+
+class BoundedSqliteSaver(MemorySaver):
+    """
+    `MemorySaver` whose threads are also written to a SQLite file, so they survive a restart.
+
+    The dictionaries of `MemorySaver` stay the working copy, nodes read and write them as before. Checkpoints
+    are queued to a writer thread, which writes them in one transaction every `flush_seconds` or `batch_size`
+    rows, so a node never waits for the disk. Only the latest `max_per_thread` checkpoints of a thread are kept,
+    in memory and on disk. Threads idle for `idle_seconds` leave memory once they are written and are read back
+    from the file when they are used again, `on_evict` is called with the id of every evicted thread so the
+    per-thread state kept beside the checkpoints can go too. `list` without a thread id only sees the threads in memory.
+    """
+    def __init__(
+        self,
+        path: str,
+        max_per_thread: int = CHECKPOINTS_PER_THREAD,
+        idle_seconds: float = CHECKPOINT_IDLE_SECONDS,
+        flush_seconds: float = CHECKPOINT_FLUSH_SECONDS,
+        batch_size: int = CHECKPOINT_BATCH_SIZE,
+        on_evict: Callable[[str], None] | None = None,
+        usage_log_seconds: float = CHECKPOINT_USAGE_LOG_SECONDS,
+    ):
+        super().__init__()
+        self.path = path
+        # The latest checkpoint and its parent, which holds the pending sends, are always kept
+        self.max_per_thread = max(2, max_per_thread)
+        self.idle_seconds = idle_seconds
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.on_evict = on_evict
+        self.usage_log_seconds = usage_log_seconds
+        self._usage_logged_at = time.monotonic()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self._connection.commit()
+        self._lock = threading.RLock()
+        # thread id -> time.monotonic() of the last use, for the threads in memory
+        self._last_used: Dict[str, float] = {}
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(target=self._run_writer, name=f"checkpoint-writer-{os.path.basename(path)}", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _touch(self, thread_id: str):
+        """Mark the thread as used, reading it from the file first when it is not in memory."""
+        if thread_id not in self._last_used:
+            self._load(thread_id)
+        self._last_used[thread_id] = time.monotonic()
+
+    def _load(self, thread_id: str):
+        checkpoints = self._connection.execute(
+            "SELECT checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints WHERE thread_id = ?", (thread_id,)
+        ).fetchall()
+        for ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata in checkpoints:
+            self.storage[thread_id][ns][checkpoint_id] = ((type_, checkpoint), (metadata_type, metadata), parent_id)
+        writes = self._connection.execute(
+            "SELECT checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value FROM writes WHERE thread_id = ?", (thread_id,)
+        ).fetchall()
+        for ns, checkpoint_id, task_id, idx, channel, type_, value in writes:
+            self.writes[(thread_id, ns, checkpoint_id)][(task_id, idx)] = (task_id, channel, (type_, value))
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        """Drop the checkpoints of the thread beyond `max_per_thread`, oldest first. Checkpoint ids sort by time."""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.max_per_thread:
+            return
+        dropped = sorted(checkpoints)[:-self.max_per_thread]
+        for checkpoint_id in dropped:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        self._queue.put(("prune", thread_id, checkpoint_ns, dropped))
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self._lock:
+            self._touch(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config:
+                self._touch(config["configurable"]["thread_id"])
+            # The list is built under the lock, eviction must not change the dictionaries while they are iterated
+            checkpoints = list(super().list(config, filter=filter, before=before, limit=limit))
+        yield from checkpoints
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            self._touch(thread_id)
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            saved_checkpoint, saved_metadata, parent_id = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+            self._queue.put(("checkpoint", thread_id, checkpoint_ns, checkpoint["id"], parent_id, saved_checkpoint, saved_metadata))
+            self._prune(thread_id, checkpoint_ns)
+        return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            self._touch(thread_id)
+            super().put_writes(config, writes, task_id)
+            saved = self.writes[(thread_id, checkpoint_ns, checkpoint_id)]
+            for idx, (channel, _) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                _, channel, value = saved[(task_id, idx)]
+                self._queue.put(("write", thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, value))
+
+    ###########################################################################################################################################
+    # WRITER THREAD ###
+    ###########################################################################################################################################
+
+    def _run_writer(self):
+        # The writer has its own connection, so reads of evicted threads never wait for a write and nodes never wait for either
+        connection = sqlite3.connect(self.path)
+        while True:
+            try:
+                batch = [self._queue.get(timeout=min(_EVICTION_INTERVAL, self.idle_seconds))]
+            except queue.Empty:
+                self._evict_idle()
+                continue
+            deadline = time.monotonic() + self.flush_seconds
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            closing = batch[-1] is None
+            self._write(connection, [row for row in batch if row is not None])
+            for _ in batch:
+                self._queue.task_done()
+            if closing:
+                connection.close()
+                return
+            self._evict_idle()
+
+    def _write(self, connection: sqlite3.Connection, batch: list):
+        if not batch:
+            return
+        try:
+            with connection:
+                for kind, thread_id, checkpoint_ns, *row in batch:
+                    if kind == "checkpoint":
+                        checkpoint_id, parent_id, (type_, checkpoint), (metadata_type, metadata) = row
+                        connection.execute(
+                            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata)
+                        )
+                    elif kind == "write":
+                        checkpoint_id, task_id, idx, channel, (type_, value) = row
+                        connection.execute(
+                            "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type_, value)
+                        )
+                    else:
+                        keys = [(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in row[0]]
+                        connection.executemany("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", keys)
+                        connection.executemany("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", keys)
+        except Exception as e:
+            print(f"Error writing {len(batch)} checkpoint rows to {self.path}: {e}")
+
+    def _evict_idle(self):
+        """Remove the threads idle for `idle_seconds` from memory. Runs after a flush, so they are on disk."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._queue.empty():
+                return
+            idle = [thread_id for thread_id, used in self._last_used.items() if now - used >= self.idle_seconds]
+            for thread_id in idle:
+                del self._last_used[thread_id]
+                self.storage.pop(thread_id, None)
+                for key in [key for key in self.writes if key[0] == thread_id]:
+                    del self.writes[key]
+        if idle:
+            logger.info(f"Checkpoints: evicted {len(idle)} idle threads from memory, {len(self._last_used)} still loaded")
+        for thread_id in idle if self.on_evict is not None else []:
+            try:
+                self.on_evict(thread_id)
+            except Exception as e:
+                print(f"Error forgetting the state of evicted thread {thread_id}: {e}")
+        if now - self._usage_logged_at >= self.usage_log_seconds:
+            self._usage_logged_at = now
+            self.log_usage()
+
+    def flush(self):
+        """Block until every queued checkpoint is written."""
+        self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    ###########################################################################################################################################
+    # USAGE ###
+    ###########################################################################################################################################
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """
+        Checkpoint bytes of every thread, serialized size in memory and stored size on disk.
+
+        Returns:
+            dict: thread id -> {"checkpoints": count, "memory_bytes": int, "disk_bytes": int}
+        """
+        report = {}
+        with self._lock:
+            for thread_id, namespaces in self.storage.items():
+                entry = report.setdefault(thread_id, {"checkpoints": 0, "memory_bytes": 0, "disk_bytes": 0})
+                for checkpoints in namespaces.values():
+                    entry["checkpoints"] += len(checkpoints)
+                    entry["memory_bytes"] += sum(len(checkpoint[1]) + len(metadata[1]) for checkpoint, metadata, _ in checkpoints.values())
+            for (thread_id, _, _), writes in self.writes.items():
+                if thread_id in report:
+                    report[thread_id]["memory_bytes"] += sum(len(value[1]) for _, _, value in writes.values())
+            rows = self._connection.execute(
+                "SELECT thread_id, COUNT(*), SUM(LENGTH(checkpoint) + LENGTH(metadata)) FROM checkpoints GROUP BY thread_id"
+            ).fetchall()
+            write_rows = self._connection.execute("SELECT thread_id, SUM(LENGTH(value)) FROM writes GROUP BY thread_id").fetchall()
+        for thread_id, count, size in rows:
+            entry = report.setdefault(thread_id, {"checkpoints": count, "memory_bytes": 0, "disk_bytes": 0})
+            entry["disk_bytes"] += size or 0
+        for thread_id, size in write_rows:
+            if thread_id in report:
+                report[thread_id]["disk_bytes"] += size or 0
+        return report
+
+    def log_usage(self):
+        report = self.usage()
+        memory = sum(entry["memory_bytes"] for entry in report.values())
+        disk = sum(entry["disk_bytes"] for entry in report.values())
+        logger.info(f"Checkpoints {self.path}: {len(report)} threads, {memory / 1024:.1f} KiB in memory, {disk / 1024:.1f} KiB on disk")
+        for thread_id, entry in sorted(report.items(), key=lambda item: -item[1]["memory_bytes"] - item[1]["disk_bytes"]):
+            logger.info(f"  thread {thread_id}: {entry['checkpoints']} checkpoints, {entry['memory_bytes']} B in memory, {entry['disk_bytes']} B on disk")
+        return report
+
+
+def create_checkpointer(name: str, on_evict: Callable[[str], None] | None = None) -> MemorySaver:
+    """
+    The checkpointer of a subgraph, each subgraph writes to its own file under `CHECKPOINT_DIR`.
+    `on_evict` is called with the threads that leave memory, the in-memory checkpointer keeps every thread.
+    """
+    if CHECKPOINTER == "sqlite":
+        return BoundedSqliteSaver(os.path.join(CHECKPOINT_DIR, f"{name}.sqlite"), on_evict=on_evict)
+    return MemorySaver()
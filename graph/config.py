@@ -1,4 +1,5 @@
 from datetime import datetime
+import os
 
 THIS_SEASON = "24/25"
 LAST_SEASON = "23/24"
@@ -12,13 +13,48 @@ ANSWER_GENERATOR_MODEL_NAME = 'gpt-3.5-turbo'
 TOOL_CALLER_TEMPERATURE = 0
 ANSWER_GENERATOR_TEMPERATURE = 0.5
 TOKEN_THRESHOLD = 10000
+# Local router tier in front of ROUTER_MODEL_NAME: messages it is not sure about still go to the LLM
+LOCAL_ROUTER = True
+ROUTER_TRAINING_PROMPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "prompts")
+ROUTER_PROMPT_LABELS = {"event_performance": "analyze-player", "season_performance": "analyze-player", "event_summary": "analyze-game", "general": "normal-graph"}
+ROUTER_MIN_SIMILARITY = 0.4
+ROUTER_MIN_MARGIN = 0.15
+# "summary" replaces the oldest turns with a summary message after an answer, "drop" only deletes them when a turn starts
+MEMORY_COMPACTION = "summary"
+SUMMARY_MODEL_NAME = 'gpt-3.5-turbo'
+COMPACTION_KEEP_TOKENS = 4000
+DIGEST_MAX_LINES_PER_RESULT = 40
+DIGEST_MAX_LINES = 200
+# "sqlite" keeps the thread histories in one SQLite file per subgraph under CHECKPOINT_DIR as well, "memory" only in RAM
+CHECKPOINTER = "sqlite"
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "checkpoints")
+CHECKPOINTS_PER_THREAD = 10
+CHECKPOINT_IDLE_SECONDS = 1800
+CHECKPOINT_FLUSH_SECONDS = 0.5
+CHECKPOINT_BATCH_SIZE = 64
+# Seconds between two logs of the checkpoint bytes of every thread
+CHECKPOINT_USAGE_LOG_SECONDS = 3600
+# Nodes whose LLM output is streamed to the user token by token, the tool caller answers itself when it calls no tool
+STREAMED_NODES = ("tool_caller", "answer_generator")
+# Tool results are reused within a thread for the same tool call, for as long as their data can not change
+TOOL_MEMO = True
+TOOL_MEMO_MAX_PER_THREAD = 32
+TOOL_MEMO_TTL_FINAL = 24 * 3600
+TOOL_MEMO_TTL_RECENT = 15 * 60
+TOOL_MEMO_TTL_LIVE = 2 * 60
+TOOL_MEMO_TTL_DEFAULT = 10 * 60
+# The leaderboard and similar players are computed from the local season caches, which grow with every fetch
+TOOL_MEMO_TTLS = {"obtain_season_leaderboard": 0, "obtain_similar_players": 0}
+# The proposed tool calls run in the background while the user reviews them, an approval uses their results and an edit cancels them
+SPECULATIVE_TOOLS = True
+SPECULATION_WORKERS = 4
 
 WEB_SEARCH_TOOL_CALLER_SYSTEM_MESSAGE = "You are a AI agent whose job is to call a langchain tool for web search. Use the tool when you do not know the answer to human question."
 
 ANALYZE_PLAYER_TOOL_CALLER_SYSTEM_MESSAGE = f"""
             You are a AI agent whose job is to call tools for a football player analysis AI assistant.
             
-            You have access to two tools: obtain_season_performance_data, and obtain_event_performance_data
+            You have access to four tools: obtain_season_performance_data, obtain_event_performance_data, obtain_season_leaderboard and obtain_similar_players
 
             Choosing the argument values of the tool call you will create, you will depend mostly on the last Human Message. If that does not have the values, you should look at previous messages.
             
@@ -76,8 +112,19 @@ ANALYZE_PLAYER_TOOL_CALLER_SYSTEM_MESSAGE = f"""
                 Its properties are player_name: str tournament_name: Union[str, None] player_team_name: Union[int, None] opponent_team_name: Union[str, None], event_date: Union[str,None]
                 event_date is a date string in the YYYY-MM-DD format
                 player_name is mandatory, the others are optional. If one of those parameters are not specified in user's question, set their value to None. (See Example 1)
+                When the user asks about a whole team's players in a match rather than named players, set player_name = None and player_team_name to the team, e.g. "How did the Galatasaray players perform against Fenerbahce?" -> player_name = None, player_team_name = "Galatasaray", opponent_team_name = "Fenerbahce"
+
+            The obtain_season_leaderboard takes the arguments tournament_name: str, season_year: Union[int, None], stat: str, k: Union[int, None], per_90: Union[bool, None], min_minutes: Union[int, None], position: Union[str, None]
+                Use it when the user asks for the best players of a tournament season in a stat, e.g. "Top 10 scorers of Premier League this season" -> tournament_name = "Premier League", season_year = 2024, stat = "goals", k = 10
+                stat is a Sofascore season stat in camelCase (goals, assists, expectedGoals, keyPasses, tackles, interceptions, saves, ...) or one of average_rating, average_big_game_rating, form_last_5, form_last_10, form_ewma
+                position is one of G, D, M, F. Set per_90 to True when the user asks for rates per match or per 90 minutes.
+
+            The obtain_similar_players takes the arguments player_name: str, tournament_name: Union[str, None], season_year: Union[int, None], k: Union[int, None], metric: Union[str, None], candidate_tournament_name: Union[str, None], candidate_season_year: Union[int, None], position: Union[str, None], min_age: Union[int, None], max_age: Union[int, None]
+                Use it when the user asks who plays like a player or who could replace a player. tournament_name and season_year select the season of that player.
+                The candidate_* arguments, position and the age band only apply to the similar players, e.g. "Who plays like Rodri in Serie A and is under 23?" -> player_name = "Rodri", candidate_tournament_name = "Serie A", max_age = 22
+                metric is "cosine" unless the user asks for players with similar output volumes, then it is "euclidean".
             
-            Remember to account for the previous messages in the state if there are any. If the previous messages already contains the data required to answer the latest human question, do not call any tool. 
+            Remember to account for the previous messages in the state if there are any. If the previous messages already contains the data required to answer the latest human question, do not call any tool. The data listed in a summary of the earlier conversation counts as already fetched. 
             
             """
 
@@ -132,11 +179,21 @@ ANALYZE_GAME_TOOL_CALLER_SYSTEM_MESSAGE = f"""
                             ]
                         )
 
-            Remember to account for the previous messages in the state if there are any. If the previous messages already contains the data required to answer the latest human question, do not call any tool. 
+            Remember to account for the previous messages in the state if there are any. If the previous messages already contains the data required to answer the latest human question, do not call any tool. The data listed in a summary of the earlier conversation counts as already fetched. 
             """
 
 ANSWER_GENERATOR_SYSTEM_MESSAGE = """
             You are an AI agent whose job is to generate an answer based on previous Tool and/or AI messages.
+            If a Tool message contains a "partial" entry, the tool ran out of time before all data was fetched. Answer with the data that is there and tell the user that the answer is based on incomplete data.
+            Season stats may carry "percentiles": the share of players with the same position in the same tournament season, among the players looked up so far, that the player matches or beats. Counting stats are compared per 90 minutes. Mention the sample size when you use them.
+            Tool results come as '|' separated tables with a header row. A stat that is missing from a table or a row was not recorded or was 0.
+            Older turns may be replaced by a summary of the earlier conversation. The tables it lists under fetched data are tool results like any other.
+            """
+
+SUMMARY_SYSTEM_MESSAGE = """
+            You summarize the earlier part of a conversation between a user and a football analysis assistant, so the assistant can continue it without those messages.
+            Keep the players, teams, tournaments and seasons that were asked about, what the user wanted to know and the conclusions the assistant gave, with the numbers it quoted.
+            Merge an earlier summary into the new one. Write at most a few short paragraphs and nothing else.
             """
 
 ROUTER_SYSTEM_MESSAGE = """
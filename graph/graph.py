@@ -1,15 +1,17 @@
 from tools.tools import SEASON_PERFORMANCE_TOOL, EVENT_PERFORMANCE_TOOL
-from graph.utils import count_tokens
+from graph.checkpointer import create_checkpointer
+from graph.memory import TokenLedger, COMPACTION_EXECUTOR, compaction_start, is_summary, stale_system_messages, summary_prompt, compaction_update
 from langchain_openai import ChatOpenAI
-from typing import Annotated, Any, Literal, Union, List
+import asyncio
+from typing import Annotated, Any, AsyncIterator, Iterator, Literal, Union, List
 from pydantic import BaseModel
 from langchain_core.messages import (AIMessage, AnyMessage, ToolCall, ToolMessage, SystemMessage, HumanMessage)
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import RemoveMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from config import OPENAI_API_KEY
 # Configuration defaults
 from graph.config import (
@@ -19,8 +21,20 @@ from graph.config import (
     ANSWER_GENERATOR_TEMPERATURE,
     ANALYZE_GAME_TOOL_CALLER_SYSTEM_MESSAGE,
     ANSWER_GENERATOR_SYSTEM_MESSAGE,
-    TOKEN_THRESHOLD
+    TOKEN_THRESHOLD,
+    LOCAL_ROUTER,
+    MEMORY_COMPACTION,
+    SUMMARY_MODEL_NAME,
+    COMPACTION_KEEP_TOKENS,
+    STREAMED_NODES,
+    TOOL_MEMO,
+    SPECULATIVE_TOOLS
 )
+from graph.router import LocalRouter, RouteDecision
+from graph.tool_memo import ToolMemo
+from graph.utils import replace_tool_call_parameters
+from graph.speculation import Speculation, SPECULATION_EXECUTOR, tool_calls_key
+from tools.helper.execution_cache import execution_cache, thread_execution_cache
 
 class Subgraph:
     def __init__(
@@ -51,6 +65,7 @@ class Subgraph:
         self.name = name
         self.tool_caller_llm = ChatOpenAI(model=tool_caller_model, temperature=tool_caller_temperature, api_key=OPENAI_API_KEY)
         self.answer_generator_llm = ChatOpenAI(model=answer_generator_model, temperature=answer_generator_temperature, api_key=OPENAI_API_KEY)
+        self.summary_llm = ChatOpenAI(model=SUMMARY_MODEL_NAME, temperature=0.0, api_key=OPENAI_API_KEY)
 
         # System messages
         self.tool_caller_system_message = tool_caller_system_message
@@ -69,7 +84,17 @@ class Subgraph:
 
         self.graph_builder = StateGraph(State)
 
-        self.memory = MemorySaver()
+        self.memory = create_checkpointer(name, on_evict=self.forget_thread)
+        self.token_ledger = TokenLedger()
+        # thread id -> the compaction started after the last answer of the thread
+        self.compactions = {}
+        # Threads already checked for stored system messages since the start
+        self.migrated_threads = set()
+        self.tool_memo = ToolMemo()
+        # thread id -> the proposed tool calls running while the user reviews them
+        self.speculations = {}
+        # thread id -> id of the tool call message the user reviewed, only its rerun reads the execution cache
+        self.reruns = {}
 
         # Nodes to interrupt before
         self.interrupt = interrupt
@@ -79,12 +104,20 @@ class Subgraph:
 
         self.graph = self.compile_graph()
 
+    def forget_thread(self, thread_id: str):
+        """Drop the per-thread state kept beside the checkpoints once the checkpointer evicts an idle thread."""
+        self.token_ledger.forget(thread_id)
+        self.tool_memo.forget(thread_id)
+        self.migrated_threads.discard(thread_id)
+        self.reruns.pop(thread_id, None)
+
     def _build_graph(self):
         """Builds the state graph with nodes and edges."""
         # Add nodes
-        self.graph_builder.add_node("tool_caller", self._tool_caller)
-        self.graph_builder.add_node("analyze_tools", self.analyze_tools_node)
-        self.graph_builder.add_node("answer_generator", self._answer_generator)
+        # Each node has an async twin so the graph can run on an event loop with astream
+        self.graph_builder.add_node("tool_caller", RunnableLambda(self._tool_caller, afunc=self._atool_caller))
+        self.graph_builder.add_node("analyze_tools", RunnableLambda(self._analyze_tools, afunc=self._aanalyze_tools))
+        self.graph_builder.add_node("answer_generator", RunnableLambda(self._answer_generator, afunc=self._aanswer_generator))
 
         # Add edges
         self.graph_builder.add_conditional_edges("tool_caller", self._tool_caller_edge_condition)
@@ -144,6 +177,17 @@ class Subgraph:
             return "analyze_tools"
         return "__end__"
 
+    def _tool_caller_prompt(self, messages: list) -> list:
+        """
+        The messages of the tool caller LLM, its system message before the last message. System messages are
+        added to the LLM input only, so they are never written to the checkpointed state.
+        """
+        return messages[:-1] + [SystemMessage(content=self.tool_caller_system_message)] + messages[-1:]
+
+    def _answer_generator_prompt(self, messages: list) -> list:
+        """The messages of the answer generator LLM, its system message last."""
+        return messages + [SystemMessage(content=self.answer_generator_system_message)]
+
     def _tool_caller(self, state: dict):
         """
         Node function to handle tool caller logic.
@@ -154,9 +198,7 @@ class Subgraph:
         Returns:
             dict: Updated state with messages.
         """
-        system_message = SystemMessage(content=self.tool_caller_system_message)
-        state["messages"].insert(-1, system_message)
-        response = self.llm_with_tools.invoke(state["messages"])
+        response = self.llm_with_tools.invoke(self._tool_caller_prompt(state["messages"]))
         return {"messages": [response]}
 
     def _answer_generator(self, state: dict):
@@ -169,9 +211,163 @@ class Subgraph:
         Returns:
             dict: Updated state with messages.
         """
-        system_message = SystemMessage(content=self.answer_generator_system_message)
-        state["messages"].append(system_message)
-        return {"messages": [self.answer_generator_llm.invoke(state["messages"])]}
+        return {"messages": [self.answer_generator_llm.invoke(self._answer_generator_prompt(state["messages"]))]}
+
+    async def _atool_caller(self, state: dict):
+        """Async counterpart of `_tool_caller`."""
+        response = await self.llm_with_tools.ainvoke(self._tool_caller_prompt(state["messages"]))
+        return {"messages": [response]}
+
+    async def _aanswer_generator(self, state: dict):
+        """Async counterpart of `_answer_generator`."""
+        return {"messages": [await self.answer_generator_llm.ainvoke(self._answer_generator_prompt(state["messages"]))]}
+
+    def _memo_split(self, message: AIMessage, config: RunnableConfig) -> tuple:
+        """The tool messages of the memoized tool calls of `message` and the message with only the calls left to run."""
+        if not TOOL_MEMO:
+            return [], message
+        thread_id = config["configurable"]["thread_id"]
+        memoized, remaining = [], []
+        for tool_call in message.tool_calls:
+            content = self.tool_memo.lookup(thread_id, tool_call)
+            if content is None:
+                remaining.append(tool_call)
+            else:
+                memoized.append(ToolMessage(content=content, name=tool_call["name"], tool_call_id=tool_call["id"]))
+        return memoized, AIMessage(content=message.content, tool_calls=remaining, id=message.id)
+
+    def _memo_merge(self, message: AIMessage, memoized: list, executed: list, config: RunnableConfig) -> dict:
+        """Memoize the executed results and return all tool messages in the order of the tool calls."""
+        thread_id = config["configurable"]["thread_id"]
+        tool_calls = {tool_call["id"]: tool_call for tool_call in message.tool_calls}
+        for tool_message in executed:
+            if TOOL_MEMO and tool_message.tool_call_id in tool_calls:
+                complete = (tool_message.artifact or {}).get("complete", True)
+                self.tool_memo.store(thread_id, tool_calls[tool_message.tool_call_id], tool_message.content, tool_message.status, complete)
+        order = {tool_call["id"]: index for index, tool_call in enumerate(message.tool_calls)}
+        return {"messages": sorted(memoized + executed, key=lambda tool_message: order.get(tool_message.tool_call_id, len(order)))}
+
+    def _analyze_tools(self, state: dict, config: RunnableConfig):
+        """
+        Node function running the tool calls of the last message. Calls made before in the thread, with the
+        same normalized arguments and a result that is still valid, get that result without running the tool.
+        The tools run with the execution cache of the thread, so a call the user edited only fetches what the edit changed.
+        """
+        message = state["messages"][-1]
+        memoized, remaining = self._memo_split(message, config)
+        executed = self._speculated(remaining, config) if remaining.tool_calls else []
+        if executed is None:
+            with execution_cache(self._execution_cache(message, config["configurable"]["thread_id"])):
+                executed = self.analyze_tools_node.invoke({"messages": [remaining]}, config)["messages"]
+        return self._memo_merge(message, memoized, executed, config)
+
+    async def _aanalyze_tools(self, state: dict, config: RunnableConfig):
+        """Async counterpart of `_analyze_tools`."""
+        message = state["messages"][-1]
+        memoized, remaining = self._memo_split(message, config)
+        executed = await self._aspeculated(remaining, config) if remaining.tool_calls else []
+        if executed is None:
+            with execution_cache(self._execution_cache(message, config["configurable"]["thread_id"])):
+                executed = (await self.analyze_tools_node.ainvoke({"messages": [remaining]}, config))["messages"]
+        return self._memo_merge(message, memoized, executed, config)
+
+    def _execution_cache(self, message: AIMessage, thread_id: str):
+        """
+        The execution cache of the thread for running `message`. Only the rerun of tool calls the user reviewed reads
+        the responses of their earlier run; any other run empties it, so the tool memo TTLs decide what is reused.
+        """
+        cache = thread_execution_cache(thread_id)
+        if self.reruns.pop(thread_id, None) != message.id:
+            cache.clear()
+        return cache
+
+    def _proposed_tool_calls(self, messages: list, config) -> AIMessage | None:
+        """The message with the tool calls the interrupted thread waits to run, without the memoized ones. None when nothing waits."""
+        if not messages or not isinstance(messages[-1], AIMessage) or not messages[-1].tool_calls:
+            return None
+        _, remaining = self._memo_split(messages[-1], config)
+        return remaining if remaining.tool_calls else None
+
+    def _speculate_tools(self, message: AIMessage, thread_id: str, speculation: Speculation) -> list:
+        with execution_cache(thread_execution_cache(thread_id), speculation.cancelled):
+            return self.analyze_tools_node.invoke({"messages": [message]}, {"configurable": {"thread_id": thread_id}})["messages"]
+
+    async def _aspeculate_tools(self, message: AIMessage, thread_id: str, speculation: Speculation) -> list:
+        with execution_cache(thread_execution_cache(thread_id), speculation.cancelled):
+            return (await self.analyze_tools_node.ainvoke({"messages": [message]}, {"configurable": {"thread_id": thread_id}}))["messages"]
+
+    def speculate(self, config):
+        """
+        Start the tool calls of the interrupted thread in the background while the user reviews their parameters.
+        Approving them unchanged picks up their results in `analyze_tools`, editing them cancels the run.
+        """
+        if not (SPECULATIVE_TOOLS and self.interrupt):
+            return
+        message = self._proposed_tool_calls(self.graph.get_state(config).values.get("messages"), config)
+        if message is None:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        self.discard_speculation(config)
+        speculation = Speculation(key=tool_calls_key(message.tool_calls))
+        # The speculative run is the first run of the tool calls, the approved or edited run reads what it fetched
+        self._execution_cache(message, thread_id)
+        self.reruns[thread_id] = message.id
+        speculation.pending = SPECULATION_EXECUTOR.submit(self._speculate_tools, message, thread_id, speculation)
+        self.speculations[thread_id] = speculation
+
+    async def aspeculate(self, config):
+        """Async counterpart of `speculate`, the tool calls run as a task on the event loop."""
+        if not (SPECULATIVE_TOOLS and self.interrupt):
+            return
+        message = self._proposed_tool_calls((await self.graph.aget_state(config)).values.get("messages"), config)
+        if message is None:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        self.discard_speculation(config)
+        speculation = Speculation(key=tool_calls_key(message.tool_calls))
+        # The speculative run is the first run of the tool calls, the approved or edited run reads what it fetched
+        self._execution_cache(message, thread_id)
+        self.reruns[thread_id] = message.id
+        speculation.pending = asyncio.ensure_future(self._aspeculate_tools(message, thread_id, speculation))
+        self.speculations[thread_id] = speculation
+
+    def discard_speculation(self, config, tool_calls: List[dict] | None = None):
+        """Cancel the speculative run of the thread unless it runs exactly `tool_calls`."""
+        thread_id = config["configurable"]["thread_id"]
+        speculation = self.speculations.get(thread_id)
+        if speculation is not None and (tool_calls is None or not speculation.matches(tool_calls)):
+            speculation.cancel()
+            self.speculations.pop(thread_id, None)
+            print(f"Cancelled the speculative tool calls of thread {thread_id}")
+
+    def _speculated(self, message: AIMessage, config) -> list | None:
+        """The tool messages of the speculative run of `message`, None when there is none for these tool calls."""
+        speculation = self.speculations.pop(config["configurable"]["thread_id"], None)
+        if speculation is None:
+            return None
+        if not speculation.matches(message.tool_calls) or isinstance(speculation.pending, asyncio.Future):
+            speculation.cancel()
+            return None
+        try:
+            return speculation.pending.result()
+        except Exception as e:
+            print(f"Error in speculative tool calls: {e}")
+            return None
+
+    async def _aspeculated(self, message: AIMessage, config) -> list | None:
+        """Async counterpart of `_speculated`."""
+        speculation = self.speculations.pop(config["configurable"]["thread_id"], None)
+        if speculation is None:
+            return None
+        pending = speculation.pending
+        if not speculation.matches(message.tool_calls) or (isinstance(pending, asyncio.Future) and pending.get_loop() is not asyncio.get_running_loop()):
+            speculation.cancel()
+            return None
+        try:
+            return await (pending if isinstance(pending, asyncio.Future) else asyncio.wrap_future(pending))
+        except Exception as e:
+            print(f"Error in speculative tool calls: {e}")
+            return None
 
     def compile_graph(self):
         """
@@ -192,46 +388,114 @@ class Subgraph:
             )
     
     def _get_messages_to_remove(self, config):
+        return self._messages_to_remove(config["configurable"]["thread_id"], self.graph.get_state(config).values.get("messages"))
+
+    async def _aget_messages_to_remove(self, config):
+        """Async counterpart of `_get_messages_to_remove`. The new messages are tokenized in a worker thread, off the event loop."""
+        messages = (await self.graph.aget_state(config)).values.get("messages")
+        return await asyncio.to_thread(self._messages_to_remove, config["configurable"]["thread_id"], messages)
+
+    def _messages_to_remove(self, thread_id: str, messages: list) -> list:
         threshold = TOKEN_THRESHOLD
-        snapshot = self.graph.get_state(config)
-        messages = snapshot.values.get("messages")
         if not messages:
             return []
-        total_content = ''
-        for msg in messages:
-            total_content += msg.content
-        token_count = count_tokens(total_content)
+        # Threads saved before the system messages left the state still hold a copy of them per turn
+        stale_prompts = []
+        if thread_id not in self.migrated_threads:
+            self.migrated_threads.add(thread_id)
+            stale_prompts = stale_system_messages(messages)
+            if stale_prompts:
+                stale_ids = {message.id for message in stale_prompts}
+                messages = [message for message in messages if message.id not in stale_ids]
+                print(f"Removing {len(stale_prompts)} stored system messages from thread {thread_id}")
+        # Only the messages added since the last turn are tokenized
+        token_count = self.token_ledger.sync(thread_id, messages)
         print("current total token: " + str(token_count))
 
+        removals = [RemoveMessage(id=message.id) for message in stale_prompts]
         if token_count <= threshold:
-            return []
-        
-        current_token_count = 0
-        messages_to_delete = []
+            return removals
 
-        # Iterate from the beginning to collect messages until the difference is covered
-        for msg in messages:
-            msg_token_count = count_tokens(msg.content)
-            current_token_count += msg_token_count
-            messages_to_delete.append(RemoveMessage(id=msg.id))
+        # Remove messages from the beginning until the total is under the threshold
+        return removals + self.token_ledger.trim(thread_id, messages, threshold)
+    
+    def _compaction_span(self, config, messages) -> list:
+        """The oldest turns of the thread a compaction replaces, empty when the thread is within `TOKEN_THRESHOLD`."""
+        thread_id = config["configurable"]["thread_id"]
+        if not messages or self.token_ledger.sync(thread_id, messages) <= TOKEN_THRESHOLD:
+            return []
+        counts = [tokens for _, tokens in self.token_ledger.threads[thread_id].entries]
+        span = messages[:compaction_start(messages, counts, COMPACTION_KEEP_TOKENS)]
+        if all(is_summary(msg) for msg in span):
+            return []
+        return span
 
-            # Check if the current token count exceeds the difference
-            if token_count - current_token_count <= threshold:
-                break
+    def compact_memory(self, config):
+        """
+        Replace the oldest turns of the thread with a summary message and a digest of their tool results.
+        If the summary fails, the turns stay and `_get_messages_to_remove` drops them at the next turn.
+        """
+        span = self._compaction_span(config, self.graph.get_state(config).values.get("messages"))
+        if not span:
+            return
+        try:
+            summary = self.summary_llm.invoke(summary_prompt(span)).content
+        except Exception as e:
+            print(f"Error summarizing memory: {e}")
+            return
+        self.graph.update_state(config, {"messages": compaction_update(span, summary)}, as_node="answer_generator")
+        print(f"Compacted {len(span)} messages into a summary")
+
+    async def acompact_memory(self, config):
+        """Async counterpart of `compact_memory`."""
+        span = await asyncio.to_thread(self._compaction_span, config, (await self.graph.aget_state(config)).values.get("messages"))
+        if not span:
+            return
+        try:
+            summary = (await self.summary_llm.ainvoke(summary_prompt(span))).content
+        except Exception as e:
+            print(f"Error summarizing memory: {e}")
+            return
+        await self.graph.aupdate_state(config, {"messages": compaction_update(span, summary)}, as_node="answer_generator")
+        print(f"Compacted {len(span)} messages into a summary")
+
+    def schedule_compaction(self, config):
+        """Start the compaction of the thread in the background once an answer is returned, so the answer is not kept waiting for it."""
+        if MEMORY_COMPACTION == "summary":
+            self.compactions[config["configurable"]["thread_id"]] = COMPACTION_EXECUTOR.submit(self.compact_memory, config)
+
+    def aschedule_compaction(self, config):
+        """Async counterpart of `schedule_compaction`, the compaction runs as a task on the event loop."""
+        if MEMORY_COMPACTION == "summary":
+            self.compactions[config["configurable"]["thread_id"]] = asyncio.ensure_future(self.acompact_memory(config))
+
+    def wait_for_compaction(self, config):
+        """Let the compaction of the previous answer finish before a new turn changes the thread."""
+        pending = self.compactions.pop(config["configurable"]["thread_id"], None)
+        if pending is not None and not isinstance(pending, asyncio.Future):
+            pending.result()
+
+    async def await_compaction(self, config):
+        """Async counterpart of `wait_for_compaction`."""
+        pending = self.compactions.pop(config["configurable"]["thread_id"], None)
+        if pending is not None:
+            await (pending if isinstance(pending, asyncio.Future) else asyncio.wrap_future(pending))
 
-        return messages_to_delete
-    
     def check_for_feedback(self, config, app_state):
-        snapshot = self.graph.get_state(config)
-        existing_message = snapshot.values["messages"][-1]
+        return self._feedback_prompt(self.graph.get_state(config).values["messages"][-1], app_state)
+
+    async def acheck_for_feedback(self, config, app_state):
+        """Async counterpart of `check_for_feedback`."""
+        return self._feedback_prompt((await self.graph.aget_state(config)).values["messages"][-1], app_state)
 
+    def _feedback_prompt(self, existing_message, app_state):
         if existing_message.tool_calls:
             new_tool_call = existing_message.tool_calls[0].copy()
             warning_message = f"""
             WARNING: System message:
             Software will use the following parameters to retrieve relevant data:
             
-            {new_tool_call['args']['parameters']}
+            {new_tool_call['args'].get('parameters', new_tool_call['args'])}
             
             If you want to change these parameters, respond with the desired values in the structure of the dictionary.
             If not, leave the input blank and continue.
@@ -246,69 +510,89 @@ class Subgraph:
 
     def update_tool_message(self, tool_call_feedback, app_state):
         config = app_state.config
-        snapshot = self.graph.get_state(config)
-        existing_message = snapshot.values["messages"][-1]        
-        
+        for values, as_node in self._tool_message_updates(self.graph.get_state(config).values["messages"], tool_call_feedback, config):
+            self.graph.update_state(config, values, as_node=as_node)
+        return app_state
+
+    async def aupdate_tool_message(self, tool_call_feedback, app_state):
+        """Async counterpart of `update_tool_message`."""
+        config = app_state.config
+        for values, as_node in self._tool_message_updates((await self.graph.aget_state(config)).values["messages"], tool_call_feedback, config):
+            await self.graph.aupdate_state(config, values, as_node=as_node)
+        return app_state
+
+    def _tool_message_updates(self, messages: list, tool_call_feedback, config) -> List[tuple]:
+        """The (values, as_node) state updates that apply the user's feedback on the tool call of the thread."""
+        existing_message = messages[-1]
+
         if isinstance(existing_message, AIMessage):
             if tool_call_feedback == {}:
-                for msg in snapshot.values['messages'][::-1]:
-                    if isinstance(msg, SystemMessage):
-                        last_system_message = msg
-                        break
-                delete_msgs = [RemoveMessage(id=existing_message.id), RemoveMessage(id=last_system_message.id)]
-                self.graph.update_state(config=config, values={"messages": delete_msgs}, as_node='analyze_tools')
-                return app_state
+                self.discard_speculation(config, [])
+                delete_msgs = [RemoveMessage(id=existing_message.id)]
+                return [({"messages": delete_msgs}, 'analyze_tools')]
             else:
-                new_tool_call = existing_message.tool_calls[0].copy()
-                new_tool_call['args']['parameters'] = [tool_call_feedback]
+                new_tool_call = replace_tool_call_parameters(existing_message.tool_calls[0], tool_call_feedback)
+                self.discard_speculation(config, [new_tool_call])
+                self.reruns[config["configurable"]["thread_id"]] = existing_message.id
                 new_message = AIMessage(
                     content=existing_message.content,
                     tool_calls=[new_tool_call],
                     # Important! The ID is how LangGraph knows to REPLACE the message in the state rather than APPEND this messages
                     id=existing_message.id,
                 )
-                self.graph.update_state(config, {"messages": [new_message]})
-                app_state.config = config
-                return app_state
+                return [({"messages": [new_message]}, None)]
         elif isinstance(existing_message, ToolMessage):
-            previous_message = snapshot.values["messages"][-2]
-            self.graph.update_state(config, {"messages": RemoveMessage(id=existing_message.id)})
-            new_tool_call = previous_message.tool_calls[0].copy()
-            new_tool_call['args']['parameters'] = [tool_call_feedback]
+            previous_message = messages[-2]
+            new_tool_call = replace_tool_call_parameters(previous_message.tool_calls[0], tool_call_feedback)
+            self.reruns[config["configurable"]["thread_id"]] = previous_message.id
             new_message = AIMessage(
                 content=previous_message.content,
                 tool_calls=[new_tool_call],
                 # Important! The ID is how LangGraph knows to REPLACE the message in the state rather than APPEND this messages
                 id=previous_message.id,
             )
-            self.graph.update_state(config, {"messages": [new_message]})
-            app_state.config = config
-            return app_state
+            return [({"messages": RemoveMessage(id=existing_message.id)}, None), ({"messages": [new_message]}, None)]
+        return []
     
-    def stream_graph_updates(self, user_input: str, config: dict):
-        #state["messages"].append(("user", user_input))
-        if user_input:
-            stream_input = {"messages": [("user", user_input)]}
-        else:
-            stream_input = None
-
-        snapshot = self.graph.get_state(config)
-        
+    def stream_answer(self, user_input: str | None, config: dict) -> Iterator[str]:
+        """
+        Run the graph from `user_input`, or on from the interrupt when it is None, and yield the answer as
+        the LLM writes it. A tool error is yielded as one piece and ends the stream.
+        """
+        stream_input = {"messages": [("user", user_input)]} if user_input else None
+        for message, metadata in self.graph.stream(input=stream_input, config=config, stream_mode="messages"):
+            if isinstance(message, AIMessage) and message.content and metadata.get("langgraph_node") in STREAMED_NODES:
+                yield message.content
+            elif isinstance(message, ToolMessage) and '[Tool Error]' in message.content:
+                yield message.content
+                return
+
+    async def astream_answer(self, user_input: str | None, config: dict) -> AsyncIterator[str]:
+        """
+        Async counterpart of `stream_answer`. The tool calls run their async implementations,
+        so a slow fetch never blocks the event loop the app serves other sessions on.
+        """
+        stream_input = {"messages": [("user", user_input)]} if user_input else None
+        async for message, metadata in self.graph.astream(input=stream_input, config=config, stream_mode="messages"):
+            if isinstance(message, AIMessage) and message.content and metadata.get("langgraph_node") in STREAMED_NODES:
+                yield message.content
+            elif isinstance(message, ToolMessage) and '[Tool Error]' in message.content:
+                yield message.content
+                return
 
-        events = self.graph.stream(
-            input=stream_input, config=config, stream_mode="values"
-        )
-
-        for event in events:
-            for messages in event.values():
-                last_message = messages[-1]
-                if isinstance(last_message, AIMessage):
-                    if last_message.content != '':
-                        print("Assistant: ", last_message.content)
-                        return last_message.content
-                elif isinstance(last_message, ToolMessage):
-                    if '[Tool Error]' in last_message.content:
-                        return last_message.content
+    def stream_graph_updates(self, user_input: str, config: dict):
+        """The whole answer of `stream_answer`, None when the graph stopped at an interrupt before answering."""
+        response = "".join(self.stream_answer(user_input, config))
+        if response:
+            print("Assistant: ", response)
+        return response or None
+
+    async def astream_graph_updates(self, user_input: str, config: dict):
+        """Async counterpart of `stream_graph_updates`."""
+        response = "".join([chunk async for chunk in self.astream_answer(user_input, config)])
+        if response:
+            print("Assistant: ", response)
+        return response or None
     
 class MainGraph:
     def __init__(
@@ -328,10 +612,28 @@ class MainGraph:
         self.subgraphs = subgraphs
         self.router_llm = ChatOpenAI(model=router_model_name, temperature=0.0, api_key=OPENAI_API_KEY)
         self.router_system_message = router_system_message
+        self.local_router = LocalRouter.from_prompts() if LOCAL_ROUTER else None
+
+    def _local_route(self, user_input: str) -> Subgraph | None:
+        """The subgraph the local router is confident about, None when the router LLM has to decide."""
+        if self.local_router is None:
+            return None
+        decision = self.local_router.route(user_input)
+        for subgraph in self.subgraphs:
+            if subgraph.name == decision.label:
+                self.local_router.record(decision)
+                return subgraph
+        return None
+
+    def _llm_routed(self, subgraph: Subgraph) -> Subgraph:
+        if self.local_router is not None:
+            self.local_router.record(RouteDecision(subgraph.name, "llm"))
+        return subgraph
 
     def _route_message(self, user_input: str) -> Subgraph:
         """
-        Use the router LLM to decide which subgraph to use based on user input.
+        Decide which subgraph to use based on user input. The local router answers first, the router LLM
+        only gets the messages it is not sure about.
 
         Args:
             user_input (str): The user's input message.
@@ -339,6 +641,10 @@ class MainGraph:
         Returns:
             Subgraph: The selected subgraph for processing.
         """
+        subgraph = self._local_route(user_input)
+        if subgraph is not None:
+            return subgraph
+
         system_message = SystemMessage(content=self.router_system_message)
         messages = [system_message, ("user", user_input)]
         response = self.router_llm.invoke(messages)
@@ -346,40 +652,106 @@ class MainGraph:
         # Match the response to a subgraph
         for subgraph in self.subgraphs:
             if subgraph.name.lower() in response.content.lower():
-                return subgraph
+                return self._llm_routed(subgraph)
 
         raise ValueError("Unable to route message to a subgraph. Check router logic or messages.")
 
-    def process_message(self, user_input: str, config: dict, app_state):
+    async def _aroute_message(self, user_input: str) -> Subgraph:
+        """Async counterpart of `_route_message`."""
+        subgraph = self._local_route(user_input)
+        if subgraph is not None:
+            return subgraph
+
+        system_message = SystemMessage(content=self.router_system_message)
+        messages = [system_message, ("user", user_input)]
+        response = await self.router_llm.ainvoke(messages)
+
+        for subgraph in self.subgraphs:
+            if subgraph.name.lower() in response.content.lower():
+                return self._llm_routed(subgraph)
+
+        raise ValueError("Unable to route message to a subgraph. Check router logic or messages.")
+
+    def stream_message(self, user_input: str, config: dict, app_state) -> Iterator[str]:
         """
-        Process the user's message by routing it to the appropriate subgraph.
-        
+        Process the user's message by routing it to the appropriate subgraph, yielding the answer as it is written.
+
         Args:
             user_input (str): The user's input message.
             config (dict): Configuration dictionary for the graph.
-            state (dict): Gradio state dictionary for feedback handling.
+            app_state: Gradio or terminal state for feedback handling.
 
-        Returns:
-            str: The AI's response or feedback prompt.
+        Yields:
+            str: Pieces of the AI's response, or the feedback prompt in one piece.
         """
         # Route the message to the correct subgraph
         selected_subgraph = self._route_message(user_input)
+        selected_subgraph.wait_for_compaction(config)
+        for subgraph in self.subgraphs:
+            subgraph.discard_speculation(config)
         
         remove_old_msgs = selected_subgraph._get_messages_to_remove(config=config)
         if remove_old_msgs:
             selected_subgraph.graph.update_state(config, {'messages': remove_old_msgs})
 
-
-        # Process the input through the selected subgraph
-        response = selected_subgraph.stream_graph_updates(user_input=user_input, config=config)
+        # Process the input through the selected subgraph, it stops before the tool call when it interrupts
+        yield from selected_subgraph.stream_answer(user_input=user_input, config=config)
 
         # Check for feedback from the user
         app_state, feedback_message = selected_subgraph.check_for_feedback(config, app_state)
         if feedback_message:
             app_state.selected_subgraph = selected_subgraph
-            return feedback_message  # Return warning to display in the UI with a bool True indicating response is Feedback
+            # The tool calls start fetching while the user reviews them
+            selected_subgraph.speculate(config)
+            yield feedback_message  # Warning to display in the UI, app_state.feedback_pending tells it apart from an answer
+            return
         # Stream the updated response
-        response = selected_subgraph.stream_graph_updates(user_input=None, config=config)
+        yield from selected_subgraph.stream_answer(user_input=None, config=config)
+        selected_subgraph.schedule_compaction(config)
+
+    async def astream_message(self, user_input: str, config: dict, app_state) -> AsyncIterator[str]:
+        """
+        Async counterpart of `stream_message`.
+        """
+        selected_subgraph = await self._aroute_message(user_input)
+        await selected_subgraph.await_compaction(config)
+        for subgraph in self.subgraphs:
+            subgraph.discard_speculation(config)
+
+        remove_old_msgs = await selected_subgraph._aget_messages_to_remove(config=config)
+        if remove_old_msgs:
+            await selected_subgraph.graph.aupdate_state(config, {'messages': remove_old_msgs})
 
+        async for chunk in selected_subgraph.astream_answer(user_input=user_input, config=config):
+            yield chunk
+
+        app_state, feedback_message = await selected_subgraph.acheck_for_feedback(config, app_state)
+        if feedback_message:
+            app_state.selected_subgraph = selected_subgraph
+            await selected_subgraph.aspeculate(config)
+            yield feedback_message
+            return
+
+        async for chunk in selected_subgraph.astream_answer(user_input=None, config=config):
+            yield chunk
+        selected_subgraph.aschedule_compaction(config)
+
+    def process_message(self, user_input: str, config: dict, app_state):
+        """
+        Process the user's message by routing it to the appropriate subgraph.
         
-        return response
\ No newline at end of file
+        Args:
+            user_input (str): The user's input message.
+            config (dict): Configuration dictionary for the graph.
+            state (dict): Gradio state dictionary for feedback handling.
+
+        Returns:
+            str: The AI's response or feedback prompt.
+        """
+        return "".join(self.stream_message(user_input, config, app_state))
+
+    async def aprocess_message(self, user_input: str, config: dict, app_state):
+        """
+        Async counterpart of `process_message`.
+        """
+        return "".join([chunk async for chunk in self.astream_message(user_input, config, app_state)])
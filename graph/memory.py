@@ -0,0 +1,161 @@
+from typing import Dict, List, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+from langchain_core.messages import AnyMessage, AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from graph.utils import count_tokens
+from graph.config import SUMMARY_SYSTEM_MESSAGE, DIGEST_MAX_LINES_PER_RESULT, DIGEST_MAX_LINES
+
+
+# Name of the system message that stands in for the compacted turns
+SUMMARY_NAME = "memory_summary"
+# Compactions of the sync app run here, after the answer was returned
+COMPACTION_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-compaction")
+
+
+def message_key(message: AnyMessage) -> str:
+    """The id of a message. Messages that never went through the reducer have none, their content stands in."""
+    return message.id or f"{message.type}:{hash(str(message.content))}"
+
+
+class ThreadLedger:
+    """The (message key, token count) pairs of one thread in state order, with their total."""
+    def __init__(self):
+        self.entries: deque[Tuple[str, int]] = deque()
+        self.total = 0
+
+
+class TokenLedger:
+    """
+    Token counts of the messages of every thread, cached by message id.
+
+    `sync` is called with the messages of a thread on every turn. When the known messages are still the start
+    of the list, only the new ones at the end are tokenized. When messages were removed or replaced, e.g. by a
+    tool call edit, the list is rebuilt from the cached counts and again only unknown messages are tokenized.
+    """
+    def __init__(self):
+        self.threads: Dict[str, ThreadLedger] = {}
+        self.counts: Dict[str, int] = {}
+
+    def count(self, message: AnyMessage) -> int:
+        key = message_key(message)
+        if key not in self.counts:
+            self.counts[key] = count_tokens(str(message.content))
+        return self.counts[key]
+
+    def sync(self, thread_id: str, messages: List[AnyMessage]) -> int:
+        """Bring the ledger of a thread up to date with its messages and return their total token count."""
+        ledger = self.threads.setdefault(thread_id, ThreadLedger())
+        known = len(ledger.entries)
+        unchanged = known <= len(messages) and (
+            known == 0 or (message_key(messages[0]) == ledger.entries[0][0] and message_key(messages[known - 1]) == ledger.entries[-1][0])
+        )
+        if not unchanged:
+            ledger.entries.clear()
+            ledger.total = 0
+            known = 0
+        for message in messages[known:]:
+            tokens = self.count(message)
+            ledger.entries.append((message_key(message), tokens))
+            ledger.total += tokens
+        return ledger.total
+
+    def trim(self, thread_id: str, messages: List[AnyMessage], threshold: int) -> List[RemoveMessage]:
+        """
+        Remove messages from the start of the thread until its total is at most `threshold`.
+        Costs one step per removed message.
+        """
+        ledger = self.threads[thread_id]
+        removals = []
+        for message in messages:
+            if ledger.total <= threshold:
+                break
+            _, tokens = ledger.entries.popleft()
+            ledger.total -= tokens
+            self.counts.pop(message_key(message), None)
+            removals.append(RemoveMessage(id=message.id))
+        return removals
+
+    def forget(self, thread_id: str):
+        for key, _ in self.threads.pop(thread_id, ThreadLedger()).entries:
+            self.counts.pop(key, None)
+
+
+def is_summary(message: AnyMessage) -> bool:
+    return isinstance(message, SystemMessage) and message.name == SUMMARY_NAME
+
+def stale_system_messages(messages: List[AnyMessage]) -> List[AnyMessage]:
+    """The system messages the nodes used to write to the state on every turn. The summary message stays."""
+    return [message for message in messages if isinstance(message, SystemMessage) and message.id and not is_summary(message)]
+
+def compaction_start(messages: List[AnyMessage], counts: List[int], keep_tokens: int) -> int:
+    """
+    Index of the first message kept by a compaction. Whole turns are kept from the latest on while they fit
+    `keep_tokens`, so a tool call is never separated from its result. The latest turn is always kept.
+    """
+    human_positions = [index for index, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    if not human_positions:
+        return 0
+    start = human_positions[-1]
+    kept = sum(counts[start:])
+    for index in reversed(human_positions[:-1]):
+        kept += sum(counts[index:start])
+        if kept > keep_tokens:
+            break
+        start = index
+    return start
+
+def tool_digest(span: List[AnyMessage]) -> List[str]:
+    """The tool results of the compacted turns, one section per result headed by the tool call, oldest first."""
+    sections = []
+    for message in span:
+        if is_summary(message):
+            sections.extend(message.additional_kwargs.get("digest", []))
+    tool_calls = {call["id"]: call for message in span if isinstance(message, AIMessage) for call in message.tool_calls}
+    for message in span:
+        if not isinstance(message, ToolMessage) or "[Tool Error]" in str(message.content):
+            continue
+        call = tool_calls.get(message.tool_call_id, {})
+        lines = str(message.content).splitlines()
+        if len(lines) > DIGEST_MAX_LINES_PER_RESULT:
+            lines = lines[:DIGEST_MAX_LINES_PER_RESULT] + [f"... {len(lines) - DIGEST_MAX_LINES_PER_RESULT} more rows not kept"]
+        header = f"### {call.get('name', message.name)} {json.dumps(call.get('args', {}), ensure_ascii=False, default=str)}"
+        sections.append("\n".join([header] + lines))
+
+    # The newest sections are kept when the digest outgrows its budget
+    kept, line_count = [], 0
+    for section in reversed(sections):
+        line_count += section.count("\n") + 1
+        if line_count > DIGEST_MAX_LINES:
+            break
+        kept.append(section)
+    return kept[::-1]
+
+def summary_prompt(span: List[AnyMessage]) -> List[AnyMessage]:
+    """The dialogue of the compacted turns for the summary model. Tool results go to the digest instead."""
+    lines = []
+    for message in span:
+        if is_summary(message):
+            lines.append(f"Earlier summary: {message.additional_kwargs.get('summary', '')}")
+        elif isinstance(message, HumanMessage):
+            lines.append(f"User: {message.content}")
+        elif isinstance(message, AIMessage) and message.content:
+            lines.append(f"Assistant: {message.content}")
+    return [SystemMessage(content=SUMMARY_SYSTEM_MESSAGE), HumanMessage(content="\n".join(lines))]
+
+def compaction_update(span: List[AnyMessage], summary: str) -> List[AnyMessage]:
+    """
+    The state update that replaces the compacted turns with one summary message. The summary takes the id of
+    the last compacted message, so `add_messages` puts it in that place, before the kept turns.
+    """
+    digest = tool_digest(span)
+    content = f"Summary of the earlier conversation:\n{summary}"
+    if digest:
+        content += "\n\nData fetched earlier (tool results, use them instead of calling the tool again):\n" + "\n".join(digest)
+    summary_message = SystemMessage(
+        content=content,
+        name=SUMMARY_NAME,
+        id=span[-1].id,
+        additional_kwargs={"summary": summary, "digest": digest},
+    )
+    return [RemoveMessage(id=message.id) for message in span[:-1]] + [summary_message]
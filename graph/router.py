@@ -0,0 +1,196 @@
+from typing import Dict, Iterable, List, Tuple
+from collections import Counter
+from dataclasses import dataclass
+import json
+import os
+import re
+import numpy as np
+from config import logger
+from graph.config import ROUTER_TRAINING_PROMPTS, ROUTER_PROMPT_LABELS, ROUTER_MIN_SIMILARITY, ROUTER_MIN_MARGIN
+from tools.helper.season_stats import season_stats_snapshot
+from tools.helper.season_ratings import season_ratings_snapshot
+from tools.helper.team_strength import TEAM_STRENGTH
+
+
+GAME_KEYWORDS = {"game", "games", "match", "matches", "happened", "scored", "lineup", "lineups", "result", "derby", "fixture"}
+PLAYER_KEYWORDS = {"perform", "performed", "performance", "stats", "statistics", "rating", "ratings", "season", "compare", "similar", "career", "assists", "scorers", "top", "leaderboard"}
+# Placeholders the names are replaced with, so the model learns the sentence and not the names in it
+ENTITY_TOKENS = {"player": "__player__", "team": "__team__", "tournament": "__tournament__"}
+# Tool call arguments of the training prompts that hold names
+_NAME_ARGUMENTS = {"player_name": "player", "player_team_name": "team", "opponent_team_name": "team",
+                   "home_team_name": "team", "away_team_name": "team", "tournament_name": "tournament"}
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.casefold())
+
+def features(tokens: List[str]) -> List[str]:
+    """Unigrams and bigrams."""
+    return tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+
+
+@dataclass
+class RouteDecision:
+    label: str | None
+    source: str
+    similarity: float = 0.0
+    margin: float = 0.0
+
+
+class NameIndex:
+    """
+    Player, team and tournament names as token tuples, matched greedily from the longest name on.
+    The last name of a player is an alias too, unless another name already uses that token.
+    """
+    def __init__(self):
+        self.names: Dict[Tuple[str, ...], str] = {}
+        self.longest = 1
+
+    def add(self, name: str | None, kind: str):
+        tokens = tuple(tokenize(name or ""))
+        if not tokens:
+            return
+        self.names.setdefault(tokens, kind)
+        self.longest = max(self.longest, len(tokens))
+        if kind == "player" and len(tokens) > 1 and len(tokens[-1]) > 3:
+            self.names.setdefault(tokens[-1:], kind)
+
+    def replace(self, tokens: List[str]) -> Tuple[List[str], Counter]:
+        """The tokens with every known name replaced by its `ENTITY_TOKENS` placeholder, and the count of every kind."""
+        replaced, kinds = [], Counter()
+        position = 0
+        while position < len(tokens):
+            for length in range(min(self.longest, len(tokens) - position), 0, -1):
+                kind = self.names.get(tuple(tokens[position:position + length]))
+                if kind:
+                    replaced.append(ENTITY_TOKENS[kind])
+                    kinds[kind] += 1
+                    position += length
+                    break
+            else:
+                replaced.append(tokens[position])
+                position += 1
+        return replaced, kinds
+
+
+class NearestCentroid:
+    """TF-IDF vectors of the training prompts averaged per label, a message goes to the label of the closest centroid."""
+    def __init__(self, documents: List[List[str]], labels: List[str]):
+        self.vocabulary = {feature: index for index, feature in enumerate(sorted({feature for document in documents for feature in document}))}
+        document_frequency = np.zeros(len(self.vocabulary))
+        for document in documents:
+            document_frequency[[self.vocabulary[feature] for feature in set(document)]] += 1
+        self.idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+
+        matrix = np.stack([self.vector(document) for document in documents])
+        self.labels = sorted(set(labels))
+        centroids = np.stack([matrix[np.array(labels) == label].mean(axis=0) for label in self.labels])
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    def vector(self, document: List[str]) -> np.ndarray:
+        """Unknown features are dropped."""
+        vector = np.zeros(len(self.vocabulary))
+        for feature, count in Counter(document).items():
+            index = self.vocabulary.get(feature)
+            if index is not None:
+                vector[index] = count * self.idf[index]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def predict(self, document: List[str]) -> Tuple[str, float, float]:
+        """(label, cosine similarity to its centroid, margin over the second closest centroid)"""
+        similarities = self.centroids @ self.vector(document)
+        order = np.argsort(similarities)[::-1]
+        margin = similarities[order[0]] - similarities[order[1]] if len(order) > 1 else similarities[order[0]]
+        return self.labels[order[0]], float(similarities[order[0]]), float(margin)
+
+
+class LocalRouter:
+    """
+    The fast tier of `MainGraph` routing. Keyword and entity rules vote and the nearest centroid model checks
+    the vote: a message is routed locally only when the rules and a confident model agree. Everything else,
+    including every general question (the model knows "normal-graph" from its training prompts, the rules
+    never vote for it), gets `label` None and goes to the router LLM.
+
+    Names come from the tool calls of the training prompts, the teams of the `dim_events` history the
+    team strength model has read, and the season caches, which grow with every player looked up.
+    """
+    def __init__(self, examples: List[Tuple[str, str, List[Tuple[str, str]]]]):
+        self.names = NameIndex()
+        for _, _, names in examples:
+            for name, kind in names:
+                self.names.add(name, kind)
+        # ("team", team id) and (cache position, cache key) of the entries whose names were added. The season caches
+        # are LRU-bounded, once full their size stays the same while new players replace old ones.
+        self._indexed_keys = set()
+        documents = [features(self.names.replace(tokenize(prompt))[0]) for prompt, _, _ in examples]
+        self.model = NearestCentroid(documents, [label for _, label, _ in examples])
+        self.decisions = Counter()
+
+    @classmethod
+    def from_prompts(cls, directory: str = ROUTER_TRAINING_PROMPTS, prompt_labels: Dict[str, str] = ROUTER_PROMPT_LABELS) -> "LocalRouter":
+        """Train on the `<name>_prompts.json` files of `directory` whose name is a key of `prompt_labels`."""
+        examples = []
+        for name, label in prompt_labels.items():
+            with open(os.path.join(directory, f"{name}_prompts.json"), encoding="utf-8") as file:
+                prompts = json.load(file)
+            for item in prompts.values():
+                names = [
+                    (value, _NAME_ARGUMENTS[key])
+                    for tool_call in item.get("tool_calls", [])
+                    for args in [tool_call["args"]] + tool_call["args"].get("parameters", [])
+                    for key, value in args.items() if key in _NAME_ARGUMENTS and isinstance(value, str)
+                ]
+                examples.append((item["prompt"], label, names))
+        return cls(examples)
+
+    def refresh_names(self, caches: Iterable[dict] | None = None, team_names: Dict[int, str] = TEAM_STRENGTH.team_names):
+        """Add the known team names and the player and tournament names of the cached seasons that were not added before."""
+        # Snapshots, the fetch pool threads of other sessions keep writing the season caches
+        caches = list(caches) if caches is not None else [season_stats_snapshot(), season_ratings_snapshot()]
+        for team_id, name in list(team_names.items()):
+            if ("team", team_id) not in self._indexed_keys:
+                self._indexed_keys.add(("team", team_id))
+                self.names.add(name, "team")
+        for position, cache in enumerate(caches):
+            for key, entry in cache.items():
+                if (position, key) in self._indexed_keys:
+                    continue
+                self._indexed_keys.add((position, key))
+                self.names.add(entry.player_name, "player")
+                self.names.add(entry.tournament_name, "tournament")
+
+    @staticmethod
+    def rule_label(tokens: List[str], kinds: Counter) -> str | None:
+        """A named player makes it a player question, two teams or a team and a game word make it a game question."""
+        game_words = sum(token in GAME_KEYWORDS for token in tokens)
+        player_words = sum(token in PLAYER_KEYWORDS for token in tokens)
+        if kinds["player"]:
+            return "analyze-player"
+        if kinds["team"] >= 2 or (kinds["team"] and game_words):
+            return "analyze-game"
+        if game_words and not player_words:
+            return "analyze-game"
+        if player_words and not game_words:
+            return "analyze-player"
+        return None
+
+    def route(self, user_input: str) -> RouteDecision:
+        self.refresh_names()
+        tokens, kinds = self.names.replace(tokenize(user_input))
+        rule = self.rule_label(tokens, kinds)
+        label, similarity, margin = self.model.predict(features(tokens))
+        confident = similarity >= ROUTER_MIN_SIMILARITY and margin >= ROUTER_MIN_MARGIN
+
+        if rule is not None and rule == label and confident:
+            return RouteDecision(rule, "local", similarity, margin)
+        return RouteDecision(None, "uncertain", similarity, margin)
+
+    def record(self, decision: RouteDecision):
+        """Count the decision and log it with the share of messages that needed the LLM so far."""
+        self.decisions[decision.source] += 1
+        total = sum(self.decisions.values())
+        logger.info(
+            f"Router: {decision.label} by {decision.source} (similarity {decision.similarity:.2f}, margin {decision.margin:.2f}), "
+            f"LLM fallback rate {self.decisions['llm'] / total:.0%} of {total} messages"
+        )
@@ -0,0 +1,39 @@
+from typing import List
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+import asyncio
+import threading
+from graph.config import SPECULATION_WORKERS
+from graph.tool_memo import memo_key
+
+
+# Speculative tool calls of the sync app run here, while the user reviews the parameters
+SPECULATION_EXECUTOR = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix="tool-speculation")
+
+
+def tool_calls_key(tool_calls: List[dict]) -> tuple:
+    return tuple(memo_key(tool_call) for tool_call in tool_calls)
+
+@dataclass
+class Speculation:
+    """
+    The tool calls an interrupted thread proposes, running before the user approved them. `pending` resolves
+    to their tool messages. The requests it sent stay in the execution cache of the thread, so a run with
+    edited parameters reuses the ones the edit did not change.
+    """
+    key: tuple
+    pending: Future | asyncio.Future = None
+    cancelled: threading.Event = field(default_factory=threading.Event)
+
+    def matches(self, tool_calls: List[dict]) -> bool:
+        return self.key == tool_calls_key(tool_calls)
+
+    def cancel(self):
+        """
+        Stop sending requests. The requests in flight still finish into the execution cache, where the run
+        with the edited parameters waits for the ones it shares instead of sending them again.
+        """
+        self.cancelled.set()
+        if isinstance(self.pending, Future):
+            # Only a run that has not started yet is dropped
+            self.pending.cancel()
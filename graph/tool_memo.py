@@ -0,0 +1,109 @@
+from typing import Any, Dict, List, Tuple
+from collections import OrderedDict
+from datetime import date
+import json
+import time
+from config import logger
+from tools.helper.season_archive import season_finished
+from graph.config import (
+    TOOL_MEMO_TTL_FINAL,
+    TOOL_MEMO_TTL_RECENT,
+    TOOL_MEMO_TTL_LIVE,
+    TOOL_MEMO_TTL_DEFAULT,
+    TOOL_MEMO_TTLS,
+    TOOL_MEMO_MAX_PER_THREAD
+)
+
+
+def normalize_args(value: Any) -> Any:
+    """Strings stripped and casefolded and dictionary keys sorted, so the same question asked twice gets the same key. List order is kept."""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {key: normalize_args(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        return [normalize_args(item) for item in value]
+    return value
+
+def memo_key(tool_call: dict) -> str:
+    return f"{tool_call['name']}:{json.dumps(normalize_args(tool_call['args']), ensure_ascii=False, default=str)}"
+
+def event_dates_ttl(parameters: List[dict], today: date) -> float:
+    """Matches of past days are final, today's may still be played and the latest `last_k` matches change with the next one."""
+    ttl = TOOL_MEMO_TTL_FINAL
+    for params in parameters:
+        event_dates = params.get("event_date")
+        if not event_dates:
+            return TOOL_MEMO_TTL_RECENT
+        for event_date in event_dates if isinstance(event_dates, list) else [event_dates]:
+            try:
+                day = date.fromisoformat(str(event_date))
+            except ValueError:
+                return TOOL_MEMO_TTL_RECENT
+            if day >= today:
+                ttl = min(ttl, TOOL_MEMO_TTL_LIVE)
+    return ttl
+
+def seasons_ttl(parameters: List[dict]) -> float:
+    """Finished seasons are final, the current season or all seasons of a player change with every match day."""
+    if all(season_finished(params.get("season_year")) for params in parameters):
+        return TOOL_MEMO_TTL_FINAL
+    return TOOL_MEMO_TTL_RECENT
+
+def result_ttl(tool_call: dict, today: date | None = None) -> float:
+    """Seconds the result of a tool call stays valid, following how final its data is. 0 is never memoized."""
+    name, args = tool_call["name"], tool_call["args"]
+    if name in TOOL_MEMO_TTLS:
+        return TOOL_MEMO_TTLS[name]
+    parameters = args.get("parameters", [args])
+    if name in ("obtain_event_performance_data", "obtain_summary_of_event"):
+        return event_dates_ttl(parameters, today or date.today())
+    if name == "obtain_season_performance_data":
+        return seasons_ttl(parameters)
+    return TOOL_MEMO_TTL_DEFAULT
+
+
+class ToolMemo:
+    """
+    Tool message contents per thread, keyed by the tool name and its normalized arguments. A follow-up question
+    that leads to the same tool call gets the earlier result back instead of a new fetch. Error results and
+    incomplete ones, with an error dictionary or a partial marker, are not kept, the next call fetches them again.
+    Each thread keeps its `TOOL_MEMO_MAX_PER_THREAD` latest results.
+    """
+    def __init__(self, max_per_thread: int = TOOL_MEMO_MAX_PER_THREAD):
+        self.max_per_thread = max_per_thread
+        # thread id -> memo key -> (expiry as time.monotonic(), tool message content)
+        self.threads: Dict[str, OrderedDict[str, Tuple[float, Any]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, thread_id: str, tool_call: dict) -> Any | None:
+        """The content of the earlier result of the tool call, None when there is none or it expired."""
+        entries = self.threads.get(thread_id)
+        key = memo_key(tool_call)
+        entry = entries.get(key) if entries else None
+        if entry is not None and entry[0] > time.monotonic():
+            entries.move_to_end(key)
+            self.hits += 1
+            logger.info(f"Tool memo hit: {key} ({self.hits} hits, {self.misses} misses)")
+            return entry[1]
+        if entry is not None:
+            del entries[key]
+        self.misses += 1
+        return None
+
+    def store(self, thread_id: str, tool_call: dict, content: Any, status: str = "success", complete: bool = True):
+        """Keep the content of a tool result. `complete` is the flag the compacted tools set from their structured result."""
+        if status == "error" or not complete or "[Tool Error]" in str(content):
+            return
+        ttl = result_ttl(tool_call)
+        if ttl <= 0:
+            return
+        entries = self.threads.setdefault(thread_id, OrderedDict())
+        entries[memo_key(tool_call)] = (time.monotonic() + ttl, content)
+        entries.move_to_end(memo_key(tool_call))
+        while len(entries) > self.max_per_thread:
+            entries.popitem(last=False)
+
+    def forget(self, thread_id: str):
+        self.threads.pop(thread_id, None)
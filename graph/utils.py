@@ -1,6 +1,12 @@
-
+import functools
 import tiktoken
 
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """The tokenizer of a model, loaded once per process."""
+    return tiktoken.encoding_for_model(model)
+
 def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     """
     Count tokens in a given text using the specified OpenAI model tokenizer.
@@ -12,10 +18,27 @@ def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     Returns:
         int: The number of tokens in the text.
     """
-    # Initialize the tokenizer for the specified model
-    encoding = tiktoken.encoding_for_model(model)
+    # The tokenizer is cached, building it on every call cost more than encoding a short message
+    encoding = get_encoding(model)
     
     # Encode the text to get the token count
     token_count = len(encoding.encode(text))
     
-    return token_count
\ No newline at end of file
+    return token_count
+
+def tool_call_parameters(tool_call: dict) -> dict:
+    """
+    The arguments of a tool call the user reviews and edits: the first parameter set of the tools that take
+    a `parameters` list, all arguments of the tools with flat arguments (leaderboard, similar players).
+    """
+    args = tool_call["args"]
+    return args["parameters"][0] if "parameters" in args else args
+
+def replace_tool_call_parameters(tool_call: dict, parameters: dict) -> dict:
+    """A copy of the tool call with the edited parameters, its other arguments such as `endpoint` kept."""
+    args = dict(tool_call["args"])
+    if "parameters" in args:
+        args["parameters"] = [parameters]
+    else:
+        args = dict(parameters)
+    return {**tool_call, "args": args}
@@ -1,5 +1,8 @@
+import json
+import uuid
 from graph.graph import Subgraph, MainGraph
-from tools.tools import EVENT_PERFORMANCE_TOOL, SEASON_PERFORMANCE_TOOL, EVENT_SUMMARY_TOOL
+from graph.utils import tool_call_parameters
+from tools.tools import EVENT_PERFORMANCE_TOOL, SEASON_PERFORMANCE_TOOL, EVENT_SUMMARY_TOOL, SEASON_LEADERBOARD_TOOL, SIMILAR_PLAYERS_TOOL
 from graph.config import (
     ANALYZE_GAME_TOOL_CALLER_SYSTEM_MESSAGE,
     ANALYZE_PLAYER_TOOL_CALLER_SYSTEM_MESSAGE,
@@ -7,18 +10,40 @@ from graph.config import (
     ROUTER_MODEL_NAME,
 )
 
+# State to manage feedback, like the GradioState of the app
+class TerminalState():
+    def __init__(self):
+        self.feedback_pending = False
+        self.pending_tool_call = None
+        self.selected_subgraph = None
+        self.config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+
+def print_stream(chunks) -> str:
+    """Print the answer as it is written and return it."""
+    response = ""
+    for chunk in chunks:
+        if not response:
+            print("Assistant: ", end="", flush=True)
+        print(chunk, end="", flush=True)
+        response += chunk
+    if response:
+        print()
+    return response
+
 def main():
     # Create subgraphs
     player_analyze_subgraph = Subgraph(
-        tools=[EVENT_PERFORMANCE_TOOL, SEASON_PERFORMANCE_TOOL],
+        tools=[EVENT_PERFORMANCE_TOOL, SEASON_PERFORMANCE_TOOL, SEASON_LEADERBOARD_TOOL, SIMILAR_PLAYERS_TOOL],
         name='analyze-player',
-        tool_caller_system_message=ANALYZE_PLAYER_TOOL_CALLER_SYSTEM_MESSAGE
+        tool_caller_system_message=ANALYZE_PLAYER_TOOL_CALLER_SYSTEM_MESSAGE,
+        interrupt=['analyze_tools']
     )
 
     game_analyze_subgraph = Subgraph(
         tools=[EVENT_SUMMARY_TOOL],
         name='analyze-game',
-        tool_caller_system_message=ANALYZE_GAME_TOOL_CALLER_SYSTEM_MESSAGE
+        tool_caller_system_message=ANALYZE_GAME_TOOL_CALLER_SYSTEM_MESSAGE,
+        interrupt=['analyze_tools']
     )
 
     # Create the MainGraph
@@ -28,7 +53,7 @@ def main():
         router_system_message=ROUTER_SYSTEM_MESSAGE,
     )
 
-    config = {"configurable": {"thread_id": "1"}}
+    state = TerminalState()
 
     print("Welcome! I can assist you with analyzing football games and players. Type 'TERMINATE CONVERSATION' to end.")
 
@@ -41,8 +66,25 @@ def main():
             print("Goodbye! Have a great day!")
             break
 
-        # Process the user input through the MainGraph
-        main_graph.process_message(user_input=user_input, config=config)
+        # Process the user input through the MainGraph, the feedback prompt is printed by the subgraph itself
+        state.feedback_pending = False
+        chunks = main_graph.stream_message(user_input=user_input, config=state.config, app_state=state)
+        print_stream(chunk for chunk in chunks if not state.feedback_pending)
+
+        while state.feedback_pending:
+            feedback = input("Tool call parameters (JSON, blank to keep them): ").strip()
+            try:
+                parameters = json.loads(feedback) if feedback else tool_call_parameters(state.pending_tool_call)
+            except json.JSONDecodeError:
+                print("Please enter valid JSON")
+                continue
+            subgraph = state.selected_subgraph
+            subgraph.update_tool_message(tool_call_feedback=parameters, app_state=state)
+            response = print_stream(subgraph.stream_answer(user_input=None, config=state.config))
+            if '[Tool Error]' not in response:
+                subgraph.schedule_compaction(state.config)
+                state.feedback_pending = False
+                state.selected_subgraph = None
 
 if __name__ == "__main__":
     main()
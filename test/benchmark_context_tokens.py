@@ -0,0 +1,85 @@
+import uuid
+from typing import List
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, SystemMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+from config import logger
+from graph.graph import Subgraph
+from graph.utils import count_tokens
+from graph.config import ANALYZE_PLAYER_TOOL_CALLER_SYSTEM_MESSAGE
+
+
+TURNS = 10
+TABLE_ROWS = 30
+
+
+class RecordingModel(FakeMessagesListChatModel):
+    """Answers with the given messages in turn and keeps the token count of every input it gets."""
+    input_tokens: List[int] = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.input_tokens.append(sum(count_tokens(str(message.content)) for message in messages))
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+@tool
+def obtain_season_performance_data(player_name: str) -> str:
+    """Season stats of a player."""
+    return "\n".join(["tournament|season|appearances|goals|assists|rating"] + [f"League {row}|23/24|{row}|{row % 7}|{row % 5}|7.{row % 10}" for row in range(TABLE_ROWS)])
+
+
+class LegacySubgraph(Subgraph):
+    """The nodes as they were, writing their system messages into the state on every call, kept as the reference."""
+    def _tool_caller(self, state: dict):
+        state["messages"].insert(-1, SystemMessage(content=self.tool_caller_system_message))
+        return {"messages": [self.llm_with_tools.invoke(state["messages"])]}
+
+    def _answer_generator(self, state: dict):
+        state["messages"].append(SystemMessage(content=self.answer_generator_system_message))
+        return {"messages": [self.answer_generator_llm.invoke(state["messages"])]}
+
+
+def run_conversation(subgraph_class) -> tuple:
+    """TURNS questions through a subgraph without interrupts. Returns the input tokens of its two LLM calls per turn and the stored tokens."""
+    subgraph = subgraph_class(
+        name="benchmark-context",
+        tools=[obtain_season_performance_data],
+        tool_caller_system_message=ANALYZE_PLAYER_TOOL_CALLER_SYSTEM_MESSAGE,
+        interrupt=False
+    )
+    # Fresh messages for every turn, the reducer gives each its own id
+    subgraph.llm_with_tools = RecordingModel(responses=[
+        AIMessage(content="", tool_calls=[{"id": f"call_{turn}", "name": "obtain_season_performance_data", "args": {"player_name": f"Player {turn}"}}])
+        for turn in range(TURNS)
+    ], input_tokens=[])
+    subgraph.answer_generator_llm = RecordingModel(responses=[
+        AIMessage(content=f"Player {turn} played {turn} league seasons with a best rating of 7.9 in League 9. " * 4) for turn in range(TURNS)
+    ], input_tokens=[])
+    subgraph.graph = subgraph.graph_builder.compile(checkpointer=MemorySaver())
+
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+    for turn in range(TURNS):
+        subgraph.stream_graph_updates(user_input=f"How did Player {turn} perform in the last seasons?", config=config)
+    stored = sum(count_tokens(str(message.content)) for message in subgraph.graph.get_state(config).values["messages"])
+    return subgraph.llm_with_tools.input_tokens, subgraph.answer_generator_llm.input_tokens, stored
+
+def benchmark():
+    legacy_caller, legacy_answer, legacy_stored = run_conversation(LegacySubgraph)
+    caller, answer, stored = run_conversation(Subgraph)
+
+    lines = ["turn | tool caller input (before -> now) | answer generator input (before -> now)"]
+    for turn in range(TURNS):
+        lines.append(f"{turn + 1:>4} | {legacy_caller[turn]:>6} -> {caller[turn]:>6} | {legacy_answer[turn]:>6} -> {answer[turn]:>6}")
+    legacy_total, total = sum(legacy_caller) + sum(legacy_answer), sum(caller) + sum(answer)
+    lines.append(
+        f"{TURNS} turns: {legacy_total} -> {total} input tokens ({1 - total / legacy_total:.0%} fewer), "
+        f"last turn {legacy_caller[-1] + legacy_answer[-1]} -> {caller[-1] + answer[-1]}, "
+        f"stored history {legacy_stored} -> {stored} tokens"
+    )
+    message = "\n".join(lines)
+    logger.info(message)
+    print(message)
+
+
+benchmark()
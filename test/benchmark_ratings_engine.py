@@ -0,0 +1,82 @@
+import time
+import random
+import numpy as np
+from config import logger
+from tools.helper.ratings_engine import process_ratings_batch
+
+
+PLAYER_SEASONS = 100
+MATCHES_PER_SEASON = 38
+TEAM_COUNT = 400
+BIG_CLUB_COUNT = 60
+REPEATS = 20
+
+
+def process_player_ratings_loop(data: dict, big_club_ids: list) -> dict:
+    """The per season loop `process_player_ratings` used before the ratings engine, kept as the reference."""
+    all_ratings = []
+    big_game_ratings = []
+    for rating_data in data.get("seasonRatings", []):
+        rating = rating_data.get("rating")
+        is_home = rating_data.get("isHome")
+        home_team = rating_data["event"]["homeTeam"]["id"]
+        away_team = rating_data["event"]["awayTeam"]["id"]
+        opponent_team_id = away_team if is_home else home_team
+        if rating is not None:
+            all_ratings.append(rating)
+            if opponent_team_id in big_club_ids:
+                big_game_ratings.append(rating)
+    return {
+        "game_count": len(all_ratings),
+        "big_game_count": len(big_game_ratings),
+        "average_rating": np.mean(all_ratings) if all_ratings else None,
+        "rating_std_dev": np.std(all_ratings) if all_ratings else None,
+        "average_big_game_rating": np.mean(big_game_ratings) if big_game_ratings else None,
+    }
+
+def generate_season(rng: random.Random, team_id: int) -> dict:
+    season_ratings = []
+    for match in range(MATCHES_PER_SEASON):
+        opponent_id = rng.randrange(TEAM_COUNT)
+        is_home = match % 2 == 0
+        season_ratings.append({
+            "rating": None if rng.random() < 0.1 else round(rng.uniform(5.5, 9.0), 1),
+            "isHome": is_home,
+            "event": {
+                "homeTeam": {"id": team_id if is_home else opponent_id},
+                "awayTeam": {"id": opponent_id if is_home else team_id},
+                "startTimestamp": 1700000000 + match * 604800
+            }
+        })
+    return {"seasonRatings": season_ratings}
+
+def benchmark():
+    rng = random.Random(7)
+    entries = []
+    for index in range(PLAYER_SEASONS):
+        team_id = rng.randrange(TEAM_COUNT)
+        big_club_ids = rng.sample(range(TEAM_COUNT), BIG_CLUB_COUNT)
+        entries.append((index, generate_season(rng, team_id), big_club_ids))
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        loop_results = {key: process_player_ratings_loop(data, big_club_ids) for key, data, big_club_ids in entries}
+    loop_time = (time.perf_counter() - start) / REPEATS
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        engine_results = process_ratings_batch(entries)
+    engine_time = (time.perf_counter() - start) / REPEATS
+
+    for key, expected in loop_results.items():
+        for field, value in expected.items():
+            if value is None:
+                assert engine_results[key][field] is None, (key, field)
+            else:
+                assert np.isclose(engine_results[key][field], value), (key, field)
+
+    logger.info(f"{PLAYER_SEASONS} player-seasons: loop {loop_time * 1000:.2f} ms, ratings engine {engine_time * 1000:.2f} ms ({loop_time / engine_time:.1f}x)")
+    print(f"{PLAYER_SEASONS} player-seasons: loop {loop_time * 1000:.2f} ms, ratings engine {engine_time * 1000:.2f} ms ({loop_time / engine_time:.1f}x)")
+
+
+benchmark()
@@ -0,0 +1,106 @@
+import time
+import random
+import datetime
+import numpy as np
+from config import logger, ELO_INITIAL_RATING, ELO_K_FACTOR, ELO_HOME_ADVANTAGE
+from tools.helper.team_strength import TeamStrength
+
+
+LEAGUE_COUNT = 20
+TEAMS_PER_LEAGUE = 20
+BAND_LOOKUPS = 100000
+REPEATS = 5
+
+
+def elo_loop(events: list) -> dict:
+    """Event by event Elo over the same history, kept as the reference."""
+    ratings = {}
+    for event in sorted(events, key=lambda event: event["EVENT_DATE"]):
+        home, away = event["HOME_TEAM_ID"], event["AWAY_TEAM_ID"]
+        home_rating = ratings.setdefault(home, float(ELO_INITIAL_RATING))
+        away_rating = ratings.setdefault(away, float(ELO_INITIAL_RATING))
+        expected = 1 / (1 + 10 ** (-(home_rating + ELO_HOME_ADVANTAGE - away_rating) / 400))
+        result = 1.0 if event["HOME_SCORE"] > event["AWAY_SCORE"] else 0.5 if event["HOME_SCORE"] == event["AWAY_SCORE"] else 0.0
+        goal_difference = abs(event["HOME_SCORE"] - event["AWAY_SCORE"])
+        margin = 1.0 if goal_difference <= 1 else 1.5 if goal_difference == 2 else (11 + goal_difference) / 8
+        delta = ELO_K_FACTOR * margin * (result - expected)
+        ratings[home] += delta
+        ratings[away] -= delta
+    return ratings
+
+def generate_season(rng: random.Random) -> list:
+    """A double round robin for every league, one match day per week, like one season of `dim_events` rows."""
+    events = []
+    start = datetime.date(2024, 8, 17)
+    for league in range(LEAGUE_COUNT):
+        teams = [league * 1000 + team for team in range(TEAMS_PER_LEAGUE)]
+        strength = {team: rng.gauss(0, 1) for team in teams}
+        rounds = []
+        rotation = teams[:]
+        for _ in range(TEAMS_PER_LEAGUE - 1):
+            rounds.append([(rotation[i], rotation[-1 - i]) for i in range(TEAMS_PER_LEAGUE // 2)])
+            rotation = [rotation[0]] + [rotation[-1]] + rotation[1:-1]
+        rounds += [[(away, home) for home, away in matches] for matches in rounds]
+        for day, matches in enumerate(rounds):
+            for home, away in matches:
+                edge = strength[home] - strength[away]
+                events.append({
+                    "EVENT_ID": len(events) + 1,
+                    "EVENT_DATE": (start + datetime.timedelta(weeks=day)).isoformat(),
+                    "HOME_TEAM_ID": home,
+                    "AWAY_TEAM_ID": away,
+                    "HOME_SCORE": max(0, round(rng.gauss(1.5 + 0.5 * edge, 1.1))),
+                    "AWAY_SCORE": max(0, round(rng.gauss(1.1 - 0.5 * edge, 1.0))),
+                    "WINNER_CODE": 1,
+                })
+    return events
+
+def benchmark():
+    events = generate_season(random.Random(3))
+    last_day = max(event["EVENT_DATE"] for event in events)
+    history = [event for event in events if event["EVENT_DATE"] < last_day]
+    new_results = [event for event in events if event["EVENT_DATE"] == last_day]
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        reference = elo_loop(events)
+    loop_time = (time.perf_counter() - start) / REPEATS
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        strength = TeamStrength()
+        strength.update(events)
+    vectorized_time = (time.perf_counter() - start) / REPEATS
+
+    for team_id, rating in reference.items():
+        assert np.isclose(strength.rating(team_id), rating), team_id
+
+    incremental = TeamStrength()
+    incremental.update(history)
+    start = time.perf_counter()
+    incremental.update(new_results)
+    incremental_time = time.perf_counter() - start
+    assert np.allclose(incremental.ratings, strength.ratings)
+
+    opponents = np.array([random.choice(list(reference)) for _ in range(BAND_LOOKUPS)])
+    start = time.perf_counter()
+    strength.opponent_bands(opponents)
+    lookup_time = time.perf_counter() - start
+
+    team_ids = list(reference)
+    start = time.perf_counter()
+    for team_id in team_ids:
+        strength.big_club_ids(team_id)
+    big_club_time = (time.perf_counter() - start) / len(team_ids)
+
+    message = (
+        f"{len(events)} events: loop {loop_time * 1000:.1f} ms, vectorized {vectorized_time * 1000:.1f} ms "
+        f"({loop_time / vectorized_time:.1f}x), last match day incrementally {incremental_time * 1000:.2f} ms, "
+        f"{BAND_LOOKUPS} opponent band lookups {lookup_time * 1000:.2f} ms, "
+        f"big clubs of a team {big_club_time * 1e6:.1f} us instead of a dim_teams query and scan"
+    )
+    logger.info(message)
+    print(message)
+
+
+benchmark()
@@ -0,0 +1,2 @@
+# test_tool_functions.py is a script that queries the live lambdas and Sofascore when it is imported, run it with `python -m test.test_tool_functions`
+collect_ignore = ["test_tool_functions.py"]
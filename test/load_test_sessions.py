@@ -0,0 +1,75 @@
+import sys
+import json
+import time
+import asyncio
+from config import logger, APP_CONCURRENCY_LIMIT
+from app import main_graph, GradioState, handle_user_input, update_tool_call
+
+
+SESSION_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+
+def load_prompts(count: int) -> list:
+    """Season performance prompts with the player name the tool call should get, one per session."""
+    with open("test/prompts/season_performance_prompts.json", encoding="utf-8") as file:
+        prompts = [
+            (item["prompt"], item["tool_calls"][0]["args"]["parameters"][0]["player_name"])
+            for item in json.load(file).values()
+            if len(item["tool_calls"][0]["args"]["parameters"]) == 1
+        ]
+    return [prompts[index % len(prompts)] for index in range(count)]
+
+async def run_session(prompt: str, gate: asyncio.Semaphore) -> tuple:
+    """One browser session: ask, approve the parsed parameters unchanged, read the answer. The gate plays the Gradio queue."""
+    state = GradioState()
+    chat_history = []
+    start = time.perf_counter()
+    async with gate:
+        async for _, chat_history, _, state in handle_user_input(prompt, chat_history, state):
+            pass
+        parameters = state.parameters
+        if state.feedback_pending:
+            async for chat_history, _, state in update_tool_call(chat_history, json.dumps(parameters[0]), state):
+                pass
+    return state, parameters, chat_history, time.perf_counter() - start
+
+async def load_test():
+    prompts = load_prompts(SESSION_COUNT)
+    gate = asyncio.Semaphore(APP_CONCURRENCY_LIMIT)
+    start = time.perf_counter()
+    sessions = await asyncio.gather(*(run_session(prompt, gate) for prompt, _ in prompts))
+    total_time = time.perf_counter() - start
+
+    failures = []
+    thread_ids = {state.config["configurable"]["thread_id"] for state, _, _, _ in sessions}
+    if len(thread_ids) != len(sessions):
+        failures.append("sessions share a thread id")
+    for (prompt, player_name), (state, parameters, chat_history, _) in zip(prompts, sessions):
+        thread_id = state.config["configurable"]["thread_id"]
+        # The thread holds this session's question and no other
+        human_messages = [
+            message.content
+            for subgraph in main_graph.subgraphs
+            for message in subgraph.graph.get_state(state.config).values.get("messages", [])
+            if message.type == "human"
+        ]
+        if human_messages != [prompt]:
+            failures.append(f"{thread_id}: thread holds {human_messages}")
+        if not parameters or parameters[0].get("player_name") != player_name:
+            failures.append(f"{thread_id}: tool call for {parameters} instead of {player_name}")
+        answer = chat_history[-1][1] if chat_history else None
+        if not answer or player_name.split()[-1] not in answer:
+            failures.append(f"{thread_id}: answer does not mention {player_name}: {answer}")
+
+    durations = sorted(duration for _, _, _, duration in sessions)
+    message = (
+        f"{SESSION_COUNT} sessions, concurrency limit {APP_CONCURRENCY_LIMIT}: {total_time:.1f} s in total, "
+        f"median session {durations[len(durations) // 2]:.1f} s, slowest {durations[-1]:.1f} s, {len(failures)} failures"
+    )
+    logger.info(message)
+    print(message)
+    for failure in failures:
+        print(failure)
+
+
+asyncio.run(load_test())
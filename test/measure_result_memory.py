@@ -0,0 +1,81 @@
+import json
+import random
+import tracemalloc
+from config import logger
+from tools.modules import PlayerEventStats, PlayerSeasonStats, EVENT_STAT_COLUMNS, SEASON_STAT_COLUMNS, compact_result, expand_result
+
+
+RESULT_COUNT = 2000
+
+
+def event_stats_response(rng: random.Random) -> dict:
+    # Every result comes from its own JSON response, so its keys are separate string objects like in production
+    stats = {column: rng.randint(0, 60) for column in rng.sample(EVENT_STAT_COLUMNS, 25)}
+    stats["rating"] = round(rng.uniform(5.5, 9.5), 1)
+    stats["expectedGoals"] = round(rng.random(), 4)
+    stats["ratingVersions"] = {"original": stats["rating"], "alternative": None}
+    return json.loads(json.dumps({"statistics": stats}))
+
+def season_stats_response(rng: random.Random) -> dict:
+    stats = {column: rng.randint(0, 3000) for column in SEASON_STAT_COLUMNS}
+    stats["rating"] = round(rng.uniform(6.0, 8.0), 2)
+    stats["type"] = "overall"
+    stats["id"] = rng.randint(1, 10**6)
+    return json.loads(json.dumps({"statistics": stats}))
+
+def build_event_results(rng: random.Random) -> list:
+    return [
+        PlayerEventStats(
+            player_id=index,
+            player_name=f"Player {index % 50}",
+            tournament_name="Trendyol Süper Lig",
+            event_date="2024-12-22",
+            opponent_team_name="Kayserispor",
+            player_team_name="Galatasaray",
+            is_home=bool(index % 2),
+            opponent_team_score=1,
+            player_team_score=2,
+            match_result="Win",
+            stats=event_stats_response(rng)["statistics"]
+        )
+        for index in range(RESULT_COUNT)
+    ]
+
+def build_season_results(rng: random.Random) -> list:
+    return [
+        PlayerSeasonStats(
+            player_name=f"Player {index % 50}",
+            player_id=index,
+            tournament_name="Premier League",
+            tournament_id=17,
+            season_year=2024,
+            unique_season_id=61627,
+            stats=season_stats_response(rng)["statistics"]
+        )
+        for index in range(RESULT_COUNT // 10)
+    ]
+
+def measure(build) -> tuple:
+    """Bytes per object of the plain results and of their compact variants, and whether the round trip is lossless."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    results = build(random.Random(11))
+    plain_size = tracemalloc.get_traced_memory()[0] - before
+
+    before = tracemalloc.get_traced_memory()[0]
+    compact = [compact_result(result) for result in results]
+    compact_size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    lossless = all(expand_result(item) == result for item, result in zip(compact, results))
+    return plain_size / len(results), compact_size / len(results), lossless
+
+def report(name: str, build):
+    plain, compact, lossless = measure(build)
+    message = f"{name}: {plain:.0f} bytes per result, compact {compact:.0f} bytes ({compact / plain:.0%}), lossless round trip: {lossless}"
+    logger.info(message)
+    print(message)
+
+
+report("PlayerEventStats", build_event_results)
+report("PlayerSeasonStats", build_season_results)
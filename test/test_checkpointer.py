@@ -0,0 +1,67 @@
+import sqlite3
+import time
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from graph.checkpointer import BoundedSqliteSaver
+
+
+def _config(thread_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+def _put(saver, thread_id, count):
+    config = _config(thread_id)
+    for step in range(count):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"step": step}
+        config = saver.put(config, checkpoint, {"step": step}, {})
+        # Checkpoint ids sort by time, keep them apart
+        time.sleep(0.002)
+    saver.flush()
+
+def _stored_rows(path, thread_id):
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "checkpoints.sqlite")
+
+
+def test_threads_are_read_back_after_a_restart(path):
+    saver = BoundedSqliteSaver(path)
+    _put(saver, "a", 3)
+    saver.close()
+
+    restarted = BoundedSqliteSaver(path)
+    try:
+        assert "a" not in restarted.storage
+        assert restarted.get_tuple(_config("a")).checkpoint["channel_values"] == {"step": 2}
+    finally:
+        restarted.close()
+
+
+def test_only_the_latest_checkpoints_are_kept(path):
+    saver = BoundedSqliteSaver(path, max_per_thread=3)
+    try:
+        _put(saver, "a", 6)
+        steps = [item.checkpoint["channel_values"]["step"] for item in saver.list(_config("a"))]
+        assert steps == [5, 4, 3]
+        assert _stored_rows(path, "a") == 3
+    finally:
+        saver.close()
+
+
+def test_idle_threads_leave_memory_and_are_forgotten(path):
+    evicted = []
+    saver = BoundedSqliteSaver(path, idle_seconds=0.05, on_evict=evicted.append)
+    try:
+        _put(saver, "a", 2)
+        time.sleep(0.1)
+        saver._evict_idle()
+        assert "a" not in saver.storage
+        assert evicted == ["a"]
+        # Used again, the thread is read back from the file
+        assert saver.get_tuple(_config("a")).checkpoint["channel_values"] == {"step": 1}
+    finally:
+        saver.close()
@@ -0,0 +1,75 @@
+import asyncio
+from tools.modules import PlayerEventParameters
+from tools.helper import event_planner
+from tools.helper.event_planner import plan_event_queries, execute_event_plan, aplan_event_queries, aiter_event_plan
+
+
+EVENT = {
+    "EVENT_ID": 7, "EVENT_DATE": "2024-11-10", "TOURNAMENT_ID": 52, "WINNER_CODE": 1,
+    "HOME_TEAM_ID": 1, "HOME_TEAM_NAME": "Galatasaray", "HOME_SCORE": 3,
+    "AWAY_TEAM_ID": 2, "AWAY_TEAM_NAME": "Fenerbahce", "AWAY_SCORE": 1,
+}
+
+def _player(player_id, name, minutes):
+    return {"player": {"id": player_id, "name": name}, "statistics": {"minutesPlayed": minutes, "rating": 7.0} if minutes else {}}
+
+LINEUPS = {
+    "home": {"players": [_player(10, "Mauro Icardi", 90), _player(11, "Dries Mertens", 70), _player(12, "Bench Player", 0)]},
+    "away": {"players": [_player(20, "Edin Dzeko", 90)]},
+}
+
+
+def _fake_fetches(monkeypatch, requests):
+    def lineups(event_id, cache=True):
+        requests.append(("lineups", event_id))
+        return LINEUPS
+
+    async def alineups(event_id, cache=True):
+        return lineups(event_id, cache)
+
+    async def ateam(team_name, col_name):
+        return {"Galatasaray": 1}.get(team_name, False)
+
+    async def atournament(**kwargs):
+        return "Trendyol Super Lig"
+
+    async def ascan(payload):
+        return [EVENT]
+
+    monkeypatch.setattr(event_planner, "get_team_property", lambda team_name, col_name: {"Galatasaray": 1}.get(team_name, False))
+    monkeypatch.setattr(event_planner, "get_tournament_property", lambda **kwargs: "Trendyol Super Lig")
+    monkeypatch.setattr(event_planner, "scan_events", lambda payload: [EVENT])
+    monkeypatch.setattr(event_planner, "request_event_lineups", lineups)
+    monkeypatch.setattr(event_planner, "aget_team_property", ateam)
+    monkeypatch.setattr(event_planner, "aget_tournament_property", atournament)
+    monkeypatch.setattr(event_planner, "ascan_events", ascan)
+    monkeypatch.setattr(event_planner, "arequest_event_lineups", alineups)
+
+
+def _squad_parameters(team_name="Galatasaray"):
+    return [PlayerEventParameters(event_date=None, last_k=1, opponent_team_name=None, player_team_name=team_name, tournament_name=None, player_name=None)]
+
+
+def test_squad_query_reads_one_lineups_response(monkeypatch):
+    requests = []
+    _fake_fetches(monkeypatch, requests)
+    results = execute_event_plan(plan_event_queries(_squad_parameters()))
+    assert [item.player_name for item in results] == ["Mauro Icardi", "Dries Mertens"]
+    assert all(item.is_home and item.match_result == "Win" and item.opponent_team_name == "Fenerbahce" for item in results)
+    assert requests == [("lineups", 7)]
+
+
+def test_async_squad_query(monkeypatch):
+    _fake_fetches(monkeypatch, [])
+
+    async def run():
+        plan = await aplan_event_queries(_squad_parameters())
+        return [item async for _, item in aiter_event_plan(plan)]
+
+    assert [item.player_name for item in asyncio.run(run())] == ["Mauro Icardi", "Dries Mertens"]
+
+
+def test_squad_query_needs_a_known_team(monkeypatch):
+    _fake_fetches(monkeypatch, [])
+    assert execute_event_plan(plan_event_queries(_squad_parameters("Unknown FC"))) == ["[Tool Error]: Team 'Unknown FC' not found in the database."]
+    assert execute_event_plan(plan_event_queries(_squad_parameters(None)))[0].startswith("[Tool Error]")
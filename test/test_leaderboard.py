@@ -0,0 +1,46 @@
+import random
+from tools.modules import CompactPlayerSeasonStats, StatBlock, SEASON_STAT_COLUMNS
+from tools.helper.leaderboard import LeaderboardIndex
+
+
+def _season(player_id, minutes, goals):
+    stats = StatBlock.from_dict({"minutesPlayed": minutes, "goals": goals, "assists": goals % 4}, SEASON_STAT_COLUMNS)
+    return CompactPlayerSeasonStats(player_name=f"P{player_id}", player_id=player_id, tournament_name="L", tournament_id=1,
+                                    season_year=2024, unique_season_id=5, stats=stats)
+
+def _board(index, stat, per_90=False, position=None, k=5):
+    result = index.leaderboard("L", 2024, stat, k=k, per_90=per_90, min_minutes=450, position=position)
+    return [(entry["player_name"], entry["value"]) for entry in result.entries]
+
+QUERIES = [("goals", False, None), ("goals", True, None), ("assists", False, "F"), ("goals", True, "D")]
+
+
+def test_incremental_heaps_match_a_full_recompute():
+    generator = random.Random(7)
+    seasons = [_season(player_id, generator.randint(100, 3000), generator.randint(0, 25)) for player_id in range(60)]
+    positions = {season.player_id: generator.choice("GDMF") for season in seasons}
+
+    incremental = LeaderboardIndex()
+    cache = {}
+    for start in range(0, len(seasons), 10):
+        for season in seasons[start:start + 10]:
+            cache[(season.player_id, season.unique_season_id)] = season
+        # Positions of the latest batch arrive one update later
+        known = {player_id: position for player_id, position in positions.items() if player_id < start}
+        incremental.update(dict(cache), {}, known)
+        for stat, per_90, position in QUERIES:
+            _board(incremental, stat, per_90, position)
+    incremental.update(dict(cache), {}, positions)
+
+    full = LeaderboardIndex()
+    full.update(dict(cache), {}, positions)
+    for stat, per_90, position in QUERIES:
+        assert _board(incremental, stat, per_90, position) == _board(full, stat, per_90, position)
+
+
+def test_unknown_positions_are_reported():
+    index = LeaderboardIndex()
+    index.update({(1, 5): _season(1, 900, 3), (2, 5): _season(2, 900, 5)}, {}, {1: "F"})
+    result = index.leaderboard("L", 2024, "goals", position="F")
+    assert [entry["player_name"] for entry in result.entries] == ["P1"]
+    assert "1 players whose position is unknown" in result.info
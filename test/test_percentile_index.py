@@ -0,0 +1,30 @@
+import numpy as np
+from tools.helper.percentile_index import PercentileGroup
+from tools.modules import PERCENTILE_STAT_COLUMNS
+
+
+def _group(*values):
+    group = PercentileGroup()
+    for player_id, value in enumerate(values):
+        group.upsert(player_id, np.full(len(PERCENTILE_STAT_COLUMNS), value))
+    return group
+
+
+def test_higher_is_better():
+    group = _group(1.0, 2.0, 3.0, 4.0)
+    assert group.percentiles(np.full(len(PERCENTILE_STAT_COLUMNS), 4.0))["goals"] == 100
+    assert group.percentiles(np.full(len(PERCENTILE_STAT_COLUMNS), 1.0))["goals"] == 25
+
+
+def test_lower_is_better_is_inverted():
+    group = _group(1.0, 2.0, 3.0, 4.0)
+    lowest = group.percentiles(np.full(len(PERCENTILE_STAT_COLUMNS), 1.0))
+    highest = group.percentiles(np.full(len(PERCENTILE_STAT_COLUMNS), 4.0))
+    assert lowest["possessionLost"] == lowest["goalsConceded"] == 100
+    assert highest["possessionLost"] == highest["goalsConceded"] == 25
+
+
+def test_ties_count_as_matched():
+    group = _group(2.0, 2.0, 2.0, 2.0)
+    percentiles = group.percentiles(np.full(len(PERCENTILE_STAT_COLUMNS), 2.0))
+    assert percentiles["goals"] == percentiles["possessionLost"] == 100
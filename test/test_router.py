@@ -0,0 +1,68 @@
+import pytest
+from graph.router import LocalRouter
+
+
+# Held out from the training prompts. None: the router LLM decides.
+LABELLED_MESSAGES = [
+    ("How did Mauro Icardi perform this season?", "analyze-player"),
+    ("What happened in the game between Galatasaray and Fenerbahce?", "analyze-game"),
+    ("Summarize the Kayserispor vs Galatasaray game", "analyze-game"),
+    ("Show me the ratings of Victor Osimhen in the last 5 matches", "analyze-player"),
+    ("Did Real Madrid win their last match against Barcelona?", "analyze-game"),
+    ("What is the capital of France?", "normal-graph"),
+    ("What is the offside rule in a match?", "normal-graph"),
+    ("Who won the 2022 World Cup final game?", "normal-graph"),
+    ("Explain the rating system used by FIFA", "normal-graph"),
+    ("Who is the best football player of all time?", "normal-graph"),
+    ("What does a clean sheet mean?", "normal-graph"),
+    ("Recommend me a good football documentary", "normal-graph"),
+]
+
+
+@pytest.fixture(scope="module")
+def router():
+    router = LocalRouter.from_prompts()
+    # Only the names of the training prompts, not whatever the season caches hold
+    router.refresh_names(caches=[], team_names={})
+    return router
+
+
+@pytest.mark.parametrize("message, expected", LABELLED_MESSAGES)
+def test_local_decisions_are_correct(router, message, expected):
+    decision = router.route(message)
+    assert decision.label in (None, expected)
+
+
+@pytest.mark.parametrize("message", [message for message, label in LABELLED_MESSAGES if label == "normal-graph"])
+def test_general_questions_go_to_the_llm(router, message):
+    # The rules never vote for normal-graph, so a general question is never decided locally
+    assert router.route(message).label is None
+
+
+def test_clear_questions_are_routed_locally(router):
+    decided = [router.route(message).label for message, label in LABELLED_MESSAGES if label != "normal-graph"]
+    assert decided.count(None) < len(decided)
+
+
+def test_rules_alone_do_not_decide():
+    # "match" makes the rules vote analyze-game, the model trained on these prompts does not agree
+    router = LocalRouter([
+        ("What happened in the game between Galatasaray and Fenerbahce", "analyze-game", [("Galatasaray", "team"), ("Fenerbahce", "team")]),
+        ("How did Mauro Icardi perform this season", "analyze-player", [("Mauro Icardi", "player")]),
+        ("What is the offside rule in football", "normal-graph", []),
+        ("What is the capital of France", "normal-graph", []),
+    ])
+    router.refresh_names(caches=[], team_names={})
+    assert LocalRouter.rule_label(["offside", "rule", "in", "a", "match"], router.names.replace([])[1]) == "analyze-game"
+    assert router.route("What is the offside rule in a match?").label is None
+
+
+def test_names_of_a_full_cache_are_added():
+    # A full LRU cache keeps its size while new players replace the evicted ones
+    class Entry:
+        def __init__(self, player_name):
+            self.player_name, self.tournament_name = player_name, "Super Lig"
+    router = LocalRouter([("How did Mauro Icardi perform this season", "analyze-player", [("Mauro Icardi", "player")])])
+    router.refresh_names(caches=[{(1, 1): Entry("Dries Mertens")}], team_names={})
+    router.refresh_names(caches=[{(2, 1): Entry("Victor Osimhen")}], team_names={})
+    assert router.names.replace(["victor", "osimhen"])[1]["player"] == 1
@@ -0,0 +1,43 @@
+import os
+from tools.modules import CompactPlayerSeasonStats, StatBlock, SEASON_STAT_COLUMNS
+from tools.helper.similarity_index import SimilarityIndex
+
+
+def _season(player_id, goals):
+    stats = StatBlock.from_dict({"minutesPlayed": 900, "goals": goals, "rating": 7.0}, SEASON_STAT_COLUMNS)
+    return CompactPlayerSeasonStats(player_name=f"P{player_id}", player_id=player_id, tournament_name="L", tournament_id=1,
+                                    season_year=2024, unique_season_id=5, stats=stats)
+
+def _cache(*seasons):
+    return {(season.player_id, season.unique_season_id): season for season in seasons}
+
+
+def test_profiles_arriving_later_fill_in_the_rows():
+    index = SimilarityIndex()
+    cache = _cache(_season(1, 5), _season(2, 3))
+    index.update(cache, positions={}, birth_timestamps={})
+    assert index.mask(position="F").sum() == 0
+    assert index.mask(min_age=18).sum() == 0
+
+    # Same stat blocks, only the profiles are new
+    index.update(cache, positions={1: "F", 2: "D"}, birth_timestamps={1: 631152000, 2: 631152000})
+    assert index.mask(position="F").tolist() == [True, False]
+    assert index.mask(min_age=18).tolist() == [True, True]
+
+
+def test_save_writes_a_new_generation(tmp_path):
+    index = SimilarityIndex()
+    index.update(_cache(_season(1, 5), _season(2, 3)), positions={1: "F", 2: "D"}, birth_timestamps={1: 631152000, 2: 631152000})
+    index.save(str(tmp_path))
+    first = SimilarityIndex.load(str(tmp_path))
+
+    index.update(_cache(_season(3, 1)), positions={3: "M"}, birth_timestamps={3: 631152000})
+    index.save(str(tmp_path))
+    second = SimilarityIndex.load(str(tmp_path))
+
+    # The files the first load mapped are left as they were
+    assert len(first) == 2 and first.labels[1]["position"] == "D"
+    assert first.values.shape == (2, index.values.shape[1])
+    assert len(second) == 3 and second.labels[2]["position"] == "M"
+    assert second.generation != first.generation
+    assert os.path.isdir(os.path.join(str(tmp_path), first.generation))
@@ -0,0 +1,28 @@
+import numpy as np
+from tools.modules import PlayerEventStats, PlayerSeasonStats
+from tools.helper.stats_frame import season_comparison_frame, event_comparison_frame
+
+
+def _season(player_id, minutes, goals):
+    return PlayerSeasonStats(player_name=f"P{player_id}", player_id=player_id, tournament_name="L", tournament_id=1, season_year=2024,
+                             unique_season_id=5, stats={"minutesPlayed": minutes, "goals": goals, "totalPasses": 100, "accuratePasses": 75})
+
+def _event(player_id, date, goals):
+    return PlayerEventStats(player_id=player_id, player_name=f"P{player_id}", tournament_name="L", event_date=date, opponent_team_name="O",
+                            player_team_name="T", is_home=True, opponent_team_score=0, player_team_score=3, match_result="Win",
+                            stats={"minutesPlayed": 90, "goals": goals})
+
+
+def test_season_per_90_and_ratios():
+    frame = season_comparison_frame([_season(1, 900, 5), _season(2, 0, 0)], columns=["goals"])
+    assert frame.column("goals_per_90")[0] == 0.5
+    assert np.isnan(frame.column("goals_per_90")[1])
+    assert frame.column("pass_accuracy").tolist() == [0.75, 0.75]
+
+
+def test_team_shares_within_a_match():
+    frame = event_comparison_frame([_event(1, "2024-11-10", 2), _event(2, "2024-11-10", 1), _event(3, "2024-11-17", 1)], columns=["goals"])
+    shares = frame.column("goals_team_share")
+    assert np.allclose(shares[:2], [2 / 3, 1 / 3])
+    # Alone in its team in that match
+    assert np.isnan(shares[2])
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+import requests
+from tools.helper import team_strength
+from tools.helper.team_strength import TeamStrength, refresh_team_strength, arefresh_team_strength
+
+
+def _event(event_id, date, home, away, home_score, away_score):
+    return {
+        "EVENT_ID": event_id, "EVENT_DATE": date, "HOME_TEAM_ID": home, "AWAY_TEAM_ID": away,
+        "HOME_SCORE": home_score, "AWAY_SCORE": away_score, "WINNER_CODE": 1 if home_score > away_score else 2 if away_score > home_score else 3,
+    }
+
+
+def test_update_applies_new_events_once():
+    strength = TeamStrength()
+    events = [_event(1, "2024-08-01", 10, 20, 2, 0), _event(2, "2024-08-08", 20, 30, 1, 1)]
+    assert strength.update(events) == 2
+    assert strength.update(events) == 0
+    assert strength.rating(10) > strength.rating(20)
+    assert strength.big_club_ids(20) is not None
+
+
+def test_failed_scan_waits_before_retrying(monkeypatch):
+    calls = []
+
+    def failing_post(*args, **kwargs):
+        calls.append(kwargs)
+        raise requests.ConnectionError("scan lambda unavailable")
+
+    monkeypatch.setattr(team_strength.requests, "post", failing_post)
+    strength = TeamStrength()
+    refresh_team_strength(strength)
+    refresh_team_strength(strength)
+    assert len(calls) == 1
+    assert strength.refreshed_at is None and not strength.needs_refresh()
+
+    strength.retry_at = 0
+    assert strength.needs_refresh()
+
+
+def test_concurrent_refreshes_scan_once(monkeypatch):
+    calls = []
+    events = [_event(1, "2024-08-01", 10, 20, 2, 0), _event(2, "2024-08-08", 20, 30, 1, 1)]
+
+    class Response:
+        def json(self):
+            return events
+
+    def slow_post(*args, **kwargs):
+        calls.append(kwargs)
+        time.sleep(0.2)
+        return Response()
+
+    monkeypatch.setattr(team_strength.requests, "post", slow_post)
+    strength = TeamStrength()
+    threads = [threading.Thread(target=refresh_team_strength, args=(strength,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert strength.games.tolist() == [1, 2, 1]
+
+
+def test_concurrent_async_refreshes_share_one_scan(monkeypatch):
+    calls = []
+
+    async def slow_post(*args, **kwargs):
+        calls.append(args)
+        await asyncio.sleep(0.1)
+        return [_event(1, "2024-08-01", 10, 20, 2, 0)]
+
+    monkeypatch.setattr(team_strength, "alambda_post", slow_post)
+    strength = TeamStrength()
+
+    async def refresh_all():
+        await asyncio.gather(*[arefresh_team_strength(strength) for _ in range(4)])
+
+    asyncio.run(refresh_all())
+    assert len(calls) == 1
+    assert strength.games.tolist() == [1, 1]
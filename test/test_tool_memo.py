@@ -0,0 +1,40 @@
+from langchain_core.tools import StructuredTool
+from tools.modules import PlayerSeasonStats
+from tools.helper.compaction import compacted
+from tools.helper.streaming import partial_marker
+from graph.tool_memo import ToolMemo
+
+
+def _season(player_id):
+    return PlayerSeasonStats(player_name=f"P{player_id}", player_id=player_id, tournament_name="L", tournament_id=1, season_year=2020,
+                             unique_season_id=5, stats={"minutesPlayed": 900, "goals": 5})
+
+def _run(result) -> tuple:
+    """The tool call of a finished season, memoized for a day, and the tool message of `result` as `ToolNode` builds it."""
+    def obtain_season_performance_data(player_name: str, season_year: int):
+        """Season stats."""
+        return result
+    tool = StructuredTool.from_function(func=compacted(obtain_season_performance_data, "obtain_season_performance_data"),
+                                        response_format="content_and_artifact")
+    tool_call = {"id": "c1", "name": "obtain_season_performance_data", "args": {"player_name": "P1", "season_year": 2020}, "type": "tool_call"}
+    return tool_call, tool.invoke(tool_call)
+
+def _store(result):
+    memo = ToolMemo()
+    tool_call, message = _run(result)
+    memo.store("t", tool_call, message.content, message.status, message.artifact["complete"])
+    return memo.lookup("t", tool_call)
+
+
+def test_complete_results_are_memoized():
+    assert _store([_season(1), _season(2)]) is not None
+
+def test_partial_results_are_not_memoized():
+    assert _store([_season(1), partial_marker(completed=1, cancelled=3)]) is None
+
+def test_error_results_are_not_memoized():
+    assert _store([{"error": {"message": "URL request failed with code 500"}}]) is None
+
+def test_nested_errors_are_not_memoized():
+    # Event summaries come as one list per parameter set
+    assert _store([[_season(1)], [{"error": {"message": "Event not found"}}]]) is None
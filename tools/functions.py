@@ -1,16 +1,57 @@
-from typing import List
+from typing import List, Iterator, AsyncIterator, Tuple, Any
+import asyncio
 from decimal import Decimal
 from tools.modules import *
 from config import *
 
-from tools.helper.season_ratings import obtain_multiple_player_ratings
-from tools.helper.season_stats import obtain_multiple_player_season_stats
-from tools.helper.event_stats import get_player_property, obtain_player_event_stats
-from tools.helper.event_summary import get_tournament_property, get_team_property, create_url_params, create_event_data
+from tools.helper.season_ratings import create_season_ratings_jobs, acreate_season_ratings_jobs, season_ratings_snapshot
+from tools.helper.season_stats import (
+    create_season_stats_jobs,
+    acreate_season_stats_jobs,
+    season_stats_snapshot,
+    PLAYER_POSITIONS,
+    PLAYER_BIRTH_TIMESTAMPS,
+)
+from tools.helper.percentile_index import enrich_with_percentiles
+from tools.helper.leaderboard import LEADERBOARD_INDEX
+from tools.helper.similarity_index import SimilarityIndex, similarity_index
+from tools.helper.event_planner import plan_event_queries, iter_event_plan, aplan_event_queries, aiter_event_plan
+from tools.helper.event_summary import (
+    get_tournament_property,
+    get_team_property,
+    create_url_params,
+    create_event_data,
+    aget_tournament_property,
+    aget_team_property,
+    acreate_url_params,
+    acreate_event_data,
+)
+from tools.helper.streaming import iter_completed, collect_results, report_progress, guard_deadline, is_partial_marker
+from tools.helper.async_fetch import aiter_completed, aguard_deadline, acollect_results
+from tools.helper.deadline import tool_deadline, check_deadline, DeadlineExceeded
 
 
-def obtain_event_performance_data(
+def _iter_event_performance_data(
         parameters : List[PlayerEventParameters]
+) -> Iterator[Tuple[tuple, PlayerEventStats | dict | str]]:
+    # Overlapping parameter sets share name lookups, team scans and (event, player) statistics requests
+    plan = plan_event_queries(parameters)
+    yield from iter_event_plan(plan)
+
+def stream_event_performance_data(
+        parameters : List[PlayerEventParameters],
+        time_budget: float | None = TOOL_TIME_BUDGET
+) -> Iterator[PlayerEventStats | dict | str]:
+    """
+    Streaming variant of `obtain_event_performance_data`. Yields every `PlayerEventStats` as soon as its match is fetched.
+    """
+    with tool_deadline(time_budget):
+        for _, item in guard_deadline(_iter_event_performance_data(parameters)):
+            yield item
+
+def obtain_event_performance_data(
+        parameters : List[PlayerEventParameters],
+        time_budget: float | None = TOOL_TIME_BUDGET
 ) -> List[PlayerEventStats] | List[dict]:
     """
     Retrieve event-level statistics for multiple football players across specified parameters.
@@ -27,58 +68,59 @@ def obtain_event_performance_data(
                 "Dries Mertens": {"event_date": ("2024-11-16", "2024-12-16")},
                 "Gabriel Sara": {"tournament_name": "UEFA Europa League", "opponent_name": "Tottenham Hotspur"}
             }
+
+        time_budget (float | None): Seconds the call may spend fetching. When they run out, the finished results
+            are returned followed by a {"partial": ...} marker. None disables the limit.
             
     Returns:
         List[PlayerEventStats] | List[dict]: A list of `PlayerEventStats` objects with detailed statistics or error dictionaries for bad inputs
     """
-    all_player_stats = []
-    error_messages = []
-    
-    player_id_cache = {}
+    with tool_deadline(time_budget):
+        return collect_results(_iter_event_performance_data(parameters))
 
-    for params in parameters:
-        player_name = params.player_name
-        tournament_name = params.tournament_name
-        event_date = params.event_date
-        last_k = params.last_k
-        opponent_team_name = params.opponent_team_name
-        player_team_name = params.player_team_name
-        
-        player_id = player_id_cache.get(player_name)
-        if player_id is None:
-            player_id = get_player_property(player_name=player_name, col_name="PLAYER_ID")
-            player_id_cache[player_name] = player_id
-        
-        if isinstance(player_id,list):
-            error_messages.append({"error": {"message": "404", "parameter": "player_name", "value": player_name}})
-        elif player_id is None:
-            error_messages.append({"error": {"message": "405", "parameter": "player_name", "value": player_name}}) # Duplication
-        elif isinstance(player_id, Decimal):
-            player_id = int(player_id)
-
-        all_player_stats.extend(
-            obtain_player_event_stats(
-                player_name = player_name,
-                event_date = event_date,
-                last_k = last_k,
-                opponent_team_name = opponent_team_name,
-                player_team_name = player_team_name,
-                tournament_name = tournament_name,
-                player_id = player_id
-            )
-        )
+
+def _iter_season_performance_data(
+        parameters: List[PlayerSeasonParameters], 
+        endpoint: Literal["stats", "ratings", "both"]
+    ) -> Iterator[Tuple[tuple, PlayerSeasonStats | PlayerSeasonRatings | dict]]:
+    error_messages = []
+    jobs = []
+    if endpoint in ("stats", "both"):
+        stats_errors, stats_jobs = create_season_stats_jobs(player_stats_parameters=parameters)
+        error_messages.extend(stats_errors)
+        jobs.extend(((0,) + key, function, args) for key, function, args in stats_jobs)
+    if endpoint in ("ratings", "both"):
+        ratings_errors, ratings_jobs = create_season_ratings_jobs(player_ratings_parameters=parameters)
+        error_messages.extend(ratings_errors)
+        jobs.extend(((1,) + key, function, args) for key, function, args in ratings_jobs)
 
     if error_messages:
-        return error_messages
-    
-    #if len(all_player_stats):
-    
-    return all_player_stats
+        for position, error in enumerate(error_messages):
+            yield (position,), error
+        return
+
+    # Stats and ratings requests of every player season run on the same fetch pool
+    for key, item in iter_completed(jobs):
+        if item:
+            yield key, item
 
+def stream_season_performance_data(
+        parameters: List[PlayerSeasonParameters], 
+        endpoint: Literal["stats", "ratings", "both"],
+        time_budget: float | None = TOOL_TIME_BUDGET
+    ) -> Iterator[PlayerSeasonStats | PlayerSeasonRatings | dict]:
+    """
+    Streaming variant of `obtain_season_performance_data`. Yields every `PlayerSeasonStats` / `PlayerSeasonRatings` as soon as it is fetched.
+    """
+    with tool_deadline(time_budget):
+        for _, item in guard_deadline(_iter_season_performance_data(parameters=parameters, endpoint=endpoint)):
+            yield item
 
 def obtain_season_performance_data(
         parameters: List[PlayerSeasonParameters], 
-        endpoint: Literal["stats", "ratings", "both"]
+        endpoint: Literal["stats", "ratings", "both"],
+        time_budget: float | None = TOOL_TIME_BUDGET,
+        percentiles: bool = SEASON_PERCENTILES
     ) -> List[PlayerSeasonStats] | List[dict] | List[PlayerSeasonRatings] | Union[List[PlayerSeasonStats] , List[PlayerSeasonRatings]]:
     """
     Fetch season level data for players.
@@ -93,6 +135,12 @@ def obtain_season_performance_data(
               
         endpoint (Literal["stats", "ratings", "both"]): Specify the type of data to fetch. Defaults to "both".
 
+        time_budget (float | None): Seconds the call may spend fetching. When they run out, the finished results
+            are returned followed by a {"partial": ...} marker. None disables the limit.
+
+        percentiles (bool): Rank every season stats result within its tournament, season and position,
+            against the seasons fetched so far, and set its `percentiles`.
+
     Example:
         user query: Summarize Cole Palmer performance in Premier League.
         function parameters:
@@ -106,24 +154,19 @@ def obtain_season_performance_data(
                 endpoint: "both"
             )
     """
-    if endpoint=="both":
-        stats = obtain_multiple_player_season_stats(player_stats_parameters=parameters)
-        ratings = obtain_multiple_player_ratings(player_ratings_parameters=parameters)
-        data = stats + ratings
-        return data
-    elif endpoint=="stats":
-        stats = obtain_multiple_player_season_stats(player_stats_parameters=parameters)
-        return stats
-    elif endpoint=="ratings":
-        ratings = obtain_multiple_player_ratings(player_ratings_parameters=parameters)
-        return ratings
+    # Stats come before ratings, both in the order of the parameters
+    with tool_deadline(time_budget):
+        results = collect_results(_iter_season_performance_data(parameters=parameters, endpoint=endpoint))
+        if percentiles:
+            # The positions were requested with the season stats
+            enrich_with_percentiles(results, season_stats_snapshot(), PLAYER_POSITIONS)
+    return results
 
-
-def obtain_summary_of_event(
+def _iter_summary_of_event(
     parameters : List[EventParameters]
-) -> List[EventSummary]:
-    event_summaries = []
-    for params in parameters:
+) -> Iterator[Tuple[tuple, EventSummary]]:
+    jobs = []
+    for index, params in enumerate(parameters):
         event_date = params.event_date
         last_k = params.last_k
         home_team_name = params.home_team_name
@@ -157,19 +200,389 @@ def obtain_summary_of_event(
             table_name="dim_events"
         )
 
+        check_deadline()
+
         if not url_params:
             logger.info("Event with defined criteria is not found.")
             continue
 
         summary = True if len(url_params) > 4 else False
 
-        event_datas = []
-        for param in url_params:
-            event_data = create_event_data(param=param, summary=summary)
-            event_datas.append(event_data)
+        for position, param in enumerate(url_params):
+            jobs.append(((index, position), create_event_data, (param, summary)))
+
+    yield from iter_completed(jobs)
+
+def stream_summary_of_event(
+    parameters : List[EventParameters],
+    time_budget: float | None = TOOL_TIME_BUDGET
+) -> Iterator[EventSummary | dict]:
+    """
+    Streaming variant of `obtain_summary_of_event`. Yields every `EventSummary` as soon as its comments and lineups are fetched.
+    """
+    with tool_deadline(time_budget):
+        for _, event_data in guard_deadline(_iter_summary_of_event(parameters)):
+            yield event_data
+
+def obtain_summary_of_event(
+    parameters : List[EventParameters],
+    time_budget: float | None = TOOL_TIME_BUDGET
+) -> List[List[EventSummary] | dict]:
+    with tool_deadline(time_budget):
+        collected = []
+        for key, event_data in guard_deadline(_iter_summary_of_event(parameters)):
+            report_progress(event_data)
+            collected.append((key, event_data))
+    return _group_event_summaries(collected)
+
+def _group_event_summaries(collected: List[Tuple[tuple, EventSummary | dict]]) -> List[List[EventSummary] | dict]:
+    event_summaries = {}
+    partial = None
+    for key, event_data in collected:
+        if is_partial_marker(event_data):
+            partial = event_data
+            continue
+        index, position = key
+        event_summaries.setdefault(index, []).append((position, event_data))
+
+    # One list of summaries per parameter set, in the order of the parameters
+    results = [
+        [event_data for _, event_data in sorted(event_datas, key=lambda pair: pair[0])]
+        for _, event_datas in sorted(event_summaries.items())
+    ]
+    if partial:
+        results.append(partial)
+    return results
+
+def obtain_season_leaderboard(
+        tournament_name: str,
+        season_year: int | None,
+        stat: str,
+        k: int | None = None,
+        per_90: bool | None = None,
+        min_minutes: int | None = None,
+        position: Literal["G", "D", "M", "F"] | None = None
+) -> SeasonLeaderboard | dict:
+    """
+    Rank the players of a tournament season on one stat, from the season stats and ratings fetched so far.
+    No request is made, so players that were never looked up are not on the leaderboard.
+
+    Args:
+        tournament_name (str): Full name of the tournament, e.g. "Premier League".
+        season_year (int | None): Start year of the season. None for the latest cached season.
+        stat (str): A column of `SEASON_STAT_COLUMNS` (e.g. "goals") or a rating field (e.g. "average_rating").
+        k (int | None): Number of players. Defaults to `LEADERBOARD_SIZE`.
+        per_90 (bool | None): Rank counting stats per 90 minutes.
+        min_minutes (int | None): Minimum minutes for stat leaderboards. Defaults to `LEADERBOARD_MIN_MINUTES`.
+            Rating leaderboards require `LEADERBOARD_MIN_GAMES` rated matches instead.
+        position (str | None): Only players of this position (G, D, M or F).
+
+    Returns:
+        SeasonLeaderboard | dict: The leaderboard, or an error dictionary when the stat or the tournament season is unknown.
+    """
+    # The caches are copied under their locks, other sessions keep adding seasons while the boards are updated
+    with LEADERBOARD_INDEX.lock:
+        LEADERBOARD_INDEX.update(season_stats_snapshot(), season_ratings_snapshot(), PLAYER_POSITIONS)
+        return LEADERBOARD_INDEX.leaderboard(
+            tournament_name=tournament_name,
+            season_year=season_year,
+            stat=stat,
+            k=k or LEADERBOARD_SIZE,
+            per_90=bool(per_90),
+            min_minutes=LEADERBOARD_MIN_MINUTES if min_minutes is None else min_minutes,
+            position=position
+        )
+
+def _similarity_target(index: SimilarityIndex, player_name: str, tournament_name: str | None, season_year: int | None) -> int | None:
+    """The indexed season of the player to compare with: the latest one that matches the tournament and season."""
+    # The cache is copied under its lock, pool threads of other sessions keep adding and evicting seasons
+    with index.lock:
+        index.update(season_stats_snapshot(), PLAYER_POSITIONS, PLAYER_BIRTH_TIMESTAMPS)
+        rows = [
+            row for row in index.rows_of(player_name)
+            if (not tournament_name or (index.labels[row]["tournament_name"] or "").casefold() == tournament_name.casefold())
+            and (not season_year or index.column("season_year")[row] == season_year)
+        ]
+    if not rows:
+        return None
+    return max(rows, key=lambda row: index.column("season_year")[row])
+
+def _similar_players(
+        index: SimilarityIndex,
+        row: int,
+        k: int | None,
+        metric: str | None,
+        filters: dict
+) -> SimilarPlayers:
+    with index.lock:
+        return _query_similar_players(index, row, k, metric, filters)
+
+def _query_similar_players(
+        index: SimilarityIndex,
+        row: int,
+        k: int | None,
+        metric: str | None,
+        filters: dict
+) -> SimilarPlayers:
+    metric = metric or "cosine"
+    mask = index.mask(**filters)
+    entries = []
+    for rank, (match, score) in enumerate(index.query(row, k=k or SIMILAR_PLAYERS_COUNT, metric=metric, mask=mask), start=1):
+        label = index.labels[match]
+        entries.append({
+            "rank": rank,
+            "player_name": label["player_name"],
+            "tournament_name": label["tournament_name"],
+            "season_year": int(index.column("season_year")[match]),
+            "position": label["position"],
+            "age": index.age(match),
+            "similarity" if metric == "cosine" else "distance": score,
+        })
+
+    index.schedule_save()
+
+    label = index.labels[row]
+    return SimilarPlayers(
+        player_name=label["player_name"],
+        tournament_name=label["tournament_name"],
+        season_year=int(index.column("season_year")[row]),
+        metric=metric,
+        filters={name: value for name, value in filters.items() if value is not None},
+        seasons_considered=int(mask.sum()),
+        entries=entries,
+        info="Compared on per 90 season stats of the player seasons fetched so far, not every player of every tournament."
+    )
+
+def _similar_players_filters(
+        candidate_tournament_name: str | None,
+        candidate_season_year: int | None,
+        position: str | None,
+        min_age: int | None,
+        max_age: int | None
+) -> dict:
+    return {
+        "tournament_name": candidate_tournament_name,
+        "season_year": candidate_season_year,
+        "position": position,
+        "min_age": min_age,
+        "max_age": max_age,
+    }
+
+def _similar_players_not_found(player_name: str, fetched: List[Any]) -> dict:
+    errors = [item for item in fetched if isinstance(item, dict)]
+    return errors[0] if errors else {"error": {"message": "404", "parameter": "player_name", "value": player_name}}
+
+def obtain_similar_players(
+        player_name: str,
+        tournament_name: str | None,
+        season_year: int | None,
+        k: int | None = None,
+        metric: Literal["cosine", "euclidean"] | None = None,
+        candidate_tournament_name: str | None = None,
+        candidate_season_year: int | None = None,
+        position: Literal["G", "D", "M", "F"] | None = None,
+        min_age: int | None = None,
+        max_age: int | None = None
+) -> SimilarPlayers | dict:
+    """
+    Find the player seasons whose stat profile is closest to a season of the given player.
+
+    The season of `player_name` is fetched first when it is not in the similarity index yet. Candidates are the
+    player seasons in the index, which holds every season fetched so far and is kept on disk between runs.
+
+    Args:
+        player_name (str): The player to compare with.
+        tournament_name (str | None), season_year (int | None): Select the season of the player, the latest one when None.
+        k (int | None): Number of similar players. Defaults to `SIMILAR_PLAYERS_COUNT`.
+        metric (str | None): "cosine" (default) or "euclidean".
+        candidate_tournament_name, candidate_season_year, position, min_age, max_age: Filters on the candidates.
+
+    Returns:
+        SimilarPlayers | dict: The closest seasons, or an error dictionary when the player season cannot be found.
+    """
+    index = similarity_index()
+    row = _similarity_target(index, player_name, tournament_name, season_year)
+    if row is None:
+        parameters = [PlayerSeasonParameters(player_name=player_name, tournament_name=tournament_name, season_year=season_year, tournament_country=None)]
+        fetched = obtain_season_performance_data(parameters=parameters, endpoint="stats", percentiles=True)
+        row = _similarity_target(index, player_name, tournament_name, season_year)
+        if row is None:
+            return _similar_players_not_found(player_name, fetched)
+
+    filters = _similar_players_filters(candidate_tournament_name, candidate_season_year, position, min_age, max_age)
+    return _similar_players(index, row, k, metric, filters)
+
+
+###############################################################
+# ASYNC TOOLS
+###############################################################
+
+async def _aiter_event_performance_data(
+        parameters : List[PlayerEventParameters]
+) -> AsyncIterator[Tuple[tuple, PlayerEventStats | dict | str]]:
+    plan = await aplan_event_queries(parameters)
+    async for key, item in aiter_event_plan(plan):
+        yield key, item
+
+async def astream_event_performance_data(
+        parameters : List[PlayerEventParameters],
+        time_budget: float | None = TOOL_TIME_BUDGET
+) -> AsyncIterator[PlayerEventStats | dict | str]:
+    """Async counterpart of `stream_event_performance_data`."""
+    with tool_deadline(time_budget):
+        async for _, item in aguard_deadline(_aiter_event_performance_data(parameters)):
+            yield item
+
+async def aobtain_event_performance_data(
+        parameters : List[PlayerEventParameters],
+        time_budget: float | None = TOOL_TIME_BUDGET
+) -> List[PlayerEventStats] | List[dict]:
+    """Async counterpart of `obtain_event_performance_data`. Every request runs on the event loop."""
+    with tool_deadline(time_budget):
+        return await acollect_results(_aiter_event_performance_data(parameters))
+
+async def _aiter_season_performance_data(
+        parameters: List[PlayerSeasonParameters], 
+        endpoint: Literal["stats", "ratings", "both"]
+    ) -> AsyncIterator[Tuple[tuple, PlayerSeasonStats | PlayerSeasonRatings | dict]]:
+    job_lists = []
+    if endpoint in ("stats", "both"):
+        job_lists.append(((0,), acreate_season_stats_jobs(player_stats_parameters=parameters)))
+    if endpoint in ("ratings", "both"):
+        job_lists.append(((1,), acreate_season_ratings_jobs(player_ratings_parameters=parameters)))
+    created = await asyncio.gather(*[coroutine for _, coroutine in job_lists])
+
+    error_messages = []
+    jobs = []
+    for (prefix, _), (errors, endpoint_jobs) in zip(job_lists, created):
+        error_messages.extend(errors)
+        jobs.extend((prefix + key, function, args) for key, function, args in endpoint_jobs)
+
+    if error_messages:
+        for position, error in enumerate(error_messages):
+            yield (position,), error
+        return
+
+    async for key, item in aiter_completed(jobs):
+        if item:
+            yield key, item
+
+async def astream_season_performance_data(
+        parameters: List[PlayerSeasonParameters], 
+        endpoint: Literal["stats", "ratings", "both"],
+        time_budget: float | None = TOOL_TIME_BUDGET
+    ) -> AsyncIterator[PlayerSeasonStats | PlayerSeasonRatings | dict]:
+    """Async counterpart of `stream_season_performance_data`."""
+    with tool_deadline(time_budget):
+        async for _, item in aguard_deadline(_aiter_season_performance_data(parameters=parameters, endpoint=endpoint)):
+            yield item
+
+async def aobtain_season_performance_data(
+        parameters: List[PlayerSeasonParameters], 
+        endpoint: Literal["stats", "ratings", "both"],
+        time_budget: float | None = TOOL_TIME_BUDGET,
+        percentiles: bool = SEASON_PERCENTILES
+    ) -> List[PlayerSeasonStats] | List[dict] | List[PlayerSeasonRatings] | Union[List[PlayerSeasonStats] , List[PlayerSeasonRatings]]:
+    """Async counterpart of `obtain_season_performance_data`. Every request runs on the event loop."""
+    with tool_deadline(time_budget):
+        results = await acollect_results(_aiter_season_performance_data(parameters=parameters, endpoint=endpoint))
+        if percentiles:
+            enrich_with_percentiles(results, season_stats_snapshot(), PLAYER_POSITIONS)
+    return results
+
+async def _aevent_summary_params(params: EventParameters) -> List[dict]:
+    tournament_id, home_team_id, away_team_id = await asyncio.gather(
+        aget_tournament_property(query_value=params.tournament_name, col_name="TOURNAMENT_ID", gsi=True, key_name="TOURNAMENT_NAME") if params.tournament_name else asyncio.sleep(0),
+        aget_team_property(team_name=params.home_team_name, col_name="TEAM_ID") if params.home_team_name else asyncio.sleep(0),
+        aget_team_property(team_name=params.away_team_name, col_name="TEAM_ID") if params.away_team_name else asyncio.sleep(0)
+    )
+
+    return await acreate_url_params(
+        event_date=params.event_date,
+        last_k=params.last_k,
+        home_team_name=params.home_team_name,
+        away_team_name=params.away_team_name,
+        home_team_id=home_team_id,
+        away_team_id=away_team_id,
+        tournament_name=params.tournament_name,
+        tournament_id=tournament_id,
+        table_name="dim_events"
+    )
+
+async def _aiter_summary_of_event(
+    parameters : List[EventParameters]
+) -> AsyncIterator[Tuple[tuple, EventSummary]]:
+    all_url_params = await asyncio.gather(*[_aevent_summary_params(params) for params in parameters])
+    check_deadline()
+
+    jobs = []
+    for index, url_params in enumerate(all_url_params):
+        if not url_params:
+            logger.info("Event with defined criteria is not found.")
+            continue
+
+        summary = True if len(url_params) > 4 else False
+
+        for position, param in enumerate(url_params):
+            jobs.append(((index, position), acreate_event_data, (param, summary)))
+
+    async for key, event_data in aiter_completed(jobs):
+        yield key, event_data
+
+async def astream_summary_of_event(
+    parameters : List[EventParameters],
+    time_budget: float | None = TOOL_TIME_BUDGET
+) -> AsyncIterator[EventSummary | dict]:
+    """Async counterpart of `stream_summary_of_event`."""
+    with tool_deadline(time_budget):
+        async for _, event_data in aguard_deadline(_aiter_summary_of_event(parameters)):
+            yield event_data
+
+async def aobtain_summary_of_event(
+    parameters : List[EventParameters],
+    time_budget: float | None = TOOL_TIME_BUDGET
+) -> List[List[EventSummary] | dict]:
+    """Async counterpart of `obtain_summary_of_event`. Every request runs on the event loop."""
+    with tool_deadline(time_budget):
+        collected = []
+        async for key, event_data in aguard_deadline(_aiter_summary_of_event(parameters)):
+            report_progress(event_data)
+            collected.append((key, event_data))
+    return _group_event_summaries(collected)
 
-        event_summaries.append(event_datas)
+async def aobtain_season_leaderboard(
+        tournament_name: str,
+        season_year: int | None,
+        stat: str,
+        k: int | None = None,
+        per_90: bool | None = None,
+        min_minutes: int | None = None,
+        position: Literal["G", "D", "M", "F"] | None = None
+) -> SeasonLeaderboard | dict:
+    """Async counterpart of `obtain_season_leaderboard`. Nothing is fetched, the boards are updated in a worker thread so the event loop keeps serving."""
+    return await asyncio.to_thread(obtain_season_leaderboard, tournament_name, season_year, stat, k, per_90, min_minutes, position)
 
-    return event_summaries
-    
+async def aobtain_similar_players(
+        player_name: str,
+        tournament_name: str | None,
+        season_year: int | None,
+        k: int | None = None,
+        metric: Literal["cosine", "euclidean"] | None = None,
+        candidate_tournament_name: str | None = None,
+        candidate_season_year: int | None = None,
+        position: Literal["G", "D", "M", "F"] | None = None,
+        min_age: int | None = None,
+        max_age: int | None = None
+) -> SimilarPlayers | dict:
+    """Async counterpart of `obtain_similar_players`. A missing season of the player is fetched on the event loop."""
+    index = similarity_index()
+    row = _similarity_target(index, player_name, tournament_name, season_year)
+    if row is None:
+        parameters = [PlayerSeasonParameters(player_name=player_name, tournament_name=tournament_name, season_year=season_year, tournament_country=None)]
+        fetched = await aobtain_season_performance_data(parameters=parameters, endpoint="stats", percentiles=True)
+        row = _similarity_target(index, player_name, tournament_name, season_year)
+        if row is None:
+            return _similar_players_not_found(player_name, fetched)
 
+    filters = _similar_players_filters(candidate_tournament_name, candidate_season_year, position, min_age, max_age)
+    return _similar_players(index, row, k, metric, filters)
@@ -0,0 +1,169 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, AsyncIterator, List, Tuple
+import asyncio
+import time
+import weakref
+import httpx
+from config import *
+from tools.modules import *
+from tools.helper.deadline import DeadlineExceeded, request_timeout, remaining_time
+from tools.helper.execution_cache import execution_step
+from tools.helper.streaming import PARTIAL_KEY, report_progress, partial_marker, finish_collected
+
+
+# event loop -> {proxy: client}. httpx clients and semaphores belong to the loop they were created in.
+_CLIENTS = weakref.WeakKeyDictionary()
+_SEMAPHORES = weakref.WeakKeyDictionary()
+
+
+def _client(proxy: str | None = None) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    clients = _CLIENTS.setdefault(loop, {})
+    if proxy not in clients:
+        mounts = {"http://": httpx.AsyncHTTPTransport(proxy=proxy)} if proxy else None
+        clients[proxy] = httpx.AsyncClient(
+            mounts=mounts,
+            limits=httpx.Limits(max_connections=MAX_ASYNC_FETCHES)
+        )
+    return clients[proxy]
+
+def _semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _SEMAPHORES:
+        _SEMAPHORES[loop] = asyncio.Semaphore(MAX_ASYNC_FETCHES)
+    return _SEMAPHORES[loop]
+
+@execution_step
+async def asofascore_get(url: str, require_ok: bool = False) -> dict | None:
+    """
+    Async GET of a Sofascore API url, through the proxies when they are enabled.
+
+    Args:
+        url (str): The API url.
+        require_ok (bool): Return None instead of the body when the response status is not 200.
+    """
+    if USE_PROXIES:
+        for i, proxy in enumerate(PROXIES):
+            try:
+                start_time = time.time()  # Start the timer
+                async with _semaphore():
+                    response = await _client(proxy).get(url, timeout=request_timeout(10))
+                response_time = time.time() - start_time  # Calculate response time
+                if response.status_code == 200:
+                    print(f"Success with proxy number {i+1} : {proxy} in {response_time:.2f} seconds")
+                    return response.json()
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                await asyncio.sleep(2)  # Add delay to avoid bans
+        raise Exception("All proxies failed!")
+    else:
+        async with _semaphore():
+            response = await _client().get(url, timeout=request_timeout(10))
+        if require_ok and response.status_code != 200:
+            return None
+        return response.json()
+
+@execution_step
+async def alambda_post(url: str, payload: dict, raise_for_status: bool = False) -> Any:
+    """Async POST of a payload to the query or scan lambda."""
+    async with _semaphore():
+        response = await _client().post(url, json=payload, timeout=request_timeout(LAMBDA_TIMEOUT))
+    if raise_for_status:
+        response.raise_for_status()
+    return response.json()
+
+async def aquery_property(
+        table_name: str,
+        index_name: str,
+        query_value: Any,
+        col_name: str,
+        gsi: bool = True,
+        not_found: Any = None
+    ) -> Any:
+    """
+    Async counterpart of the `get_*_property` helpers: the value of `col_name` for the row(s) matching `query_value`.
+
+    Returns:
+        The column value for a single match, a list of values for several matches, `not_found` when nothing matches,
+        and None when the request fails.
+    """
+    payload = {
+        "table_name": table_name,
+        "index_name": index_name,
+        "operation": "eq",
+        "query_value": query_value
+    }
+    if gsi:
+        payload["gsi"] = "true"
+
+    try:
+        response = await alambda_post(QUERY_LAMBDA_URL, payload)
+
+        if 'Items' in response and len(response['Items']) > 0:
+            values = []
+            for item in response['Items']:
+                if col_name not in item:
+                    raise ValueError(f"Column '{col_name}' not found in {table_name} data.")
+                values.append(item[col_name])
+            return values[0] if len(values) == 1 else values
+        else:
+            print(f"'{query_value}' not found in {table_name}.")
+            return not_found
+
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"Error retrieving data for '{query_value}' from {table_name}: {e}")
+
+async def aiter_completed(jobs: Iterable[Tuple[Any, Callable[..., Awaitable], tuple]]) -> AsyncIterator[Tuple[Any, Any]]:
+    """
+    Async counterpart of `iter_completed`: run coroutine jobs concurrently and yield their results as they finish.
+    Outstanding requests are cancelled when the time budget runs out or the consumer stops early.
+
+    Args:
+        jobs (Iterable[Tuple[Any, Callable[..., Awaitable], tuple]]): (key, coroutine function, args) triples.
+
+    Yields:
+        Tuple[Any, Any]: (key, result) pairs in completion order.
+
+    Raises:
+        DeadlineExceeded: When the time budget runs out before every job finished.
+    """
+    tasks = {asyncio.ensure_future(function(*args)): key for key, function, args in jobs}
+    pending = set(tasks)
+    try:
+        while pending:
+            timeout = remaining_time()
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded(pending=len(pending))
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(pending=len(pending))
+            for task in done:
+                try:
+                    result = task.result()
+                except DeadlineExceeded:
+                    raise DeadlineExceeded(pending=len(pending))
+                yield tasks[task], result
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def aguard_deadline(results: AsyncIterator[Tuple[tuple, Any]]) -> AsyncIterator[Tuple[tuple, Any]]:
+    """Async counterpart of `guard_deadline`."""
+    completed = 0
+    try:
+        async for key, item in results:
+            completed += 1
+            yield key, item
+    except DeadlineExceeded as e:
+        logger.info(f"Tool call ran out of time after {completed} results, {e.pending} requests cancelled.")
+        yield PARTIAL_KEY, partial_marker(completed=completed, cancelled=e.pending)
+
+async def acollect_results(results: AsyncIterator[Tuple[tuple, Any]]) -> List[Any]:
+    """Async counterpart of `collect_results`."""
+    collected = []
+    async for key, item in aguard_deadline(results):
+        report_progress(item)
+        collected.append((key, item))
+    return finish_collected(collected)
@@ -0,0 +1,241 @@
+from typing import Any, Callable, Dict, List, Sequence
+import asyncio
+import functools
+import json
+from config import *
+from tools.modules import *
+from graph.utils import count_tokens
+from tools.helper.stats_frame import StatsFrame, season_comparison_frame, event_comparison_frame, derived_columns
+from tools.helper.streaming import is_complete
+
+
+# Stat groups kept in compact outputs for every Sofascore position code. Unknown positions keep every group.
+POSITION_STAT_GROUPS = {
+    "G": ("appearances", "goalkeeping", "passing", "discipline"),
+    "D": ("appearances", "defending", "possession", "passing", "creativity", "discipline"),
+    "M": ("appearances", "creativity", "passing", "possession", "scoring", "defending", "discipline"),
+    "F": ("appearances", "scoring", "creativity", "possession", "discipline"),
+}
+
+# Counting stats whose per 90 rates (season) and team shares (match) are added when several results are compared
+SEASON_COMPARISON_COLUMNS = (
+    "goals", "expectedGoals", "assists", "expectedAssists", "totalShots", "keyPasses", "successfulDribbles", "tackles", "interceptions",
+)
+EVENT_COMPARISON_COLUMNS = ("goals", "expectedGoals", "goalAssist", "keyPass", "totalPass", "duelWon", "totalTackle")
+
+# Season fields of `PlayerSeasonRatings` in the order of the ratings table
+RATING_COLUMNS = (
+    "game_count", "average_rating", "rating_std_dev", "big_game_count", "average_big_game_rating",
+    "form_last_5", "form_last_10", "form_ewma", "form_trend",
+)
+
+FORMAT_NOTE = "Tables are '|' separated with a header row. Stats that are missing or 0 are left out."
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, float):
+        return f"{round(value, 2):g}"
+    return str(value).replace("|", "/").replace("\n", " ")
+
+def is_empty(value: Any, drop_zeros: bool = True) -> bool:
+    """Nulls, zeros and nested values (like `ratingVersions`) are not worth a column."""
+    return value is None or value == "" or (drop_zeros and value == 0) or isinstance(value, (dict, list))
+
+def render_table(rows: List[Dict[str, Any]], label_columns: Sequence[str], stat_columns: Sequence[str], drop_zeros: bool = True) -> List[str]:
+    """
+    Rows as a '|' separated table. Columns are kept when at least one row has a value other than null
+    (or 0, unless `drop_zeros` is False) for them; empty cells stay empty.
+    """
+    columns = [
+        column for column in list(label_columns) + list(stat_columns)
+        if any(not is_empty(row.get(column), drop_zeros) for row in rows)
+    ]
+    lines = ["|".join(columns)]
+    for row in rows:
+        lines.append("|".join("" if is_empty(row.get(column), drop_zeros) else format_value(row.get(column)) for column in columns))
+    return lines
+
+def stat_columns(groups: Dict[str, tuple], positions: Sequence[str | None]) -> List[str]:
+    """The columns of the stat groups relevant for the positions in a table, in schema order."""
+    if not positions or any(position not in POSITION_STAT_GROUPS for position in positions):
+        selected = set(groups)
+    else:
+        selected = {group for position in positions for group in POSITION_STAT_GROUPS[position]}
+    return [column for name, group in groups.items() if name in selected for column in group]
+
+def compact_event_stats(results: List[PlayerEventStats]) -> List[str]:
+    rows = []
+    for item in results:
+        row = {
+            "player": item.player_name,
+            "date": item.event_date,
+            "tournament": item.tournament_name,
+            "team": item.player_team_name,
+            "opponent": item.opponent_team_name,
+            "venue": None if item.is_home is None else ("home" if item.is_home else "away"),
+            "score": None if item.player_team_score is None else f"{item.player_team_score}-{item.opponent_team_score}",
+            "result": item.match_result,
+            "played": "yes" if item.stats else "no",
+        }
+        row.update(item.stats or {})
+        rows.append(row)
+    # Event stats carry no position, the empty columns of outfielders drop the goalkeeping stats anyway
+    labels = ("player", "date", "tournament", "team", "opponent", "venue", "score", "result", "played")
+    lines = ["event stats:"] + render_table(rows, labels, stat_columns(EVENT_STAT_GROUPS, []))
+    if COMPARISON_METRICS and len(results) > 1:
+        frame = event_comparison_frame(results, EVENT_COMPARISON_COLUMNS)
+        lines += ["event ratios and shares of the team total in the match (between 0 and 1):"]
+        lines += compact_derived_metrics(frame, {"player_name": "player", "event_date": "date", "player_team_name": "team"})
+    return lines
+
+def compact_season_stats(results: List[PlayerSeasonStats]) -> List[str]:
+    rows = []
+    percentile_rows = []
+    for item in results:
+        label = {"player": item.player_name, "tournament": item.tournament_name, "season": item.season_year, "position": item.position}
+        rows.append({**label, **(item.stats or {})})
+        if item.percentiles:
+            percentile_rows.append({**label, "sample_size": item.percentiles["sample_size"], **item.percentiles["values"]})
+
+    labels = ("player", "tournament", "season", "position")
+    columns = stat_columns(SEASON_STAT_GROUPS, [item.position for item in results])
+    lines = ["season stats:"] + render_table(rows, labels, columns)
+    if percentile_rows:
+        percentile_columns = [column for column in columns if column in PERCENTILE_STAT_COLUMNS]
+        lines += ["season percentiles within tournament, season and position (per 90 for counting stats):"]
+        lines += render_table(percentile_rows, labels + ("sample_size",), percentile_columns, drop_zeros=False)
+    if COMPARISON_METRICS and len(results) > 1:
+        frame = season_comparison_frame(results, SEASON_COMPARISON_COLUMNS)
+        lines += ["season per 90 rates and ratios:"]
+        lines += compact_derived_metrics(frame, {"player_name": "player", "tournament_name": "tournament", "season_year": "season"})
+    return lines
+
+def compact_derived_metrics(frame: StatsFrame, labels: Dict[str, str]) -> List[str]:
+    """The derived columns of a comparison frame as a table, with its labels renamed like the stats table above it."""
+    columns = derived_columns(frame)
+    rows = [{labels.get(name, name): value for name, value in record.items()} for record in frame.select(columns).to_records()]
+    return render_table(rows, tuple(labels.values()), columns)
+
+def compact_season_ratings(results: List[PlayerSeasonRatings]) -> List[str]:
+    rows = []
+    for item in results:
+        row = {"player": item.player_name, "tournament": item.tournament_name, "season": item.season_year, "info": item.info,
+               **{column: getattr(item, column) for column in RATING_COLUMNS}}
+        for band, summary in (item.opponent_band_ratings or {}).items():
+            row[f"vs_{band}"] = f"{format_value(summary['average_rating'])} ({summary['games']})"
+        rows.append(row)
+    band_columns = [f"vs_{band}" for band in TEAM_STRENGTH_BANDS]
+    lines = ["season ratings (vs_<band>: average rating (games) against opponents of that strength band):"]
+    return lines + render_table(rows, ("player", "tournament", "season", "info"), RATING_COLUMNS + tuple(band_columns))
+
+def compact_leaderboard(leaderboard: SeasonLeaderboard) -> List[str]:
+    stat = f"{leaderboard.stat} per 90" if leaderboard.per_90 else leaderboard.stat
+    filters = [
+        f"{name} {value}" for name, value in
+        (("min minutes", leaderboard.min_minutes), ("min games", leaderboard.min_games), ("position", leaderboard.position))
+        if value
+    ]
+    lines = [f"leaderboard: {stat}, {leaderboard.tournament_name} {leaderboard.season_year}, {', '.join(filters + [f'{leaderboard.players_considered} players considered'])}"]
+    if leaderboard.info:
+        lines.append(leaderboard.info)
+    return lines + render_table(leaderboard.entries, ("rank", "player_name", "position", "value", "minutes", "games"), (), drop_zeros=False)
+
+def compact_similar_players(similar: SimilarPlayers) -> List[str]:
+    filters = [f"{name} {value}" for name, value in (similar.filters or {}).items()]
+    lines = [f"players similar to {similar.player_name}, {similar.tournament_name} {similar.season_year} ({similar.metric}), "
+             f"{', '.join(filters + [f'{similar.seasons_considered} seasons considered'])}"]
+    if similar.info:
+        lines.append(similar.info)
+    columns = ("rank", "player_name", "tournament_name", "season_year", "position", "age", "similarity", "distance")
+    return lines + render_table(similar.entries, columns, (), drop_zeros=False)
+
+def compact_event_summary(summary: EventSummary) -> List[str]:
+    lines = [f"match: {summary.home_team} {summary.home_team_score}-{summary.away_team_score} {summary.away_team}, winner: {summary.winner}"]
+    for team, squad in ((summary.home_team, summary.home_team_squad), (summary.away_team, summary.away_team_squad)):
+        for part in ("starting", "bench", "missing"):
+            if squad.get(part):
+                lines.append(f"{team} {part}: {', '.join(squad[part])}")
+    for comment in summary.comments:
+        lines.append(f"{comment['minute']}' {comment['incident_type']}: {format_value(comment['text'])}")
+    return lines
+
+def compact_tool_output(result: Any) -> str:
+    """
+    Serialize a tool result for the `ToolMessage`: typed results as tables or terse lines, in the order of
+    the result, errors and the partial marker as JSON lines.
+    """
+    if isinstance(result, str):
+        return result
+
+    items = []
+    for item in (result if isinstance(result, list) else [result]):
+        # Event summaries come as one list per parameter set
+        items.extend(item if isinstance(item, list) else [item])
+
+    lines = [FORMAT_NOTE]
+    run = []
+    for item in items + [None]:
+        if run and (item is None or type(item) is not type(run[0])):
+            if isinstance(run[0], PlayerEventStats):
+                lines += compact_event_stats(run)
+            elif isinstance(run[0], PlayerSeasonStats):
+                lines += compact_season_stats(run)
+            elif isinstance(run[0], PlayerSeasonRatings):
+                lines += compact_season_ratings(run)
+            run = []
+        if item is None:
+            continue
+        if isinstance(item, (PlayerEventStats, PlayerSeasonStats, PlayerSeasonRatings)):
+            run.append(item)
+        elif isinstance(item, EventSummary):
+            lines += compact_event_summary(item)
+        elif isinstance(item, SeasonLeaderboard):
+            lines += compact_leaderboard(item)
+        elif isinstance(item, SimilarPlayers):
+            lines += compact_similar_players(item)
+        elif isinstance(item, str):
+            lines.append(item)
+        else:
+            lines.append(json.dumps(item, ensure_ascii=False, default=str))
+    return "\n".join(lines)
+
+def report_compaction(tool_name: str, result: Any, compact: str):
+    """Log the token count of the compact output against the string `ToolNode` would have built."""
+    try:
+        original_tokens = count_tokens(str(result))
+        compact_tokens = count_tokens(compact)
+    except Exception as e:
+        print(f"Token count of {tool_name} failed: {e}")
+        return
+    saved = 1 - compact_tokens / original_tokens if original_tokens else 0
+    logger.info(f"{tool_name}: {original_tokens} -> {compact_tokens} tokens ({saved:.0%} saved)")
+
+def compacted(function: Callable, tool_name: str) -> Callable:
+    """
+    Wrap a tool function so its result reaches `ToolNode` as a compact string, with `{"complete": bool}` as the
+    artifact of the tool message. The tools are built with `response_format="content_and_artifact"`; the flag is
+    taken from the structured result, the tool memo keeps no result with errors or a partial marker.
+    Works for sync and async functions.
+    """
+    def compact(result):
+        artifact = {"complete": is_complete(result)}
+        if not COMPACT_TOOL_OUTPUT:
+            return result, artifact
+        output = compact_tool_output(result)
+        report_compaction(tool_name, result, output)
+        return output, artifact
+
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            return compact(await function(*args, **kwargs))
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return compact(function(*args, **kwargs))
+    return wrapper
@@ -0,0 +1,78 @@
+from typing import Optional
+from contextlib import contextmanager
+from dataclasses import dataclass
+import contextvars
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the time budget of a tool call runs out."""
+    def __init__(self, message: str = "Time budget of the tool call ran out.", pending: int = 0):
+        super().__init__(message)
+        self.pending = pending
+
+@dataclass
+class Deadline:
+    expires_at: float
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(expires_at=time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+# The deadline of the tool call that is running in this context. The fetch pool copies it into its worker threads.
+CURRENT_DEADLINE = contextvars.ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def tool_deadline(seconds: Optional[float]):
+    """
+    Bound every fetch made inside the context to `seconds` in total. None keeps the surrounding deadline, if any.
+    A nested budget never extends the deadline of an outer one.
+    """
+    if seconds is None:
+        yield CURRENT_DEADLINE.get()
+        return
+
+    deadline = Deadline.after(seconds)
+    outer = CURRENT_DEADLINE.get()
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+
+    token = CURRENT_DEADLINE.set(deadline)
+    try:
+        yield deadline
+    finally:
+        CURRENT_DEADLINE.reset(token)
+
+def remaining_time() -> Optional[float]:
+    deadline = CURRENT_DEADLINE.get()
+    if deadline is None:
+        return None
+    return max(deadline.remaining(), 0)
+
+def check_deadline():
+    deadline = CURRENT_DEADLINE.get()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded()
+
+def request_timeout(default: float) -> float:
+    """
+    The timeout for the next HTTP request: the default, cut down to the time left in the current budget.
+
+    Raises:
+        DeadlineExceeded: When the budget has already run out, so the request is not started at all.
+    """
+    deadline = CURRENT_DEADLINE.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return min(default, remaining)
@@ -0,0 +1,533 @@
+from typing import Dict, List, Union, Optional, Tuple, Any, Iterator, AsyncIterator
+import asyncio
+from decimal import Decimal
+from datetime import datetime
+from dataclasses import dataclass, field
+from config import *
+from tools.modules import *
+from tools.helper.event_stats import (
+    get_player_property,
+    get_team_property,
+    get_tournament_property,
+    create_events_scan_payload,
+    scan_events,
+    annotate_event_param,
+    select_last_k,
+    request_player_event_stats,
+    parse_lineup_player_stats,
+    build_player_event_stats,
+    build_squad_event_stats,
+    aget_player_property,
+    aget_team_property,
+    aget_tournament_property,
+    ascan_events,
+    arequest_player_event_stats,
+)
+from tools.helper.event_summary import request_event_lineups, arequest_event_lineups
+from tools.helper.streaming import iter_completed, collect_results
+from tools.helper.async_fetch import aiter_completed
+from tools.helper.deadline import check_deadline
+from tools.helper.execution_cache import current_execution_cache
+
+
+@dataclass
+class EventQuery:
+    """A single `PlayerEventParameters` after name resolution and date normalization."""
+    index: int
+    player_name: str = None
+    # No player name: every player of `player_team_id` who played in the matched events
+    squad: bool = False
+    player_id: int = None
+    player_team_id: int = None
+    player_team_name: str = None
+    opponent_team_id: int = None
+    opponent_team_name: str = None
+    tournament_id: int = None
+    tournament_name: str = None
+    date_range: Tuple[str, str] = None
+    last_k: int = None
+    errors: List[Any] = field(default_factory=list)
+
+@dataclass
+class TeamScan:
+    """One `dim_events` scan that serves every query of the same team."""
+    player_team_id: int
+    queries: List[EventQuery] = field(default_factory=list)
+    event_date: Tuple[str, str] = None
+    opponent_team_id: int = None
+    tournament_id: int = None
+    events: List[dict] = None
+
+@dataclass
+class EventQueryPlan:
+    queries: List[EventQuery]
+    scans: Dict[int, TeamScan]
+    tournament_names: Dict[int, str] = field(default_factory=dict)
+
+
+def _as_int(value):
+    if isinstance(value, (Decimal, float)):
+        return int(value)
+    if isinstance(value, list):
+        # Several rows share the name, any of them may match
+        return tuple(_as_int(item) for item in value)
+    return value
+
+def _id_matches(expected, actual) -> bool:
+    if isinstance(expected, tuple):
+        return actual in expected
+    return actual == expected
+
+def normalize_event_date(event_date: str | Tuple[str,str] | List[str] | None) -> Tuple[str, str] | None:
+    """
+    Normalize a single date or a date range to a zero padded (start, end) tuple so ranges can be compared as strings.
+    """
+    if not event_date:
+        return None
+    if isinstance(event_date, str):
+        event_date = (event_date, event_date)
+    elif isinstance(event_date, tuple | list):
+        if len(event_date) != 2:
+            raise ValueError(f"Event date list or tuple should have exactly two values. One start date, one end date. This one has {len(event_date)} values.")
+    else:
+        raise ValueError(f"Event date type can be either str, tuple, or list. Retrieved an event_date object of type {type(event_date)}")
+
+    start, end = sorted(datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m-%d') for date in event_date)
+    return (start, end)
+
+def _shared_value(values: List[Any]) -> Any:
+    """Return the single id every query agrees on, or None when they differ."""
+    unique = set(values)
+    if len(unique) == 1:
+        value = unique.pop()
+        if not isinstance(value, tuple):
+            return value
+    return None
+
+def _merge_date_ranges(ranges: List[Tuple[str, str] | None]) -> Tuple[str, str] | None:
+    """Return the hull of all date ranges, or None when one of the queries is not date bounded."""
+    if any(date_range is None for date_range in ranges):
+        return None
+    return (min(start for start, _ in ranges), max(end for _, end in ranges))
+
+def plan_event_queries(parameters: List[PlayerEventParameters]) -> EventQueryPlan:
+    """
+    Normalize a list of `PlayerEventParameters` and merge them into one `dim_events` scan per team.
+
+    Player, team and tournament names are resolved once per distinct name. Queries of players from
+    the same team share a single scan whose filters are the widest filters all of them agree on;
+    each query narrows the scanned events down locally in `execute_event_plan`. A parameter set without a
+    player name asks for the whole squad of `player_team_name`, read from the `lineups` of every matched event.
+
+    Args:
+        parameters (List[PlayerEventParameters]): The parameters of the tool call.
+
+    Returns:
+        EventQueryPlan: The resolved queries and the scans that serve them.
+    """
+    player_cache = {}
+    team_cache = {}
+    tournament_cache = {}
+
+    for params in parameters:
+        player_name = (params.player_name or "").strip()
+        if player_name and player_name not in player_cache:
+            player_cache[player_name] = (
+                get_player_property(player_name=player_name, col_name="PLAYER_ID"),
+                get_player_property(player_name=player_name, col_name="TEAM_ID")
+            )
+        if not player_name and params.player_team_name and params.player_team_name not in team_cache:
+            team_cache[params.player_team_name] = get_team_property(team_name=params.player_team_name, col_name="TEAM_ID")
+        if params.opponent_team_name and params.opponent_team_name not in team_cache:
+            team_cache[params.opponent_team_name] = get_team_property(team_name=params.opponent_team_name, col_name="TEAM_ID")
+        if params.tournament_name and params.tournament_name not in tournament_cache:
+            tournament_cache[params.tournament_name] = get_tournament_property(query_value=params.tournament_name, col_name="TOURNAMENT_ID", gsi=True, key_name="TOURNAMENT_NAME")
+
+        check_deadline()
+
+    return build_event_plan(parameters, player_cache, team_cache, tournament_cache)
+
+def build_event_plan(
+        parameters: List[PlayerEventParameters],
+        player_cache: Dict[str, tuple],
+        team_cache: Dict[str, Any],
+        tournament_cache: Dict[str, Any]
+    ) -> EventQueryPlan:
+    """
+    Build an `EventQueryPlan` from names that are already resolved.
+
+    Args:
+        player_cache (Dict[str, tuple]): Player name -> (PLAYER_ID, TEAM_ID).
+        team_cache (Dict[str, Any]): Opponent team name, and team name of the squad queries -> TEAM_ID.
+        tournament_cache (Dict[str, Any]): Tournament name -> TOURNAMENT_ID.
+    """
+    queries = []
+    for index, params in enumerate(parameters):
+        player_name = (params.player_name or "").strip() or None
+        query = EventQuery(
+            index=index,
+            player_name=player_name,
+            squad=player_name is None,
+            player_team_name=params.player_team_name,
+            opponent_team_name=params.opponent_team_name,
+            tournament_name=params.tournament_name,
+            last_k=params.last_k
+        )
+        queries.append(query)
+
+        if query.squad:
+            if not params.player_team_name:
+                query.errors.append("[Tool Error]: Either player_name or player_team_name must be given. player_team_name alone returns the whole squad.")
+                continue
+            player_team_id = team_cache[params.player_team_name]
+            if not player_team_id or isinstance(player_team_id, list):
+                query.errors.append(f"[Tool Error]: Team '{params.player_team_name}' not found in the database.")
+                continue
+            query.player_team_id = _as_int(player_team_id)
+        else:
+            player_id, player_team_id = player_cache[player_name]
+
+            if isinstance(player_id, list):
+                query.errors.append({"error": {"message": "404", "parameter": "player_name", "value": player_name}})
+                continue
+            elif not player_id:
+                query.errors.append({"error": {"message": "405", "parameter": "player_name", "value": player_name}}) # Duplication
+                continue
+            query.player_id = int(player_id)
+
+            if not player_team_id or isinstance(player_team_id, list):
+                query.errors.append(f"[Tool Error]: Team of player '{player_name}' could not be found in the database.")
+                continue
+            query.player_team_id = _as_int(player_team_id)
+
+        if params.opponent_team_name:
+            opponent_team_id = team_cache[params.opponent_team_name]
+            if opponent_team_id == False:
+                query.errors.append(f"[Tool Error]: Team '{params.opponent_team_name}' not found in the database.")
+            query.opponent_team_id = _as_int(opponent_team_id)
+
+        if params.tournament_name:
+            tournament_id = tournament_cache[params.tournament_name]
+            if tournament_id == False:
+                query.errors.append(f"[Tool Error]: Team '{params.tournament_name}' not found in the database.")
+            query.tournament_id = _as_int(tournament_id)
+
+        query.date_range = normalize_event_date(params.event_date)
+
+    scans = {}
+    for query in queries:
+        if query.errors:
+            continue
+        scans.setdefault(query.player_team_id, TeamScan(player_team_id=query.player_team_id)).queries.append(query)
+
+    for scan in scans.values():
+        scan.event_date = _merge_date_ranges([query.date_range for query in scan.queries])
+        scan.opponent_team_id = _shared_value([query.opponent_team_id for query in scan.queries])
+        scan.tournament_id = _shared_value([query.tournament_id for query in scan.queries])
+
+    plan = EventQueryPlan(queries=queries, scans=scans)
+    for name, tournament_id in tournament_cache.items():
+        if tournament_id and not isinstance(tournament_id, list):
+            plan.tournament_names[_as_int(tournament_id)] = name
+
+    logger.info(f"Event query plan: {len(parameters)} parameter sets, {len(scans)} team scans.")
+    return plan
+
+def _query_matches_event(query: EventQuery, event: dict) -> bool:
+    home_team_id, away_team_id = _as_int(event["HOME_TEAM_ID"]), _as_int(event["AWAY_TEAM_ID"])
+    if query.player_team_id not in (home_team_id, away_team_id):
+        return False
+    if query.opponent_team_id:
+        opponent_team_id = away_team_id if home_team_id == query.player_team_id else home_team_id
+        if not _id_matches(query.opponent_team_id, opponent_team_id):
+            return False
+    if query.tournament_id and not _id_matches(query.tournament_id, _as_int(event.get("TOURNAMENT_ID"))):
+        return False
+    if query.date_range:
+        start, end = query.date_range
+        if not start <= event["EVENT_DATE"] <= end:
+            return False
+    return True
+
+def _tournament_name(plan: EventQueryPlan, query: EventQuery, event: dict) -> str:
+    if query.tournament_name:
+        return query.tournament_name
+    tournament_id = _as_int(event.get("TOURNAMENT_ID"))
+    if tournament_id not in plan.tournament_names:
+        plan.tournament_names[tournament_id] = get_tournament_property(query_value=tournament_id, col_name="TOURNAMENT_NAME", key_name="TOURNAMENT_ID", gsi=False)
+    return plan.tournament_names[tournament_id]
+
+def _lineup_player_stats(lineups: dict | None, player_ids: List[int]) -> Dict[int, dict] | None:
+    lineup_stats = parse_lineup_player_stats(lineups)
+    if lineup_stats is None:
+        return None
+    return {
+        player_id: lineup_stats.get(player_id, {"error": {"code": 404, "message": "Player is not in the lineups."}})
+        for player_id in player_ids
+    }
+
+def _fetch_event_player_stats(event_id, player_ids: List[int], cache: bool, squad: bool = False) -> Tuple[Dict[int, dict], dict | None]:
+    """
+    Fetch the statistics of the requested players of one event, with one lineups request when several players or
+    a squad are requested. Returns the statistics by player id and the lineups response the squad queries read.
+    """
+    if squad or len(player_ids) >= LINEUPS_STATS_MIN_PLAYERS:
+        lineups = request_event_lineups(event_id=event_id, cache=cache)
+        player_stats = _lineup_player_stats(lineups, player_ids)
+        if player_stats is not None:
+            return player_stats, lineups
+    return {player_id: request_player_event_stats(player_id, event_id) for player_id in player_ids}, None
+
+def _plan_errors(plan: EventQueryPlan) -> Iterator[Tuple[tuple, dict | str]]:
+    error_messages = [error for query in plan.queries for error in query.errors if isinstance(error, dict)]
+    if error_messages:
+        for position, error in enumerate(error_messages):
+            yield (position,), error
+        return
+
+    for query in plan.queries:
+        for position, error in enumerate(query.errors):
+            yield (query.index, -1, position), error
+
+def _has_unresolved_players(plan: EventQueryPlan) -> bool:
+    return any(isinstance(error, dict) for query in plan.queries for error in query.errors)
+
+def _scan_payloads(plan: EventQueryPlan) -> Dict[int, dict]:
+    return {
+        team_id: create_events_scan_payload(
+            player_team_id=scan.player_team_id,
+            opponent_team_id=scan.opponent_team_id,
+            event_date=scan.event_date,
+            tournament_id=scan.tournament_id,
+            table_name="dim_events"
+        )
+        for team_id, scan in plan.scans.items()
+    }
+
+def _scan_key(team_id: int) -> str:
+    return f"team_scan:{team_id}"
+
+def _scan_covers(previous: dict, scan: TeamScan) -> bool:
+    """An earlier scan holds every event of `scan` when its filters are the same or wider and its dates contain the new ones."""
+    if previous["opponent_team_id"] not in (None, scan.opponent_team_id):
+        return False
+    if previous["tournament_id"] not in (None, scan.tournament_id):
+        return False
+    if previous["event_date"] is None:
+        return True
+    return scan.event_date is not None and previous["event_date"][0] <= scan.event_date[0] and scan.event_date[1] <= previous["event_date"][1]
+
+def _reuse_scans(plan: EventQueryPlan):
+    """
+    Serve the scans of an edited tool call from the scans of the earlier run of the thread that contain them, e.g. a
+    shorter date range or an added opponent. The queries filter the reused events themselves, see `_query_matches_event`.
+    """
+    cache = current_execution_cache()
+    if cache is None:
+        return
+    for team_id, scan in plan.scans.items():
+        for previous in cache.get(_scan_key(team_id), []):
+            if _scan_covers(previous, scan):
+                scan.events = previous["events"]
+                logger.info(f"Team scan of {team_id} served from an earlier scan of {previous['event_date']}.")
+                break
+
+def _remember_scans(plan: EventQueryPlan, scanned: List[int]):
+    cache = current_execution_cache()
+    if cache is None:
+        return
+    for team_id in scanned:
+        scan = plan.scans[team_id]
+        if not scan.events:
+            continue
+        previous = cache.get(_scan_key(team_id), [])
+        previous.insert(0, {
+            "event_date": scan.event_date,
+            "opponent_team_id": scan.opponent_team_id,
+            "tournament_id": scan.tournament_id,
+            "events": scan.events
+        })
+        cache.put(_scan_key(team_id), previous[:EXECUTION_CACHE_SCANS_PER_TEAM])
+
+def _group_event_fetches(plan: EventQueryPlan) -> Tuple[Dict[Any, dict], Dict[Any, set], Dict[Any, list], set]:
+    """
+    Group the distinct (event, player) pairs of the scanned events by event, remembering which query positions wait for each event.
+
+    Returns:
+        (event rows, player ids to fetch, (query, position) waiters), each keyed by event id, and the ids of the
+        events a squad query waits for.
+    """
+    query_events = {}
+    for scan in plan.scans.values():
+        for query in scan.queries:
+            events = [event for event in scan.events if _query_matches_event(query, event)]
+            query_events[query.index] = select_last_k(events, query.last_k)
+
+    event_rows = {}
+    event_players = {}
+    event_waiters = {}
+    event_squads = set()
+    for query in plan.queries:
+        for position, event in enumerate(query_events.get(query.index, [])):
+            event_rows[event["EVENT_ID"]] = event
+            player_ids = event_players.setdefault(event["EVENT_ID"], set())
+            if query.squad:
+                event_squads.add(event["EVENT_ID"])
+            else:
+                player_ids.add(query.player_id)
+            event_waiters.setdefault(event["EVENT_ID"], []).append((query, position))
+
+    logger.info(f"Event query plan fetches {sum(len(player_ids) for player_ids in event_players.values())} distinct (event, player) statistics and {len(event_squads)} squads in {len(event_rows)} matches.")
+    return event_rows, event_players, event_waiters, event_squads
+
+def _fan_out(plan: EventQueryPlan, event: dict, waiters: list, player_stats: Dict[int, dict], lineups: dict | None) -> Iterator[Tuple[tuple, PlayerEventStats | str]]:
+    for query, position in waiters:
+        if query.squad:
+            squad_stats = build_squad_event_stats(
+                event=event,
+                response=lineups,
+                player_team_id=query.player_team_id,
+                player_team_name=query.player_team_name,
+                opponent_team_name=query.opponent_team_name,
+                tournament_name=_tournament_name(plan, query, event)
+            )
+            if squad_stats is None:
+                yield (query.index, position, 0), f"The lineups of {event['HOME_TEAM_NAME']} - {event['AWAY_TEAM_NAME']} ({event['EVENT_DATE']}) are not available."
+            for rank, item in enumerate(squad_stats or []):
+                yield (query.index, position, rank), item
+            continue
+        param = annotate_event_param(
+            event=dict(event),
+            player_id=query.player_id,
+            player_team_id=query.player_team_id,
+            player_team_name=query.player_team_name,
+            opponent_team_name=query.opponent_team_name,
+            tournament_name=_tournament_name(plan, query, event)
+        )
+        yield (query.index, position, 0), build_player_event_stats(
+            player_name=query.player_name,
+            param=param,
+            stats=player_stats[query.player_id]
+        )
+
+def iter_event_plan(plan: EventQueryPlan) -> Iterator[Tuple[tuple, PlayerEventStats | dict | str]]:
+    """
+    Run the scans of an `EventQueryPlan`, fetch every distinct (event_id, player_id) statistics once,
+    and yield the results of every query as soon as the match they belong to is fetched.
+
+    Yields:
+        Tuple[tuple, PlayerEventStats | dict | str]: (order key, result) pairs. Sorting by the key restores
+            the order of the original parameters. Only error dictionaries are yielded when a player could not be resolved.
+    """
+    yield from _plan_errors(plan)
+    if _has_unresolved_players(plan):
+        return
+
+    _reuse_scans(plan)
+    scan_jobs = [(team_id, scan_events, (payload,)) for team_id, payload in _scan_payloads(plan).items() if plan.scans[team_id].events is None]
+    for team_id, events in iter_completed(scan_jobs):
+        plan.scans[team_id].events = events
+    _remember_scans(plan, [team_id for team_id, _, _ in scan_jobs])
+
+    check_deadline()
+
+    event_rows, event_players, event_waiters, event_squads = _group_event_fetches(plan)
+    fetch_jobs = [
+        (event_id, _fetch_event_player_stats, (event_id, sorted(player_ids), bool(event_rows[event_id].get("WINNER_CODE")), event_id in event_squads))
+        for event_id, player_ids in event_players.items()
+    ]
+
+    for event_id, (player_stats, lineups) in iter_completed(fetch_jobs):
+        yield from _fan_out(plan, event_rows[event_id], event_waiters[event_id], player_stats, lineups)
+
+def execute_event_plan(plan: EventQueryPlan) -> List[PlayerEventStats] | List[dict]:
+    """
+    Run an `EventQueryPlan` and return its results in the order of the original parameters.
+
+    Returns:
+        List[PlayerEventStats] | List[dict]: The same output `obtain_event_performance_data` always returned;
+            error dictionaries replace the results when a player could not be resolved.
+    """
+    return collect_results(iter_event_plan(plan))
+
+
+###############################################################
+# ASYNC FETCH
+###############################################################
+
+async def aplan_event_queries(parameters: List[PlayerEventParameters]) -> EventQueryPlan:
+    """
+    Async counterpart of `plan_event_queries`. Every distinct name is resolved concurrently.
+    """
+    player_names = list({params.player_name.strip() for params in parameters if params.player_name and params.player_name.strip()})
+    team_names = list(
+        {params.opponent_team_name for params in parameters if params.opponent_team_name}
+        | {params.player_team_name for params in parameters if params.player_team_name and not (params.player_name or "").strip()}
+    )
+    tournament_names = list({params.tournament_name for params in parameters if params.tournament_name})
+
+    resolved = await asyncio.gather(
+        *[aget_player_property(player_name=name, col_name="PLAYER_ID") for name in player_names],
+        *[aget_player_property(player_name=name, col_name="TEAM_ID") for name in player_names],
+        *[aget_team_property(team_name=name, col_name="TEAM_ID") for name in team_names],
+        *[aget_tournament_property(query_value=name, col_name="TOURNAMENT_ID", gsi=True, key_name="TOURNAMENT_NAME") for name in tournament_names]
+    )
+    player_ids = resolved[:len(player_names)]
+    player_team_ids = resolved[len(player_names):2 * len(player_names)]
+    team_ids = resolved[2 * len(player_names):2 * len(player_names) + len(team_names)]
+    tournament_ids = resolved[2 * len(player_names) + len(team_names):]
+
+    check_deadline()
+
+    return build_event_plan(
+        parameters,
+        player_cache=dict(zip(player_names, zip(player_ids, player_team_ids))),
+        team_cache=dict(zip(team_names, team_ids)),
+        tournament_cache=dict(zip(tournament_names, tournament_ids))
+    )
+
+async def _afetch_event_player_stats(event_id, player_ids: List[int], cache: bool, squad: bool = False) -> Tuple[Dict[int, dict], dict | None]:
+    if squad or len(player_ids) >= LINEUPS_STATS_MIN_PLAYERS:
+        lineups = await arequest_event_lineups(event_id=event_id, cache=cache)
+        player_stats = _lineup_player_stats(lineups, player_ids)
+        if player_stats is not None:
+            return player_stats, lineups
+    stats = await asyncio.gather(*[arequest_player_event_stats(player_id, event_id) for player_id in player_ids])
+    return dict(zip(player_ids, stats)), None
+
+async def _aresolve_tournament_names(plan: EventQueryPlan, event_rows: Dict[Any, dict]):
+    """Look up the names of the scanned tournaments concurrently, so the fan-out never blocks on one."""
+    tournament_ids = list({
+        _as_int(event.get("TOURNAMENT_ID")) for event in event_rows.values()
+    } - set(plan.tournament_names))
+    names = await asyncio.gather(*[
+        aget_tournament_property(query_value=tournament_id, col_name="TOURNAMENT_NAME", key_name="TOURNAMENT_ID", gsi=False)
+        for tournament_id in tournament_ids
+    ])
+    plan.tournament_names.update(zip(tournament_ids, names))
+
+async def aiter_event_plan(plan: EventQueryPlan) -> AsyncIterator[Tuple[tuple, PlayerEventStats | dict | str]]:
+    """Async counterpart of `iter_event_plan`."""
+    for key, error in _plan_errors(plan):
+        yield key, error
+    if _has_unresolved_players(plan):
+        return
+
+    _reuse_scans(plan)
+    scan_jobs = [(team_id, ascan_events, (payload,)) for team_id, payload in _scan_payloads(plan).items() if plan.scans[team_id].events is None]
+    async for team_id, events in aiter_completed(scan_jobs):
+        plan.scans[team_id].events = events
+    _remember_scans(plan, [team_id for team_id, _, _ in scan_jobs])
+
+    check_deadline()
+
+    event_rows, event_players, event_waiters, event_squads = _group_event_fetches(plan)
+    await _aresolve_tournament_names(plan, event_rows)
+    fetch_jobs = [
+        (event_id, _afetch_event_player_stats, (event_id, sorted(player_ids), bool(event_rows[event_id].get("WINNER_CODE")), event_id in event_squads))
+        for event_id, player_ids in event_players.items()
+    ]
+
+    async for event_id, (player_stats, lineups) in aiter_completed(fetch_jobs):
+        for key, item in _fan_out(plan, event_rows[event_id], event_waiters[event_id], player_stats, lineups):
+            yield key, item
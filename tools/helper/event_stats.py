@@ -4,11 +4,15 @@ import requests
 from decimal import Decimal
 from config import *
 from tools.modules import *
+from tools.helper.deadline import request_timeout, check_deadline, DeadlineExceeded
+from tools.helper.execution_cache import execution_step
+from tools.helper.async_fetch import asofascore_get, alambda_post, aquery_property
 import time
 from datetime import datetime
 from dataclasses import dataclass
 
 
+@execution_step
 def get_player_property(player_name: str, col_name: str) -> int | List[int] | None:
     """
     Tool to get the unique id or other property of a football player from DynamoDB.
@@ -25,6 +29,7 @@ def get_player_property(player_name: str, col_name: str) -> int | List[int] | No
         # Query DynamoDB for the player name
         response = requests.post(
             url=QUERY_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
             json = {
                 "table_name": "dim_players",
                 "gsi": "true",
@@ -56,9 +61,12 @@ def get_player_property(player_name: str, col_name: str) -> int | List[int] | No
             print(f"Player '{player_name}' not found in the database.")
             return False
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error retrieving data for player '{player_name}': {e}")
 
+@execution_step
 def get_team_property(team_name: str, col_name: str) -> int | List[int] | None:
     """
     Tool to get the unique id or other property of a football team from DynamoDB.
@@ -77,6 +85,7 @@ def get_team_property(team_name: str, col_name: str) -> int | List[int] | None:
         # Query DynamoDB for the team name
         response = requests.post(
             url=QUERY_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
             json = {
                 "table_name": "dim_teams",
                 "gsi": "true",
@@ -108,9 +117,12 @@ def get_team_property(team_name: str, col_name: str) -> int | List[int] | None:
             print(f"Team '{team_name}' not found in the database.")
             return False
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error retrieving data for team '{team_name}': {e}")
 
+@execution_step
 def get_tournament_property(query_value: str, col_name: str, key_name: str, gsi: bool) -> int | List[int] | None:
     """
     Tool to get the unique id or other property of a football tournament from DynamoDB.
@@ -128,6 +140,7 @@ def get_tournament_property(query_value: str, col_name: str, key_name: str, gsi:
         if gsi:
             response = requests.post(
                 url=QUERY_LAMBDA_URL,
+                timeout=request_timeout(LAMBDA_TIMEOUT),
                 json = {
                     "table_name": "dim_tournaments",
                     "gsi": "true",
@@ -139,6 +152,7 @@ def get_tournament_property(query_value: str, col_name: str, key_name: str, gsi:
         else:
             response = requests.post(
                 url=QUERY_LAMBDA_URL,
+                timeout=request_timeout(LAMBDA_TIMEOUT),
                 json = {
                     "table_name": "dim_tournaments",
                     "index_name": key_name,
@@ -169,34 +183,31 @@ def get_tournament_property(query_value: str, col_name: str, key_name: str, gsi:
             print(f"Tournament '{query_value}' not found in the database.")
             return False
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error retrieving data for tournament '{query_value}': {e}")
 
-def create_url_params(
-        player_id: int,
-        event_date: str | Tuple[str,str] | List[str] | None,
-        last_k: int | None,
-        player_team_id: int | None,
+def create_events_scan_payload(
+        player_team_id: int,
         opponent_team_id: int | None,
+        event_date: str | Tuple[str,str] | List[str] | None,
         tournament_id: int | None,
-        player_team_name: str | None,
-        opponent_team_name: str | None,
-        tournament_name: str | None,
-        table_name:str,
-        ) -> List[dict]:
+        table_name: str
+        ) -> dict:
     """
-    Tool to get the unique ids of tournaments and optionally a specific season.
-    
+    Build the scan lambda payload that selects the events of a team.
+
     Args:
-        player_id (int): The ID of the player.
-        tournament_name (str | None): The name of the tournament (optional).
-        season_year (int | None): The year of the season (optional).
-        
+        player_team_id (int): The ID of the team whose events are scanned.
+        opponent_team_id (int | None): Restrict the scan to games against this team (optional).
+        event_date (str | Tuple[str,str] | List[str] | None): A single date or a (start, end) date range (optional).
+        tournament_id (int | None): Restrict the scan to this tournament (optional).
+        table_name (str): The DynamoDB table to scan.
+
     Returns:
-        List[dict]: A list of dictionaries with the necessary parameters.
+        dict: The payload for the scan lambda.
     """
-
-    # Reference the DynamoDB table dim_unique_seasons
     payload = {
         "table_name": table_name,
         "filter": {
@@ -206,10 +217,6 @@ def create_url_params(
         }
     }
 
-    if not player_team_id:
-        # TODO: Get team id from player_id
-        raise ValueError("player_team_id is required for this query.")
-    
     # Add team-related conditions (home vs. away logic)
     if opponent_team_id:
         payload['filter']['subfilters'].append(
@@ -295,11 +302,11 @@ def create_url_params(
                         "type": "atomic",
                         "attribute": "EVENT_DATE",
                         "operation": "between",
-                        "value": event_date
+                        "value": list(event_date)
                     }
                 )
             else:
-                raise ValueError(f"Event date list or tuple should have exactly two values. One start date, one end date. This one has {len(event_date)} values. Player ID {player_id} , Player team name: {player_team_name}")
+                raise ValueError(f"Event date list or tuple should have exactly two values. One start date, one end date. This one has {len(event_date)} values. Player team ID: {player_team_id}")
         else:
             raise ValueError(f"Event date type can be either str, tuple, or list. Retrieved an event_date object of type {type(event_date)}")   
     if tournament_id:
@@ -312,80 +319,174 @@ def create_url_params(
             }
         )
 
-    # Execute the query
+    return payload
+
+@execution_step
+def scan_events(payload: dict) -> List[dict]:
+    """
+    Run a scan lambda payload and return the matching event rows.
+    """
     try:
-        response = requests.post(
+        events = requests.post(
             url=SCAN_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
             json=payload
         ).json()
-        events = response
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error querying DynamoDB: {e}")
+        return []
 
-    url_params = []
+    return events or []
+
+def annotate_event_param(
+        event: dict,
+        player_id: int,
+        player_team_id: int,
+        player_team_name: str | None,
+        opponent_team_name: str | None,
+        tournament_name: str | None,
+        ) -> dict:
+    """
+    Add the player-side fields (ids, team names, home/away) that `create_player_event_stats` reads to an event row.
+    The row is modified in place and returned.
+    """
+    event["PLAYER_ID"] = player_id
+    event["PLAYER_TEAM_ID"] = player_team_id    
+    
+    if tournament_name:
+        event["TOURNAMENT_NAME"] = tournament_name
+    else:
+        event["TOURNAMENT_NAME"] = get_tournament_property(query_value=event.get("TOURNAMENT_ID"), col_name="TOURNAMENT_NAME", key_name="TOURNAMENT_ID", gsi=False)
+    
+    if player_team_name:
+        event["PLAYER_TEAM_NAME"] = player_team_name
+    else:
+        event["PLAYER_TEAM_NAME"] = event["HOME_TEAM_NAME"] if event["HOME_TEAM_ID"]==player_team_id else event["AWAY_TEAM_NAME"]
+    
+    if opponent_team_name:
+        event["OPPONENT_TEAM_NAME"] = opponent_team_name
+    else:
+        event["OPPONENT_TEAM_NAME"] = event["AWAY_TEAM_NAME"] if event["HOME_TEAM_ID"]==player_team_id else event["HOME_TEAM_NAME"]
+    
+    if event["HOME_TEAM_ID"]==player_team_id:
+        event["IS_HOME"] = True
+    else:
+        event["IS_HOME"] = False
+
+    return event
+
+def select_last_k(events: List[dict], last_k: int | None) -> List[dict]:
+    if not last_k:
+        return events
+    sorted_events = sorted(
+        events,
+        key=lambda x: datetime.strptime(x['EVENT_DATE'], '%Y-%m-%d'),  # Adjust date format if needed
+        reverse=True
+    )
+    return sorted_events[:last_k]
+
+def create_url_params(
+        player_id: int,
+        event_date: str | Tuple[str,str] | List[str] | None,
+        last_k: int | None,
+        player_team_id: int | None,
+        opponent_team_id: int | None,
+        tournament_id: int | None,
+        player_team_name: str | None,
+        opponent_team_name: str | None,
+        tournament_name: str | None,
+        table_name:str,
+        ) -> List[dict]:
+    """
+    Tool to get the unique ids of tournaments and optionally a specific season.
+    
+    Args:
+        player_id (int): The ID of the player.
+        tournament_name (str | None): The name of the tournament (optional).
+        season_year (int | None): The year of the season (optional).
+        
+    Returns:
+        List[dict]: A list of dictionaries with the necessary parameters.
+    """
+
+    if not player_team_id:
+        # TODO: Get team id from player_id
+        raise ValueError("player_team_id is required for this query.")
+
+    payload = create_events_scan_payload(
+        player_team_id=player_team_id,
+        opponent_team_id=opponent_team_id,
+        event_date=event_date,
+        tournament_id=tournament_id,
+        table_name=table_name
+    )
+
+    # Execute the query
+    events = scan_events(payload)
 
     if not events:
         return []
     
-    if last_k:
-        sorted_events = sorted(
-            events,
-            key=lambda x: datetime.strptime(x['EVENT_DATE'], '%Y-%m-%d'),  # Adjust date format if needed
-            reverse=True
-        )
-        events = sorted_events[:last_k]
+    events = select_last_k(events, last_k)
 
+    url_params = []
     for event in events:
-        event["PLAYER_ID"] = player_id
-        event["PLAYER_TEAM_ID"] = player_team_id    
-        
-        if tournament_name:
-            event["TOURNAMENT_NAME"] = tournament_name
-        else:
-            event["TOURNAMENT_NAME"] = get_tournament_property(query_value=event.get("TOURNAMENT_ID"), col_name="TOURNAMENT_NAME", key_name="TOURNAMENT_ID", gsi=False)
-        
-        if player_team_name:
-            event["PLAYER_TEAM_NAME"] = player_team_name
-        else:
-            event["PLAYER_TEAM_NAME"] = event["HOME_TEAM_NAME"] if event["HOME_TEAM_ID"]==player_team_id else event["AWAY_TEAM_NAME"]
-        
-        if opponent_team_name:
-            event["OPPONENT_TEAM_NAME"] = opponent_team_name
-        else:
-            event["OPPONENT_TEAM_NAME"] = event["AWAY_TEAM_NAME"] if event["HOME_TEAM_ID"]==player_team_id else event["HOME_TEAM_NAME"]
-        
-        if event["HOME_TEAM_ID"]==player_team_id:
-            event["IS_HOME"] = True
-        else:
-            event["IS_HOME"] = False
-        
-        url_params.append(event)
+        url_params.append(
+            annotate_event_param(
+                event=event,
+                player_id=player_id,
+                player_team_id=player_team_id,
+                player_team_name=player_team_name,
+                opponent_team_name=opponent_team_name,
+                tournament_name=tournament_name
+            )
+        )
 
     return url_params
 
+@execution_step
 def request_player_event_stats(player_id, event_id):
     url = f"https://www.sofascore.com/api/v1/event/{event_id}/player/{player_id}/statistics"
     if USE_PROXIES:
         for i, proxy in enumerate(PROXIES):
             try:
                 start_time = time.time()  # Start the timer
-                response = requests.get(url, proxies={"http": proxy}, timeout=10)
+                response = requests.get(url, proxies={"http": proxy}, timeout=request_timeout(10))
                 response_time = time.time() - start_time  # Calculate response time
                 if response.status_code == 200:
                     print(f"Success with proxy number {i+1} : {proxy} in {response_time:.2f} seconds")
                     return response.json()
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 time.sleep(2)  # Add delay to avoid bans
         raise Exception("All proxies failed!")
     else:
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, timeout=request_timeout(10))
         return response.json()
 
-def create_player_event_stats(player_name: str, param: dict) -> PlayerEventStats:
+def parse_lineup_player_stats(response: dict) -> Dict[int, dict] | None:
+    if not response or response.get("error") or not response.get("home"):
+        return None
 
-    player_id = param.get("PLAYER_ID")
-    event_id = param.get("EVENT_ID")
+    player_stats = {}
+    for side in ["home", "away"]:
+        for player in response[side]['players']:
+            statistics = player.get("statistics")
+            if statistics and statistics.get("minutesPlayed"):
+                player_stats[int(player['player']['id'])] = {"statistics": statistics}
+            else:
+                player_stats[int(player['player']['id'])] = {"error": {"code": 404, "message": "Player did not play in this game."}}
 
+    return player_stats
+
+def build_player_event_stats(player_name: str, param: dict, stats: dict) -> PlayerEventStats:
+    """
+    Build a `PlayerEventStats` from an annotated event row and the raw Sofascore statistics response.
+    """
+    event_id = param.get("EVENT_ID")
 
     player_stats = PlayerEventStats(
         player_id=int(param.get("PLAYER_ID")),
@@ -409,10 +510,6 @@ def create_player_event_stats(player_name: str, param: dict) -> PlayerEventStats
     else:
         player_stats.match_result = 'Lose'
 
-    if None in [player_id, event_id]:
-        raise ValueError("One of the stats url parameters is None.")
-    stats = request_player_event_stats(player_id, event_id)
-
     if stats.get("error"):
         if stats.get("error").get("code") == 404:
             stats = {"info": f"Player did not play in this game. Evnet Id: {event_id} , Teams: {player_stats.player_team_name} and {player_stats.opponent_team_name} , Game date: {player_stats.event_date}"}
@@ -423,6 +520,59 @@ def create_player_event_stats(player_name: str, param: dict) -> PlayerEventStats
 
     return player_stats
 
+def create_player_event_stats(player_name: str, param: dict) -> PlayerEventStats:
+
+    player_id = param.get("PLAYER_ID")
+    event_id = param.get("EVENT_ID")
+
+    if None in [player_id, event_id]:
+        raise ValueError("One of the stats url parameters is None.")
+    stats = request_player_event_stats(player_id, event_id)
+
+    return build_player_event_stats(player_name=player_name, param=param, stats=stats)
+
+def build_squad_event_stats(
+        event: dict,
+        response: dict,
+        player_team_id: int,
+        player_team_name: str | None,
+        opponent_team_name: str | None,
+        tournament_name: str | None
+    ) -> List[PlayerEventStats] | None:
+    """
+    Build the event stats of every player of a team who played in an event from the event's `lineups` response.
+
+    Args:
+        event (dict): An event row of `dim_events`.
+        response (dict): The `lineups` response of the event.
+        player_team_id (int): The team whose squad is read, the home or the away team of the event.
+
+    Returns:
+        List[PlayerEventStats] | None: The stats of the squad in lineup order. None when the event has no lineups.
+    """
+    if not response or response.get("error") or not response.get("home"):
+        return None
+
+    side = "home" if int(event["HOME_TEAM_ID"]) == int(player_team_id) else "away"
+    squad_stats = []
+    for player in response[side]['players']:
+        statistics = player.get("statistics")
+        if not statistics or not statistics.get("minutesPlayed"):
+            continue
+        param = annotate_event_param(
+            event=dict(event),
+            player_id=player['player']['id'],
+            player_team_id=player_team_id,
+            player_team_name=player_team_name,
+            opponent_team_name=opponent_team_name,
+            tournament_name=tournament_name
+        )
+        squad_stats.append(
+            build_player_event_stats(player_name=player['player']['name'], param=param, stats={"statistics": statistics})
+        )
+
+    return squad_stats
+
 def obtain_player_event_stats(
         player_name: str,
         event_date: str | Tuple[str,str] | List[str] | None,
@@ -492,3 +642,29 @@ def obtain_player_event_stats(
     return player_stats
 
 
+###############################################################
+# ASYNC FETCH
+###############################################################
+
+async def aget_player_property(player_name: str, col_name: str) -> int | List[int] | None:
+    return await aquery_property(table_name="dim_players", index_name='PLAYER_NAME', query_value=player_name, col_name=col_name, gsi=True, not_found=False)
+
+async def aget_team_property(team_name: str, col_name: str) -> int | List[int] | None:
+    return await aquery_property(table_name="dim_teams", index_name='TEAM_NAME', query_value=team_name, col_name=col_name, gsi=True, not_found=False)
+
+async def aget_tournament_property(query_value: str, col_name: str, key_name: str, gsi: bool) -> int | List[int] | None:
+    return await aquery_property(table_name="dim_tournaments", index_name=key_name, query_value=query_value, col_name=col_name, gsi=gsi, not_found=False)
+
+async def ascan_events(payload: dict) -> List[dict]:
+    try:
+        events = await alambda_post(SCAN_LAMBDA_URL, payload)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"Error querying DynamoDB: {e}")
+        return []
+
+    return events or []
+
+async def arequest_player_event_stats(player_id, event_id):
+    return await asofascore_get(f"https://www.sofascore.com/api/v1/event/{event_id}/player/{player_id}/statistics")
@@ -3,12 +3,24 @@ from typing import Dict, List, Union, Optional, Literal, Tuple
 import requests
 from config import *
 from tools.modules import *
+from tools.helper.deadline import request_timeout, check_deadline, DeadlineExceeded
+from tools.helper.execution_cache import execution_step
+from tools.helper.async_fetch import asofascore_get, alambda_post, aquery_property
+import asyncio
 import requests
 import time
+import threading
 from datetime import datetime
+from collections import OrderedDict
 
 from dataclasses import dataclass
 
+# event id -> lineups response of a finished match
+LINEUPS_CACHE = OrderedDict()
+# Lineups are requested from the fetch pool threads
+LINEUPS_CACHE_LOCK = threading.Lock()
+
+@execution_step
 def get_team_property(team_name: str, col_name: str) -> int | List[int] | None:
     """
     Tool to get the unique id or other property of a football team from DynamoDB.
@@ -27,6 +39,7 @@ def get_team_property(team_name: str, col_name: str) -> int | List[int] | None:
         # Query DynamoDB for the team name
         response = requests.post(
             url=QUERY_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
             json = {
                 "table_name": "dim_teams",
                 "gsi": "true",
@@ -58,10 +71,13 @@ def get_team_property(team_name: str, col_name: str) -> int | List[int] | None:
             print(f"Team '{team_name}' not found in the database.")
             return None
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error retrieving data for team '{team_name}': {e}")
 
 
+@execution_step
 def get_tournament_property(query_value: str, col_name: str, key_name: str, gsi: bool) -> int | List[int] | None:
     """
     Tool to get the unique id or other property of a football tournament from DynamoDB.
@@ -79,6 +95,7 @@ def get_tournament_property(query_value: str, col_name: str, key_name: str, gsi:
         if gsi:
             response = requests.post(
                 url=QUERY_LAMBDA_URL,
+                timeout=request_timeout(LAMBDA_TIMEOUT),
                 json = {
                     "table_name": "dim_tournaments",
                     "gsi": "true",
@@ -90,6 +107,7 @@ def get_tournament_property(query_value: str, col_name: str, key_name: str, gsi:
         else:
             response = requests.post(
                 url=QUERY_LAMBDA_URL,
+                timeout=request_timeout(LAMBDA_TIMEOUT),
                 json = {
                     "table_name": "dim_tournaments",
                     "index_name": key_name,
@@ -120,21 +138,19 @@ def get_tournament_property(query_value: str, col_name: str, key_name: str, gsi:
             print(f"Tournament '{query_value}' not found in the database.")
             return False
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error retrieving data for tournament '{query_value}': {e}")
 
 
-def create_url_params(
+def create_summary_scan_payload(
         event_date: str | Tuple[str,str] | List[str] | None,
-        last_k : int | None, 
-        home_team_name: str | None,
-        away_team_name: str | None,
         home_team_id: int | None,
         away_team_id: int | None,
-        tournament_name: str | None,
         tournament_id: int | None,
         table_name:str
-        ) -> List[dict]:
+        ) -> dict:
 
     # Reference the DynamoDB table dim_unique_seasons
     payload = {
@@ -249,27 +265,58 @@ def create_url_params(
             }
         )
 
+    return payload
+
+def select_last_k_events(events: List[dict], last_k: int | None) -> List[dict]:
+    if not last_k:
+        return events
+    sorted_events = sorted(
+        events,
+        key=lambda x: datetime.strptime(x['EVENT_DATE'], '%Y-%m-%d'),  # Adjust date format if needed
+        reverse=True
+    )
+    return sorted_events[:last_k]
+
+@execution_step
+def create_url_params(
+        event_date: str | Tuple[str,str] | List[str] | None,
+        last_k : int | None, 
+        home_team_name: str | None,
+        away_team_name: str | None,
+        home_team_id: int | None,
+        away_team_id: int | None,
+        tournament_name: str | None,
+        tournament_id: int | None,
+        table_name:str
+        ) -> List[dict]:
+
+    payload = create_summary_scan_payload(
+        event_date=event_date,
+        home_team_id=home_team_id,
+        away_team_id=away_team_id,
+        tournament_id=tournament_id,
+        table_name=table_name
+    )
+
     # Execute the query
     try:
         response = requests.post(
             url=SCAN_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
             json=payload
         ).json()
         events = response
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error querying DynamoDB: {e}")
+        return []
 
     url_params = []
     if not events:
         return []
     
-    if last_k:
-        sorted_events = sorted(
-            events,
-            key=lambda x: datetime.strptime(x['EVENT_DATE'], '%Y-%m-%d'),  # Adjust date format if needed
-            reverse=True
-        )
-        events = sorted_events[:last_k]
+    events = select_last_k_events(events, last_k)
 
     for event in events:
         if tournament_name:
@@ -281,26 +328,32 @@ def create_url_params(
 
     return url_params
 
+@execution_step
 def request_event_data(event_id, endpoint):
     url=f"https://www.sofascore.com/api/v1/event/{event_id}/{endpoint}"
     if USE_PROXIES:
         for i, proxy in enumerate(PROXIES):
             try:
                 start_time = time.time()  # Start the timer
-                response = requests.get(url, proxies={"http": proxy}, timeout=10)
+                response = requests.get(url, proxies={"http": proxy}, timeout=request_timeout(10))
                 response_time = time.time() - start_time  # Calculate response time
                 if response.status_code == 200:
                     print(f"Endpoint {endpoint} - Success with proxy number {i+1} : {proxy} in {response_time:.2f} seconds")
                     return response.json()
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 time.sleep(2)  # Add delay to avoid bans
         raise Exception("All proxies failed!")
     else:
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, timeout=request_timeout(10))
         return response.json()
 
 def get_event_comments(event_id: int, summary: bool):
     response = request_event_data(event_id=event_id, endpoint='comments')
+    return parse_event_comments(response=response, summary=summary)
+
+def parse_event_comments(response: dict, summary: bool) -> List[dict]:
     if summary:
         important_comment_types = ["penaltyAwarded", "penaltyLost", "penaltyScored", "scoreChange", "videoAssistantReferee", "redCard"]
     else:
@@ -322,9 +375,47 @@ def get_event_comments(event_id: int, summary: bool):
             )
     return important_comments
 
-def get_event_lineups(event_id):
+def request_event_lineups(event_id, cache: bool = True) -> dict:
+    """
+    Fetch the `lineups` response of an event. It holds both squads and the statistics of every player,
+    so it serves event summaries and multi-player event stats alike.
+
+    Args:
+        event_id (int): The ID of the event.
+        cache (bool): Keep the response for later calls. Only finished matches should be cached.
+
+    Returns:
+        dict: The lineups response.
+    """
+    event_id = int(event_id)
+    cached = cached_event_lineups(event_id)
+    if cached is not None:
+        return cached
+
     response = request_event_data(event_id=event_id, endpoint='lineups')
+    cache_event_lineups(event_id=event_id, response=response, cache=cache)
+
+    return response
+
+def cached_event_lineups(event_id: int) -> dict | None:
+    with LINEUPS_CACHE_LOCK:
+        response = LINEUPS_CACHE.get(event_id)
+        if response is not None:
+            LINEUPS_CACHE.move_to_end(event_id)
+        return response
 
+def cache_event_lineups(event_id: int, response: dict, cache: bool):
+    if cache and response and not response.get("error"):
+        with LINEUPS_CACHE_LOCK:
+            LINEUPS_CACHE[event_id] = response
+            if len(LINEUPS_CACHE) > LINEUPS_CACHE_SIZE:
+                LINEUPS_CACHE.popitem(last=False)
+
+def get_event_lineups(event_id, cache: bool = True):
+    response = request_event_lineups(event_id=event_id, cache=cache)
+    return parse_event_lineups(response)
+
+def parse_event_lineups(response: dict) -> dict:
     lineups = {"home": {"starting": [], "bench": [], "missing": []},
                "away": {"starting": [], "bench": [], "missing": []}}
 
@@ -346,6 +437,13 @@ def get_event_lineups(event_id):
 
 def create_event_data(param: dict, summary: bool) -> EventSummary:
     event_id = param['EVENT_ID']
+
+    comments = get_event_comments(event_id=event_id, summary=summary)
+    lineups = get_event_lineups(event_id, cache=bool(param['WINNER_CODE']))
+
+    return build_event_summary(param=param, comments=comments, lineups=lineups)
+
+def build_event_summary(param: dict, comments: List[dict], lineups: dict) -> EventSummary:
     home_team=param["HOME_TEAM_NAME"]
     away_team=param["AWAY_TEAM_NAME"]
     home_team_score=param["HOME_SCORE"]
@@ -364,9 +462,6 @@ def create_event_data(param: dict, summary: bool) -> EventSummary:
     else:
         winner = 'Unknown'
 
-    comments = get_event_comments(event_id=event_id, summary=summary)
-    lineups = get_event_lineups(event_id)
-
     return EventSummary(
         home_team=param["HOME_TEAM_NAME"],
         away_team=param["AWAY_TEAM_NAME"],
@@ -379,4 +474,87 @@ def create_event_data(param: dict, summary: bool) -> EventSummary:
     )
 
 
-        
\ No newline at end of file
+###############################################################
+# ASYNC FETCH
+###############################################################
+
+async def arequest_event_data(event_id, endpoint):
+    return await asofascore_get(f"https://www.sofascore.com/api/v1/event/{event_id}/{endpoint}")
+
+async def arequest_event_lineups(event_id, cache: bool = True) -> dict:
+    event_id = int(event_id)
+    cached = cached_event_lineups(event_id)
+    if cached is not None:
+        return cached
+
+    response = await arequest_event_data(event_id=event_id, endpoint='lineups')
+    cache_event_lineups(event_id=event_id, response=response, cache=cache)
+
+    return response
+
+async def aget_tournament_property(query_value, col_name: str, key_name: str, gsi: bool):
+    return await aquery_property(table_name="dim_tournaments", index_name=key_name, query_value=query_value, col_name=col_name, gsi=gsi, not_found=False)
+
+async def aget_team_property(team_name: str, col_name: str):
+    return await aquery_property(table_name="dim_teams", index_name='TEAM_NAME', query_value=team_name, col_name=col_name, gsi=True, not_found=None)
+
+async def acreate_url_params(
+        event_date: str | Tuple[str,str] | List[str] | None,
+        last_k : int | None, 
+        home_team_name: str | None,
+        away_team_name: str | None,
+        home_team_id: int | None,
+        away_team_id: int | None,
+        tournament_name: str | None,
+        tournament_id: int | None,
+        table_name:str
+        ) -> List[dict]:
+    payload = create_summary_scan_payload(
+        event_date=event_date,
+        home_team_id=home_team_id,
+        away_team_id=away_team_id,
+        tournament_id=tournament_id,
+        table_name=table_name
+    )
+
+    try:
+        events = await alambda_post(SCAN_LAMBDA_URL, payload)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"Error querying DynamoDB: {e}")
+        return []
+
+    if not events:
+        return []
+
+    events = select_last_k_events(events, last_k)
+
+    if tournament_name:
+        tournament_names = {}
+    else:
+        tournament_ids = list({event.get("TOURNAMENT_ID") for event in events})
+        names = await asyncio.gather(*[
+            aget_tournament_property(query_value=tournament_id, col_name="TOURNAMENT_NAME", key_name="TOURNAMENT_ID", gsi=False)
+            for tournament_id in tournament_ids
+        ])
+        tournament_names = dict(zip(tournament_ids, names))
+
+    for event in events:
+        event["TOURNAMENT_NAME"] = tournament_name or tournament_names.get(event.get("TOURNAMENT_ID"))
+
+    return events
+
+async def acreate_event_data(param: dict, summary: bool) -> EventSummary:
+    event_id = param['EVENT_ID']
+
+    comments_response, lineups_response = await asyncio.gather(
+        arequest_event_data(event_id=event_id, endpoint='comments'),
+        arequest_event_lineups(event_id=event_id, cache=bool(param['WINNER_CODE']))
+    )
+
+    return build_event_summary(
+        param=param,
+        comments=parse_event_comments(response=comments_response, summary=summary),
+        lineups=parse_event_lineups(lineups_response)
+    )
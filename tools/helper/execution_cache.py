@@ -0,0 +1,192 @@
+from typing import Any, Callable, Hashable
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+import asyncio
+import contextvars
+import copy
+import functools
+import inspect
+import json
+import threading
+import time
+from config import *
+
+
+# The execution cache of the conversation thread whose tool call runs in this context. The fetch pool copies it into its worker threads.
+CURRENT_EXECUTION_CACHE = contextvars.ContextVar("current_execution_cache", default=None)
+# Set when the tool call running in this context was given up, e.g. a speculative run the user edited. Its requests stop there.
+CURRENT_CANCEL_EVENT = contextvars.ContextVar("current_cancel_event", default=None)
+# Marks a missing entry, None is a valid cached value for nothing
+_MISSING = object()
+
+
+class ExecutionCancelled(Exception):
+    """Raised by an execution step instead of sending its request once the tool call it belongs to was cancelled."""
+
+
+class ExecutionCache:
+    """
+    The requests one conversation thread made in its recent tool calls, with their responses.
+
+    When the user edits the parameters of a tool call, the tool runs again with the new parameters, and every
+    request the edit did not change (name lookups, scans, match and season statistics) is answered from here.
+    Only the requests of the changed parts reach the lambdas and Sofascore. The first run of a new question starts
+    from an empty cache (`clear`), so how long results stay valid across questions is left to the tool memo TTLs.
+    Entries expire after `ttl` seconds and the `max_entries` most recently used are kept.
+    """
+    def __init__(self, ttl: float = EXECUTION_CACHE_TTL, max_entries: int = EXECUTION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Hashable, tuple] = OrderedDict()
+        # key -> the request being sent, a second run of the thread (an approved speculation, an edit) waits for it instead of sending it again
+        self.in_flight: dict[Hashable, Future] = {}
+        # The fetch pool writes from several threads at once
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = _MISSING) -> Any:
+        """A copy of the cached value, `default` when there is none or it expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        # Callers change the rows they get, e.g. add tournament names, the cached copy stays as fetched
+        return copy.deepcopy(value)
+
+    def claim(self, key: Hashable) -> tuple:
+        """
+        (value, None) when the value is cached, (`_MISSING`, future) when another run is sending the request and
+        (`_MISSING`, None) when the caller sends it, then it is in flight until `release`.
+        """
+        value = self.get(key)
+        if value is not _MISSING:
+            return value, None
+        with self.lock:
+            if key in self.in_flight:
+                return _MISSING, self.in_flight[key]
+            self.in_flight[key] = Future()
+        return _MISSING, None
+
+    def release(self, key: Hashable, value: Any = _MISSING):
+        """Cache the response of a claimed request, unless it failed, and wake the runs waiting for it."""
+        if value is not _MISSING and _cacheable(value):
+            self.put(key, value)
+        with self.lock:
+            pending = self.in_flight.pop(key, None)
+        if pending is not None:
+            pending.set_result(None)
+
+    def clear(self):
+        """Drop the cached responses. Requests in flight are still waited for."""
+        with self.lock:
+            self.entries.clear()
+
+    def put(self, key: Hashable, value: Any):
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# thread id -> ExecutionCache, the most recently used threads are kept
+_THREAD_CACHES: OrderedDict[str, ExecutionCache] = OrderedDict()
+_THREAD_CACHES_LOCK = threading.Lock()
+
+def thread_execution_cache(thread_id: str) -> ExecutionCache:
+    with _THREAD_CACHES_LOCK:
+        cache = _THREAD_CACHES.pop(thread_id, None) or ExecutionCache()
+        _THREAD_CACHES[thread_id] = cache
+        while len(_THREAD_CACHES) > EXECUTION_CACHE_THREADS:
+            _THREAD_CACHES.popitem(last=False)
+    return cache
+
+@contextmanager
+def execution_cache(cache: ExecutionCache | None, cancelled: threading.Event | None = None):
+    """
+    Serve the requests made inside the context from `cache` when they were made before, and add the new ones.
+    Once `cancelled` is set, the requests not sent yet raise `ExecutionCancelled`; the responses received so far stay cached.
+    """
+    token = CURRENT_EXECUTION_CACHE.set(cache)
+    cancel_token = CURRENT_CANCEL_EVENT.set(cancelled)
+    try:
+        yield cache
+    finally:
+        CURRENT_CANCEL_EVENT.reset(cancel_token)
+        CURRENT_EXECUTION_CACHE.reset(token)
+
+def current_execution_cache() -> ExecutionCache | None:
+    return CURRENT_EXECUTION_CACHE.get()
+
+def _cacheable(value: Any) -> bool:
+    """Failed requests return None, nothing or an error body, they are tried again on the next run."""
+    if value is None or (isinstance(value, (list, dict)) and not value):
+        return False
+    return not (isinstance(value, dict) and "error" in value)
+
+def _check_cancelled():
+    cancelled = CURRENT_CANCEL_EVENT.get()
+    if cancelled is not None and cancelled.is_set():
+        raise ExecutionCancelled("The tool call was cancelled.")
+
+def _step_key(function: Callable, args: tuple, kwargs: dict) -> str:
+    return f"{function.__module__}.{function.__qualname__}:{json.dumps([args, kwargs], sort_keys=True, ensure_ascii=False, default=str)}"
+
+def execution_step(function: Callable) -> Callable:
+    """
+    Cache the responses of a request function in the execution cache of the current thread, keyed by its arguments.
+    A request another run of the thread is sending is waited for, and sent again only when it failed.
+    Without an active cache, e.g. in scripts and tests, the function runs as before. Works on coroutine functions too.
+    """
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            cache = CURRENT_EXECUTION_CACHE.get()
+            if cache is None:
+                return await function(*args, **kwargs)
+            key = _step_key(function, args, kwargs)
+            value, pending = cache.claim(key)
+            if pending is not None:
+                await asyncio.wrap_future(pending)
+                value = cache.get(key)
+                if value is _MISSING:
+                    return await function(*args, **kwargs)
+            if value is not _MISSING:
+                return value
+            try:
+                _check_cancelled()
+                value = await function(*args, **kwargs)
+            finally:
+                cache.release(key, value)
+            return value
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        cache = CURRENT_EXECUTION_CACHE.get()
+        if cache is None:
+            return function(*args, **kwargs)
+        key = _step_key(function, args, kwargs)
+        value, pending = cache.claim(key)
+        if pending is not None:
+            pending.result()
+            value = cache.get(key)
+            if value is _MISSING:
+                return function(*args, **kwargs)
+        if value is not _MISSING:
+            return value
+        try:
+            _check_cancelled()
+            value = function(*args, **kwargs)
+        finally:
+            cache.release(key, value)
+        return value
+    return wrapper
@@ -0,0 +1,122 @@
+from typing import Dict, List, Tuple, Hashable
+from collections import OrderedDict, deque
+import threading
+from dataclasses import dataclass, field
+from config import *
+from tools.modules import *
+
+
+# The windows reported on `PlayerSeasonRatings` as form_last_5 and form_last_10
+FORM_WINDOWS = (5, 10)
+
+# (player id, unique season id) -> FormTracker of the matches seen so far
+FORM_CACHE = OrderedDict()
+# The fetch pool builds ratings from several threads, a tracker is read and advanced under this lock
+FORM_CACHE_LOCK = threading.Lock()
+
+
+@dataclass
+class RollingWindow:
+    """Mean of the last `size` ratings, kept with a running sum."""
+    size: int
+    values: deque = field(default_factory=deque)
+    total: float = 0.0
+
+    def push(self, rating: float):
+        self.values.append(rating)
+        self.total += rating
+        if len(self.values) > self.size:
+            self.total -= self.values.popleft()
+
+    def mean(self) -> float | None:
+        return self.total / len(self.values) if self.values else None
+
+
+@dataclass
+class FormTracker:
+    """
+    Form of one rating series, updated in O(1) per match.
+
+    Keeps rolling windows, an exponentially weighted rating and the running sums of a least squares
+    line through (match number, rating), so newly finished matches extend the series without a recomputation.
+    """
+    alpha: float = FORM_EWMA_ALPHA
+    windows: Dict[int, RollingWindow] = field(default_factory=lambda: {size: RollingWindow(size) for size in FORM_WINDOWS})
+    ewma: float = None
+    count: int = 0
+    last_event_id: int = None
+    sum_x: float = 0.0
+    sum_y: float = 0.0
+    sum_xx: float = 0.0
+    sum_xy: float = 0.0
+
+    def update(self, rating: float, event_id: int = None):
+        for window in self.windows.values():
+            window.push(rating)
+        self.ewma = rating if self.ewma is None else self.alpha * rating + (1 - self.alpha) * self.ewma
+
+        x = self.count
+        self.sum_x += x
+        self.sum_y += rating
+        self.sum_xx += x * x
+        self.sum_xy += x * rating
+        self.count += 1
+        self.last_event_id = event_id
+
+    def trend(self) -> float | None:
+        """Slope of the least squares line through the series, in rating points per match."""
+        n = self.count
+        denominator = n * self.sum_xx - self.sum_x * self.sum_x
+        if n < 2 or denominator == 0:
+            return None
+        return (n * self.sum_xy - self.sum_x * self.sum_y) / denominator
+
+    def snapshot(self) -> Dict[str, float | None]:
+        form = {f"form_last_{size}": window.mean() for size, window in self.windows.items()}
+        form["form_ewma"] = self.ewma
+        form["form_trend"] = self.trend()
+        return form
+
+
+def rating_series(data: dict) -> List[Tuple[int, float]]:
+    """The (event id, rating) pairs of a `ratings` response, oldest match first. Matches without a rating are skipped."""
+    rated = [rating_data for rating_data in data.get("seasonRatings", []) if rating_data.get("rating") is not None]
+    rated.sort(key=lambda rating_data: rating_data["event"].get("startTimestamp") or 0)
+    return [(rating_data["event"].get("id"), rating_data["rating"]) for rating_data in rated]
+
+def season_form(key: Hashable, data: dict) -> Dict[str, float | None]:
+    """
+    Form metrics of a player season from its `ratings` response.
+
+    The tracker of every season is cached under `key`. When the same season is requested again after
+    new matches were played, only the new matches are pushed into the cached tracker.
+
+    Args:
+        key (Hashable): Identifies the series, e.g. (player id, unique season id).
+        data (dict): The `ratings` response.
+
+    Returns:
+        Dict[str, float | None]: form_last_5, form_last_10, form_ewma and form_trend.
+    """
+    series = rating_series(data)
+
+    with FORM_CACHE_LOCK:
+        tracker = FORM_CACHE.get(key)
+        if tracker is not None and (
+            tracker.count > len(series)
+            or (tracker.count and series[tracker.count - 1][0] != tracker.last_event_id)
+        ):
+            # The cached series is not a prefix of this one, start over
+            tracker = None
+        if tracker is None:
+            tracker = FormTracker()
+
+        for event_id, rating in series[tracker.count:]:
+            tracker.update(rating, event_id)
+
+        FORM_CACHE[key] = tracker
+        FORM_CACHE.move_to_end(key)
+        if len(FORM_CACHE) > FORM_CACHE_SIZE:
+            FORM_CACHE.popitem(last=False)
+
+        return tracker.snapshot()
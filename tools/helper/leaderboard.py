@@ -0,0 +1,230 @@
+from typing import Dict, List, Tuple
+from dataclasses import dataclass
+import heapq
+import threading
+from config import *
+from tools.modules import *
+
+
+# Fields of `PlayerSeasonRatings` a leaderboard can rank on. Every other stat comes from `SEASON_STAT_COLUMNS`.
+RATING_LEADERBOARD_COLUMNS = (
+    "average_rating", "average_big_game_rating", "rating_std_dev", "game_count", "big_game_count",
+    "form_last_5", "form_last_10", "form_ewma", "form_trend",
+)
+
+_STAT_POSITIONS = {column: position for position, column in enumerate(SEASON_STAT_COLUMNS)}
+_MINUTES_POSITION = _STAT_POSITIONS["minutesPlayed"]
+
+# (stat, per 90, min minutes, min games, position)
+LeaderboardQuery = Tuple[str, bool, int, int, str | None]
+
+
+@dataclass
+class LeaderboardRow:
+    """What the caches know about one player in one tournament season."""
+    player_id: int
+    player_name: str
+    position: str = None
+    stats: StatBlock = None
+    ratings: PlayerSeasonRatings = None
+
+    @property
+    def minutes(self) -> float:
+        return self.stats.values[_MINUTES_POSITION] if self.stats is not None else float("nan")
+
+    def value(self, query: LeaderboardQuery) -> float | None:
+        """The value the row is ranked on, None when the row does not qualify for the query."""
+        stat, per_90, min_minutes, min_games, position = query
+        if position and self.position != position:
+            return None
+
+        if stat in RATING_LEADERBOARD_COLUMNS:
+            if self.ratings is None or (self.ratings.game_count or 0) < min_games:
+                return None
+            return getattr(self.ratings, stat)
+
+        minutes = self.minutes
+        if self.stats is None or not minutes >= min_minutes:
+            return None
+        value = self.stats.values[_STAT_POSITIONS[stat]]
+        if value != value:
+            return None
+        if per_90 and stat not in NON_ADDITIVE_STAT_COLUMNS:
+            return value * 90.0 / minutes if minutes > 0 else None
+        return value
+
+
+class TournamentSeasonBoard:
+    """
+    Every cached player of one tournament season with the top-k heaps of the queries asked so far.
+
+    A heap holds (value, player id) pairs, smallest first, so a player that is new to the board is placed with one
+    `heappushpop` per heap. A player whose season changed can also leave a heap, so that drops the heaps instead.
+    """
+    def __init__(self, tournament_name: str, season_year: int):
+        self.tournament_name = tournament_name
+        self.season_year = season_year
+        self.rows: Dict[int, LeaderboardRow] = {}
+        self._heaps: Dict[LeaderboardQuery, Tuple[int, List[Tuple[float, int]]]] = {}
+
+    def row(self, player_id: int, player_name: str) -> LeaderboardRow:
+        if player_id not in self.rows:
+            self.rows[player_id] = LeaderboardRow(player_id=player_id, player_name=player_name)
+        return self.rows[player_id]
+
+    def changed(self, row: LeaderboardRow, new_player: bool):
+        if not new_player:
+            self._heaps.clear()
+            return
+        for query, (k, heap) in self._heaps.items():
+            value = row.value(query)
+            if value is None:
+                continue
+            if len(heap) < k:
+                heapq.heappush(heap, (value, row.player_id))
+            else:
+                heapq.heappushpop(heap, (value, row.player_id))
+
+    def position_arrived(self, row: LeaderboardRow):
+        """Place a row whose position was unknown in the heaps of its position, it failed their filter before."""
+        for query, (k, heap) in self._heaps.items():
+            if query[4] != row.position or (value := row.value(query)) is None:
+                continue
+            if len(heap) < k:
+                heapq.heappush(heap, (value, row.player_id))
+            else:
+                heapq.heappushpop(heap, (value, row.player_id))
+
+    def top_k(self, query: LeaderboardQuery, k: int) -> List[Tuple[float, int]]:
+        """The k highest (value, player id) pairs of the qualifying players, highest first."""
+        cached = self._heaps.get(query)
+        if cached is None or cached[0] < k:
+            candidates = (
+                (value, player_id) for player_id, row in self.rows.items()
+                if (value := row.value(query)) is not None
+            )
+            heap = heapq.nlargest(k, candidates)
+            heapq.heapify(heap)
+            cached = self._heaps[query] = (k, heap)
+        return sorted(cached[1], reverse=True)[:k]
+
+
+class LeaderboardIndex:
+    """
+    Leaderboards of every tournament season in the season stats and ratings caches.
+
+    Like the percentile index, it only knows the seasons that were fetched. `update` adds the cache entries
+    it has not seen yet and only touches the boards they belong to. Positions requested after a row was added
+    are filled in by the next `update`.
+    """
+    def __init__(self):
+        self.boards: Dict[Tuple[int, int], TournamentSeasonBoard] = {}
+        self._indexed: Dict[Tuple[str, int, int], object] = {}
+        # (tournament id, unique season id, player id) of the rows whose position is not known yet
+        self._unpositioned: set = set()
+        # Held by a tool call from its update until its leaderboard is read, sessions run the tool concurrently
+        self.lock = threading.Lock()
+
+    def _board(self, entry: CompactPlayerSeasonStats | PlayerSeasonRatings) -> TournamentSeasonBoard:
+        key = (entry.tournament_id, entry.unique_season_id)
+        if key not in self.boards:
+            self.boards[key] = TournamentSeasonBoard(entry.tournament_name, entry.season_year)
+        return self.boards[key]
+
+    def update(
+            self,
+            season_stats_cache: Dict[Tuple[int, int], CompactPlayerSeasonStats],
+            season_ratings_cache: Dict[Tuple[int, int], PlayerSeasonRatings],
+            positions: Dict[int, str]
+    ):
+        for source, cache in (("stats", season_stats_cache), ("ratings", season_ratings_cache)):
+            for key, entry in cache.items():
+                value = entry.stats if source == "stats" else entry
+                if self._indexed.get((source,) + key) is value:
+                    continue
+                self._indexed[(source,) + key] = value
+
+                board = self._board(entry)
+                new_player = entry.player_id not in board.rows
+                row = board.row(entry.player_id, entry.player_name)
+                if source == "stats":
+                    row.stats = entry.stats
+                    row.position = entry.position or row.position
+                else:
+                    row.ratings = entry
+                row.position = row.position or positions.get(entry.player_id)
+                board.changed(row, new_player)
+                if row.position is None:
+                    self._unpositioned.add((entry.tournament_id, entry.unique_season_id, entry.player_id))
+
+        for key in list(self._unpositioned):
+            row = self.boards[key[:2]].rows[key[2]]
+            row.position = row.position or positions.get(row.player_id)
+            if row.position is not None:
+                self._unpositioned.discard(key)
+                self.boards[key[:2]].position_arrived(row)
+
+    def find(self, tournament_name: str, season_year: int | None) -> TournamentSeasonBoard | None:
+        """The board of a tournament season by name, the latest cached season when `season_year` is None."""
+        boards = [
+            board for board in self.boards.values()
+            if board.tournament_name and board.tournament_name.casefold() == tournament_name.casefold()
+            and (season_year is None or board.season_year == season_year)
+        ]
+        if not boards:
+            return None
+        return max(boards, key=lambda board: (board.season_year or 0, len(board.rows)))
+
+    def leaderboard(
+            self,
+            tournament_name: str,
+            season_year: int | None,
+            stat: str,
+            k: int = LEADERBOARD_SIZE,
+            per_90: bool = False,
+            min_minutes: int = LEADERBOARD_MIN_MINUTES,
+            min_games: int = LEADERBOARD_MIN_GAMES,
+            position: str | None = None
+    ) -> SeasonLeaderboard | dict:
+        if stat not in _STAT_POSITIONS and stat not in RATING_LEADERBOARD_COLUMNS:
+            return {"error": {"message": "404", "parameter": "stat", "value": stat}}
+        board = self.find(tournament_name, season_year)
+        if board is None:
+            return {"error": {"message": "404", "parameter": "tournament_name", "value": tournament_name}}
+
+        query = (stat, bool(per_90), min_minutes, min_games, position)
+        entries = []
+        for rank, (value, player_id) in enumerate(board.top_k(query, k), start=1):
+            row = board.rows[player_id]
+            entries.append({
+                "rank": rank,
+                "player_name": row.player_name,
+                "position": row.position,
+                "value": value,
+                "minutes": None if row.stats is None else row.minutes,
+                "games": None if row.ratings is None else row.ratings.game_count,
+            })
+
+        return SeasonLeaderboard(
+            tournament_name=board.tournament_name,
+            season_year=board.season_year,
+            stat=stat,
+            per_90=query[1],
+            min_minutes=None if stat in RATING_LEADERBOARD_COLUMNS else min_minutes,
+            min_games=min_games if stat in RATING_LEADERBOARD_COLUMNS else None,
+            position=position,
+            players_considered=len(board.rows),
+            entries=entries,
+            info=self._info(board, position)
+        )
+
+    @staticmethod
+    def _info(board: TournamentSeasonBoard, position: str | None) -> str:
+        info = "Built from the players whose season data was fetched so far, not from every player of the tournament."
+        unknown = sum(row.position is None for row in board.rows.values()) if position else 0
+        if unknown:
+            info += f" {unknown} players whose position is unknown are left out."
+        return info
+
+
+LEADERBOARD_INDEX = LeaderboardIndex()
@@ -0,0 +1,142 @@
+from typing import Dict, List, Tuple
+from dataclasses import dataclass, field
+import threading
+import numpy as np
+from config import *
+from tools.modules import *
+
+
+_COLUMN_POSITIONS = [SEASON_STAT_COLUMNS.index(column) for column in PERCENTILE_STAT_COLUMNS]
+_PER_90 = np.array([column not in NON_ADDITIVE_STAT_COLUMNS for column in PERCENTILE_STAT_COLUMNS])
+_LOWER_IS_BETTER = [column in LOWER_IS_BETTER_STAT_COLUMNS for column in PERCENTILE_STAT_COLUMNS]
+_MINUTES_POSITION = SEASON_STAT_COLUMNS.index("minutesPlayed")
+
+
+def percentile_metrics(stats: StatBlock) -> np.ndarray | None:
+    """
+    The values a season is ranked on: per 90 minutes for counting stats, as reported for rates and ratings.
+    None when the player played fewer than `PERCENTILE_MIN_MINUTES`.
+    """
+    values = np.frombuffer(stats.values, dtype=np.float64)
+    minutes = values[_MINUTES_POSITION]
+    if not minutes >= PERCENTILE_MIN_MINUTES:
+        return None
+    selected = values[_COLUMN_POSITIONS]
+    return np.where(_PER_90, selected * (90.0 / minutes), selected)
+
+
+@dataclass
+class PercentileGroup:
+    """The seasons of one (tournament, season, position), with one sorted array per stat."""
+    metrics: Dict[int, np.ndarray] = field(default_factory=dict)
+    sorted_values: List[np.ndarray] = field(default_factory=lambda: [np.empty(0) for _ in PERCENTILE_STAT_COLUMNS])
+
+    def _remove(self, metrics: np.ndarray):
+        for position, value in enumerate(metrics):
+            if value == value:
+                column = self.sorted_values[position]
+                self.sorted_values[position] = np.delete(column, np.searchsorted(column, value))
+
+    def _insert(self, metrics: np.ndarray):
+        for position, value in enumerate(metrics):
+            if value == value:
+                column = self.sorted_values[position]
+                self.sorted_values[position] = np.insert(column, np.searchsorted(column, value), value)
+
+    def upsert(self, player_id: int, metrics: np.ndarray):
+        """Insert a season into the sorted arrays, replacing the previous values of the same player."""
+        previous = self.metrics.get(player_id)
+        if previous is not None:
+            if np.array_equal(previous, metrics, equal_nan=True):
+                return
+            self._remove(previous)
+        self.metrics[player_id] = metrics
+        self._insert(metrics)
+
+    def percentiles(self, metrics: np.ndarray) -> Dict[str, int]:
+        """
+        Share of the group, in percent, the given values match or beat: at or below them, at or above them for
+        `LOWER_IS_BETTER_STAT_COLUMNS` such as possessionLost. One `searchsorted` per stat.
+        """
+        result = {}
+        for position, value in enumerate(metrics):
+            column = self.sorted_values[position]
+            if value == value and len(column):
+                if _LOWER_IS_BETTER[position]:
+                    share = 1 - np.searchsorted(column, value, side="left") / len(column)
+                else:
+                    share = np.searchsorted(column, value, side="right") / len(column)
+                result[PERCENTILE_STAT_COLUMNS[position]] = int(round(100 * share))
+        return result
+
+
+class PercentileIndex:
+    """
+    Percentiles of season stats within (tournament id, unique season id, position), built from the season stats cache.
+
+    The index only knows the seasons that were fetched, so groups grow as more players are looked up.
+    `update` adds the cache entries it has not seen yet and only touches the groups they belong to.
+    """
+    def __init__(self):
+        self.groups: Dict[Tuple[int, int, str], PercentileGroup] = {}
+        self._indexed: Dict[Tuple[int, int], StatBlock] = {}
+        # Season tool calls of several sessions update and read the groups at the same time
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def group_key(season_stats: PlayerSeasonStats | CompactPlayerSeasonStats) -> Tuple[int, int, str]:
+        return (season_stats.tournament_id, season_stats.unique_season_id, season_stats.position)
+
+    def add(self, season_stats: CompactPlayerSeasonStats):
+        if not season_stats.position or season_stats.stats is None:
+            return
+        metrics = percentile_metrics(season_stats.stats)
+        if metrics is None:
+            return
+        self.groups.setdefault(self.group_key(season_stats), PercentileGroup()).upsert(season_stats.player_id, metrics)
+
+    def update(self, season_stats_cache: Dict[Tuple[int, int], CompactPlayerSeasonStats], positions: Dict[int, str]):
+        for key, season_stats in season_stats_cache.items():
+            if season_stats.position is None:
+                season_stats.position = positions.get(season_stats.player_id)
+            if season_stats.position is None or self._indexed.get(key) is season_stats.stats:
+                continue
+            self.add(season_stats)
+            self._indexed[key] = season_stats.stats
+
+    def percentiles(self, season_stats: PlayerSeasonStats) -> dict | None:
+        """
+        Percentiles of a season within its group.
+
+        Returns:
+            dict | None: {"sample_size": n, "position": p, "values": {stat: percentile}}, None when the group is
+                empty or the season is not rankable. Counting stats are compared per 90 minutes.
+        """
+        group = self.groups.get(self.group_key(season_stats))
+        if group is None or season_stats.stats is None:
+            return None
+        metrics = percentile_metrics(StatBlock.from_dict(season_stats.stats, SEASON_STAT_COLUMNS))
+        if metrics is None:
+            return None
+        return {
+            "sample_size": len(group.metrics),
+            "position": season_stats.position,
+            "values": group.percentiles(metrics),
+        }
+
+
+PERCENTILE_INDEX = PercentileIndex()
+
+
+def enrich_with_percentiles(results: List, season_stats_cache: dict, positions: dict) -> List:
+    """
+    Set `percentiles` on every `PlayerSeasonStats` of a tool result from the shared index.
+    `season_stats_cache` should be a snapshot of the cache, see `season_stats_snapshot`.
+    """
+    with PERCENTILE_INDEX.lock:
+        PERCENTILE_INDEX.update(season_stats_cache, positions)
+        for item in results:
+            if isinstance(item, PlayerSeasonStats):
+                item.position = item.position or positions.get(item.player_id)
+                item.percentiles = PERCENTILE_INDEX.percentiles(item)
+    return results
@@ -0,0 +1,149 @@
+from typing import Dict, List, Tuple, Any, Hashable
+from dataclasses import dataclass
+import numpy as np
+from config import *
+from tools.modules import *
+
+
+@dataclass
+class RatingsBatch:
+    """
+    The `seasonRatings` of many player seasons flattened into parallel arrays, one row per rated match.
+    Rows are kept in the order of the responses, so the per-group series are the match order Sofascore returns.
+    """
+    keys: List[Hashable]
+    group: np.ndarray          # int64 group index of every row
+    rating: np.ndarray         # float64 rating of every row
+    opponent_team_id: np.ndarray  # int64
+    is_big_game: np.ndarray    # bool
+    start_timestamp: np.ndarray   # int64, 0 when the event has no timestamp
+
+    @property
+    def group_count(self) -> int:
+        return len(self.keys)
+
+
+def load_ratings_batch(entries: List[Tuple[Hashable, dict, List[int]]]) -> RatingsBatch:
+    """
+    Load the ratings responses of many player seasons into one `RatingsBatch` in a single pass.
+
+    Args:
+        entries (List[Tuple[Hashable, dict, List[int]]]): (group key, `ratings` response, big club ids) triples.
+            Each triple becomes one group; the big club ids only apply to the rows of their own group.
+
+    Returns:
+        RatingsBatch: Rows of every rated match. Matches without a rating are skipped, like `process_player_ratings` does.
+    """
+    keys = []
+    groups, ratings, opponents, timestamps = [], [], [], []
+    big_keys = []
+
+    for group_index, (key, data, big_club_ids) in enumerate(entries):
+        keys.append(key)
+        rated = [rating_data for rating_data in data.get("seasonRatings", []) if rating_data.get("rating") is not None]
+        groups.append(np.full(len(rated), group_index, dtype=np.int64))
+        ratings.extend(rating_data["rating"] for rating_data in rated)
+        opponents.extend(
+            rating_data["event"]["awayTeam" if rating_data.get("isHome") else "homeTeam"]["id"] for rating_data in rated
+        )
+        timestamps.extend(rating_data["event"].get("startTimestamp") or 0 for rating_data in rated)
+        big_keys.append((group_index << 32) | np.asarray(big_club_ids or [], dtype=np.int64))
+
+    group = np.concatenate(groups) if groups else np.zeros(0, dtype=np.int64)
+    opponent_team_id = np.asarray(opponents, dtype=np.int64)
+
+    # One hashed membership test for every group: (group, opponent) pairs against (group, big club) pairs
+    is_big_game = np.isin((group << 32) | opponent_team_id, np.concatenate(big_keys) if big_keys else [])
+
+    return RatingsBatch(
+        keys=keys,
+        group=group,
+        rating=np.asarray(ratings, dtype=np.float64),
+        opponent_team_id=opponent_team_id,
+        is_big_game=is_big_game,
+        start_timestamp=np.asarray(timestamps, dtype=np.int64)
+    )
+
+def grouped_rating_summary(batch: RatingsBatch) -> Dict[str, np.ndarray]:
+    """
+    Game counts, mean, standard deviation and big game mean of every group with grouped reductions.
+
+    Returns:
+        Dict[str, np.ndarray]: Arrays of length `batch.group_count`. Means and deviations are NaN for groups without ratings.
+    """
+    n = batch.group_count
+    game_count = np.bincount(batch.group, minlength=n)
+    rating_sum = np.bincount(batch.group, weights=batch.rating, minlength=n)
+
+    big_group = batch.group[batch.is_big_game]
+    big_game_count = np.bincount(big_group, minlength=n)
+    big_rating_sum = np.bincount(big_group, weights=batch.rating[batch.is_big_game], minlength=n)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average_rating = rating_sum / game_count
+        # Two pass deviation, so the result matches np.std of every group
+        deviation = batch.rating - average_rating[batch.group]
+        rating_std_dev = np.sqrt(np.bincount(batch.group, weights=deviation * deviation, minlength=n) / game_count)
+        average_big_game_rating = big_rating_sum / big_game_count
+
+    return {
+        "game_count": game_count,
+        "big_game_count": big_game_count,
+        "average_rating": average_rating,
+        "rating_std_dev": rating_std_dev,
+        "average_big_game_rating": average_big_game_rating,
+    }
+
+def grouped_band_summary(batch: RatingsBatch, bands: np.ndarray, band_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Game counts and mean ratings of every group against every opponent strength band, with one grouped reduction
+    over (group, band) cells. Rows with band -1 (opponent without a strength rating) are left out.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (group_count, band_count) arrays of game counts and means, NaN for empty cells.
+    """
+    cell_count = batch.group_count * band_count
+    known = bands >= 0
+    cells = batch.group[known] * band_count + bands[known]
+    game_count = np.bincount(cells, minlength=cell_count).reshape(batch.group_count, band_count)
+    rating_sum = np.bincount(cells, weights=batch.rating[known], minlength=cell_count).reshape(batch.group_count, band_count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return game_count, rating_sum / game_count
+
+def _value_or_none(value: float) -> float | None:
+    return None if np.isnan(value) else float(value)
+
+def process_ratings_batch(entries: List[Tuple[Hashable, dict, List[int]]], strength=None) -> Dict[Hashable, ProcessedRating]:
+    """
+    Vectorized `process_player_ratings` for many player seasons at once.
+
+    Args:
+        strength (TeamStrength | None): When given, the ratings are also split by the strength band of the opponent.
+
+    Returns:
+        Dict[Hashable, ProcessedRating]: Group key -> the dictionary `process_player_ratings` returns for that season,
+            with "opponent_band_ratings" ({band: {"games", "average_rating"}}) when `strength` is given.
+    """
+    batch = load_ratings_batch(entries)
+    summary = grouped_rating_summary(batch)
+
+    processed = {
+        key: {
+            "game_count": int(summary["game_count"][index]),
+            "big_game_count": int(summary["big_game_count"][index]),
+            "average_rating": _value_or_none(summary["average_rating"][index]),
+            "rating_std_dev": _value_or_none(summary["rating_std_dev"][index]),
+            "average_big_game_rating": _value_or_none(summary["average_big_game_rating"][index]),
+        }
+        for index, key in enumerate(batch.keys)
+    }
+
+    if strength is not None:
+        band_games, band_averages = grouped_band_summary(batch, strength.opponent_bands(batch.opponent_team_id), len(TEAM_STRENGTH_BANDS))
+        for index, key in enumerate(batch.keys):
+            processed[key]["opponent_band_ratings"] = {
+                band: {"games": int(band_games[index, position]), "average_rating": _value_or_none(band_averages[index, position])}
+                for position, band in enumerate(TEAM_STRENGTH_BANDS)
+                if band_games[index, position]
+            }
+    return processed
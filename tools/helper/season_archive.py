@@ -0,0 +1,235 @@
+from typing import Dict, List, Tuple
+from datetime import date
+import json
+import os
+import shutil
+import time
+import numpy as np
+from config import *
+from tools.modules import *
+
+
+# Columns of the `ids` matrices, one row per archived player season
+_ID_COLUMNS = ("player_id", "tournament_id", "unique_season_id", "season_year", "played")
+# One row per rated match of an archived season, the fields the ratings engine and the form tracker read
+RATING_MATCH_DTYPE = np.dtype([
+    ("event_id", np.int64),
+    ("start_timestamp", np.int64),
+    ("home_team_id", np.int64),
+    ("away_team_id", np.int64),
+    ("is_home", np.bool_),
+    ("rating", np.float64),
+])
+_ARRAYS = ("stats_keys", "stats_ids", "stats_values", "stats_int_bits", "ratings_keys", "ratings_ids", "ratings_offsets", "ratings_matches")
+_NOT_PLAYED = {"error": {"code": 404, "message": "Not Found"}}
+
+
+def archive_key(player_id: int, unique_season_id: int) -> int:
+    """(player id, unique season id) packed into the int64 the id index is sorted on."""
+    return int(player_id) << 32 | int(unique_season_id)
+
+def current_season_year(today: date | None = None) -> int:
+    today = today or date.today()
+    return today.year if today.month >= SEASON_ARCHIVE_NEW_SEASON_MONTH else today.year - 1
+
+def season_finished(season_year: int | None) -> bool:
+    """Only seasons of earlier years than the current one are archived, their stats and ratings no longer change."""
+    return season_year is not None and int(season_year) < current_season_year()
+
+
+class SeasonArchive:
+    """
+    Stats and ratings of finished player seasons as fixed-schema NumPy arrays, memory-mapped read-only.
+
+    Stats are one `SEASON_STAT_COLUMNS` row per season (NaN when missing) with the int bits of `StatBlock` packed
+    next to it. Ratings are the rated matches of every season in one `RATING_MATCH_DTYPE` array, sliced by offsets.
+    Both are found through a sorted array of `archive_key`s, so a lookup is one `searchsorted` and a stats lookup
+    returns a `StatBlock` over the mapped row without copying it. Seasons the player did not play are archived
+    too and answer like the 404 of Sofascore.
+
+    Every backfill writes a new generation directory and then swaps the `CURRENT` pointer file, so worker
+    processes share the page cache of the files and pick up a new generation on their next lookup.
+    """
+    def __init__(self, path: str = SEASON_ARCHIVE_PATH):
+        self.path = path
+        self.generation: str | None = None
+        self._pointer_stat: Tuple[int, int] | None = None
+        self.arrays: Dict[str, np.ndarray] = self.empty_arrays()
+
+    @staticmethod
+    def empty_arrays() -> Dict[str, np.ndarray]:
+        return {
+            "stats_keys": np.zeros(0, dtype=np.int64),
+            "stats_ids": np.zeros((0, len(_ID_COLUMNS)), dtype=np.int64),
+            "stats_values": np.zeros((0, len(SEASON_STAT_COLUMNS))),
+            "stats_int_bits": np.zeros((0, (len(SEASON_STAT_COLUMNS) + 7) // 8), dtype=np.uint8),
+            "ratings_keys": np.zeros(0, dtype=np.int64),
+            "ratings_ids": np.zeros((0, len(_ID_COLUMNS)), dtype=np.int64),
+            "ratings_offsets": np.zeros(1, dtype=np.int64),
+            "ratings_matches": np.zeros(0, dtype=RATING_MATCH_DTYPE),
+        }
+
+    def __len__(self) -> int:
+        return len(self.arrays["stats_keys"]) + len(self.arrays["ratings_keys"])
+
+    def _pointer(self) -> str:
+        return os.path.join(self.path, "CURRENT")
+
+    def refresh(self):
+        """Map the current generation when the pointer file changed since the last lookup."""
+        try:
+            pointer = os.stat(self._pointer())
+        except FileNotFoundError:
+            return
+        # `os.replace` gives the pointer a new inode, so equal mtimes of two quick backfills are told apart too
+        if (pointer.st_ino, pointer.st_mtime_ns) == self._pointer_stat:
+            return
+        self._pointer_stat = (pointer.st_ino, pointer.st_mtime_ns)
+        try:
+            with open(self._pointer(), encoding="utf-8") as file:
+                generation = file.read().strip()
+            directory = os.path.join(self.path, generation)
+            with open(os.path.join(directory, "schema.json"), encoding="utf-8") as file:
+                schema = json.load(file)
+            if schema.get("stat_columns") != list(SEASON_STAT_COLUMNS):
+                logger.info(f"The season archive at {directory} does not match the current schema and is ignored.")
+                return
+            self.arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+            self.generation = generation
+        except (FileNotFoundError, ValueError) as e:
+            logger.info(f"No season archive loaded from {self.path}: {e}")
+
+    @staticmethod
+    def _row(keys: np.ndarray, player_id, unique_season_id) -> int | None:
+        key = archive_key(player_id, unique_season_id)
+        row = int(np.searchsorted(keys, key))
+        return row if row < len(keys) and keys[row] == key else None
+
+    def stats_response(self, player_id: int, unique_season_id: int) -> dict | None:
+        """
+        The archived season stats in the shape of the Sofascore response, None when the season is not archived.
+        `statistics` is a `StatBlock` whose values are the mapped row itself.
+        """
+        self.refresh()
+        row = self._row(self.arrays["stats_keys"], player_id, unique_season_id)
+        if row is None:
+            return None
+        if not self.arrays["stats_ids"][row, _ID_COLUMNS.index("played")]:
+            return _NOT_PLAYED
+        int_mask = int.from_bytes(self.arrays["stats_int_bits"][row].tobytes(), "little")
+        return {"statistics": StatBlock(SEASON_STAT_COLUMNS, self.arrays["stats_values"][row], int_mask, None)}
+
+    def ratings_response(self, player_id: int, unique_season_id: int) -> dict | None:
+        """The archived rated matches in the shape of the Sofascore ratings response, None when the season is not archived."""
+        self.refresh()
+        row = self._row(self.arrays["ratings_keys"], player_id, unique_season_id)
+        if row is None:
+            return None
+        if not self.arrays["ratings_ids"][row, _ID_COLUMNS.index("played")]:
+            return _NOT_PLAYED
+        offsets = self.arrays["ratings_offsets"]
+        matches = self.arrays["ratings_matches"][offsets[row]:offsets[row + 1]]
+        return {"seasonRatings": [
+            {
+                "rating": rating,
+                "isHome": is_home,
+                "event": {"id": event_id, "startTimestamp": start_timestamp, "homeTeam": {"id": home_team_id}, "awayTeam": {"id": away_team_id}},
+            }
+            for event_id, start_timestamp, home_team_id, away_team_id, is_home, rating in matches.tolist()
+        ]}
+
+    def has(self, player_id: int, unique_season_id: int) -> bool:
+        self.refresh()
+        return (self._row(self.arrays["stats_keys"], player_id, unique_season_id) is not None
+                and self._row(self.arrays["ratings_keys"], player_id, unique_season_id) is not None)
+
+    def write(self, seasons: List[Tuple[dict, dict, dict]]) -> int:
+        """
+        Write a new generation with the archived seasons and `seasons`, then point `CURRENT` at it.
+
+        Args:
+            seasons (List[Tuple[dict, dict, dict]]): (url param, stats response, ratings response) of finished seasons.
+                Responses of failed requests other than a 404 are skipped.
+
+        Returns:
+            int: The number of seasons added.
+        """
+        self.refresh()
+        stats_rows, ratings_rows = {}, {}
+        for param, stats, ratings in seasons:
+            ids = [int(param["PLAYER_ID"]), int(param["TOURNAMENT_ID"]), int(param["UNIQUE_SEASON_ID"]), int(param["SEASON_YEAR"])]
+            key = archive_key(ids[0], ids[2])
+            stats_error = (stats.get("error") or {}).get("code")
+            if stats_error in (None, 404):
+                block = StatBlock.from_dict(stats.get("statistics") or {}, SEASON_STAT_COLUMNS)
+                bits = np.packbits([block.int_mask >> position & 1 for position in range(len(SEASON_STAT_COLUMNS))], bitorder="little")
+                stats_rows[key] = (ids + [int(stats_error is None)], np.frombuffer(block.values, dtype=np.float64), bits)
+            ratings_error = (ratings.get("error") or {}).get("code")
+            if ratings_error in (None, 404):
+                matches = [
+                    (rating_data["event"].get("id") or 0, rating_data["event"].get("startTimestamp") or 0,
+                     rating_data["event"]["homeTeam"]["id"], rating_data["event"]["awayTeam"]["id"],
+                     bool(rating_data.get("isHome")), rating_data["rating"])
+                    for rating_data in ratings.get("seasonRatings", []) if rating_data.get("rating") is not None
+                ]
+                ratings_rows[key] = (ids + [int(ratings_error is None)], np.array(matches, dtype=RATING_MATCH_DTYPE))
+
+        arrays = self.merged(stats_rows, ratings_rows)
+        generation = f"{time.time_ns()}-{os.getpid()}"
+        directory = os.path.join(self.path, generation)
+        os.makedirs(directory)
+        for name, values in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), values)
+        with open(os.path.join(directory, "schema.json"), "w", encoding="utf-8") as file:
+            json.dump({"stat_columns": list(SEASON_STAT_COLUMNS), "id_columns": list(_ID_COLUMNS)}, file)
+
+        # Readers still mapping the previous generation keep it until their next lookup
+        temporary = f"{self._pointer()}.{generation}"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(generation)
+        os.replace(temporary, self._pointer())
+        previous = self.generation
+        for name in os.listdir(self.path):
+            if name not in (generation, previous, "CURRENT") and os.path.isdir(os.path.join(self.path, name)):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        self.refresh()
+        return len(set(stats_rows) | set(ratings_rows))
+
+    def merged(self, stats_rows: dict, ratings_rows: dict) -> Dict[str, np.ndarray]:
+        """The archived arrays with the new rows, new rows replacing archived ones of the same season, sorted by key."""
+        arrays = self.arrays
+        keep = ~np.isin(arrays["stats_keys"], list(stats_rows))
+        stats_keys = np.concatenate([arrays["stats_keys"][keep], np.array(list(stats_rows), dtype=np.int64)])
+        stats_order = np.argsort(stats_keys, kind="stable")
+        new_stats = list(stats_rows.values())
+
+        def stack(archived: np.ndarray, keep: np.ndarray, new: list, shape: tuple, dtype) -> np.ndarray:
+            return np.concatenate([archived[keep], np.array(new, dtype=dtype).reshape((-1,) + shape)])
+
+        stats_ids = stack(arrays["stats_ids"], keep, [row[0] for row in new_stats], (len(_ID_COLUMNS),), np.int64)
+        stats_values = stack(arrays["stats_values"], keep, [row[1] for row in new_stats], (len(SEASON_STAT_COLUMNS),), np.float64)
+        stats_int_bits = stack(arrays["stats_int_bits"], keep, [row[2] for row in new_stats], arrays["stats_int_bits"].shape[1:], np.uint8)
+
+        keep = ~np.isin(arrays["ratings_keys"], list(ratings_rows))
+        offsets = arrays["ratings_offsets"]
+        match_lists = [arrays["ratings_matches"][offsets[row]:offsets[row + 1]] for row in np.flatnonzero(keep)]
+        match_lists += [row[1] for row in ratings_rows.values()]
+        ratings_keys = np.concatenate([arrays["ratings_keys"][keep], np.array(list(ratings_rows), dtype=np.int64)])
+        ratings_ids = stack(arrays["ratings_ids"], keep, [row[0] for row in ratings_rows.values()], (len(_ID_COLUMNS),), np.int64)
+        ratings_order = np.argsort(ratings_keys, kind="stable")
+        match_lists = [match_lists[row] for row in ratings_order]
+        lengths = np.array([len(matches) for matches in match_lists], dtype=np.int64)
+
+        return {
+            "stats_keys": stats_keys[stats_order],
+            "stats_ids": stats_ids[stats_order],
+            "stats_values": stats_values[stats_order],
+            "stats_int_bits": stats_int_bits[stats_order],
+            "ratings_keys": ratings_keys[ratings_order],
+            "ratings_ids": ratings_ids[ratings_order],
+            "ratings_offsets": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            "ratings_matches": np.concatenate(match_lists) if match_lists else np.zeros(0, dtype=RATING_MATCH_DTYPE),
+        }
+
+
+SEASON_ARCHIVE = SeasonArchive()
@@ -1,20 +1,45 @@
 from langchain_core.tools import tool
-from typing import Dict, List, Union, Optional, TypedDict, Literal, Any
+from typing import Dict, List, Union, Optional, TypedDict, Literal, Any, Iterator, AsyncIterator, Tuple
 import requests
 import numpy as np
 from boto3.dynamodb.conditions import Key, Attr
 from config import *
 from tools.modules import *
+from tools.helper.deadline import request_timeout, check_deadline, DeadlineExceeded
+from tools.helper.execution_cache import execution_step
+from tools.helper.streaming import iter_completed, collect_results
+from tools.helper.async_fetch import asofascore_get, alambda_post, aiter_completed
+from tools.helper.ratings_engine import process_ratings_batch
+from tools.helper.team_strength import TEAM_STRENGTH, refresh_team_strength, arefresh_team_strength
+from tools.helper.season_archive import SEASON_ARCHIVE
+from tools.helper.form import season_form
+from tools.helper.season_stats import aget_player_property, aresolve_player_ids, acreate_url_params, request_player_position, arequest_player_position
+import asyncio
 import boto3
 from decimal import Decimal
 import time
+import threading
+from collections import OrderedDict
 
 from dataclasses import dataclass
 
 
+# (player id, unique season id) -> PlayerSeasonRatings of every season ratings response fetched so far
+SEASON_RATINGS_CACHE = OrderedDict()
+SEASON_RATINGS_CACHE_LOCK = threading.Lock()
+
+
+def opponent_strength():
+    """The team strength model the season ratings use, None when big games come from market values."""
+    if OPPONENT_STRENGTH_MODEL == "elo" and len(TEAM_STRENGTH):
+        return TEAM_STRENGTH
+    return None
+
+@execution_step
 def get_big_club_ids(input_team_id: int, table_name: str):
     """
     Finds other teams with at least 80% of the market value of the input team from DynamoDB using a GSI.
+    With the Elo team strength model, the big clubs come from its ratings instead and no scan is made.
     
     Args:
         input_team_id (int): The ID of the input team.
@@ -24,12 +49,17 @@ def get_big_club_ids(input_team_id: int, table_name: str):
     Returns:
         list: List of team IDs with at least 80% of the market value of the input team.
     """
+    strength = opponent_strength()
+    big_club_ids = strength.big_club_ids(input_team_id) if strength else None
+    if big_club_ids is not None:
+        return big_club_ids
     
     # Reference the DynamoDB table
     try:
         # Query DynamoDB for the input team to get its market value
         response = requests.post(
             url=QUERY_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
             json = {
                 "table_name": "dim_teams",
                 "index_name": 'TEAM_ID',
@@ -45,34 +75,9 @@ def get_big_club_ids(input_team_id: int, table_name: str):
         input_team_row = response['Items'][0]
         input_market_value = Decimal(input_team_row['TOTAL_MARKET_VALUE'])
 
-        # Calculate the threshold market value (80% of the input team's market value)
-        threshold = int(0.8 * float(input_market_value))
-
-        # Retrieve all teams with market value >= threshold using the GSI
-        scan_payload = {
-            "table_name": table_name,
-            "index_name": "TOTAL_MARKET_VALUE",
-            "filter": {
-                "type": "logical",
-                "operation": "and",
-                "subfilters": [
-                    {
-                        "type": "atomic",
-                        "attribute": "TOTAL_MARKET_VALUE",
-                        "operation": "gte",
-                        "value": threshold
-                    },
-                    {
-                        "type": "atomic",
-                        "attribute": "TEAM_ID",
-                        "operation": "ne",
-                        "value": input_team_id
-                    }
-                ]
-            }
-        }
+        scan_payload = create_big_clubs_scan_payload(input_team_id=input_team_id, input_market_value=input_market_value, table_name=table_name)
         
-        scan_response = requests.post(SCAN_LAMBDA_URL, json=scan_payload)
+        scan_response = requests.post(SCAN_LAMBDA_URL, json=scan_payload, timeout=request_timeout(LAMBDA_TIMEOUT))
         scan_response.raise_for_status()  # Raise an error for HTTP codes >= 400
         scan_results = scan_response.json()
 
@@ -83,10 +88,41 @@ def get_big_club_ids(input_team_id: int, table_name: str):
     except requests.exceptions.RequestException as e:
         print(f"HTTP Request Error: {e}")
         return []
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error retrieving big clubs: {e}")
         return []
 
+def create_big_clubs_scan_payload(input_team_id: int, input_market_value: Decimal, table_name: str) -> dict:
+    # Calculate the threshold market value (80% of the input team's market value)
+    threshold = int(0.8 * float(input_market_value))
+
+    # Retrieve all teams with market value >= threshold using the GSI
+    return {
+        "table_name": table_name,
+        "index_name": "TOTAL_MARKET_VALUE",
+        "filter": {
+            "type": "logical",
+            "operation": "and",
+            "subfilters": [
+                {
+                    "type": "atomic",
+                    "attribute": "TOTAL_MARKET_VALUE",
+                    "operation": "gte",
+                    "value": threshold
+                },
+                {
+                    "type": "atomic",
+                    "attribute": "TEAM_ID",
+                    "operation": "ne",
+                    "value": input_team_id
+                }
+            ]
+        }
+    }
+
+@execution_step
 def get_player_property(player_name: str, col_name: str) -> int | List[int] | None:
     """
     Tool to get the unique id or other property of a football player from DynamoDB.
@@ -105,6 +141,7 @@ def get_player_property(player_name: str, col_name: str) -> int | List[int] | No
         # Query DynamoDB for the player name
         response = requests.post(
             url=QUERY_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
             json = {
                 "table_name": "dim_players",
                 "gsi": "true",
@@ -136,31 +173,37 @@ def get_player_property(player_name: str, col_name: str) -> int | List[int] | No
             print(f"Player '{player_name}' not found in the database.")
             return None
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error retrieving data for player '{player_name}': {e}")
 
         
+@execution_step
 def request_player_seasons(player_id: int) -> dict:
     url = f"https://www.sofascore.com/api/v1/player/{str(player_id)}/statistics/seasons"
     if USE_PROXIES:
         for i, proxy in enumerate(PROXIES):
             try:
                 start_time = time.time()  # Start the timer
-                response = requests.get(url, proxies={"http": proxy}, timeout=10)
+                response = requests.get(url, proxies={"http": proxy}, timeout=request_timeout(10))
                 response_time = time.time() - start_time  # Calculate response time
                 if response.status_code == 200:
                     print(f"Success with proxy number {i+1} : {proxy} in {response_time:.2f} seconds")
                     return response.json()
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 time.sleep(2)  # Add delay to avoid bans
         raise Exception("All proxies failed!")
     else:
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, timeout=request_timeout(10))
         if response.status_code == 200:
             return response.json()
 
 # client
 
+@execution_step
 def create_url_params(player_id: int, tournament_name: str | None, tournament_country: str | None, season_year: int | None, table_name:str) -> List[dict]:
     """
     Tool to get the unique ids of tournaments and optionally a specific season.
@@ -212,6 +255,7 @@ def create_url_params(player_id: int, tournament_name: str | None, tournament_co
             # Query DynamoDB for the tournament name
             response = requests.post(
                 url=QUERY_LAMBDA_URL,
+                timeout=request_timeout(LAMBDA_TIMEOUT),
                 json = {
                     "table_name": table_name,
                     "gsi": "true",
@@ -231,6 +275,7 @@ def create_url_params(player_id: int, tournament_name: str | None, tournament_co
             url_params = []
             response = requests.post(
                 url=QUERY_LAMBDA_URL,
+                timeout=request_timeout(LAMBDA_TIMEOUT),
                 json = {
                     "table_name": table_name,
                     "gsi": "true",
@@ -263,65 +308,27 @@ def process_player_ratings(data: dict, big_club_ids: List[int]) -> ProcessedRati
         dict: A dictionary with games count, average rating, rating std deviation,
               and average rating against big clubs.
     """
-    season_ratings = data.get("seasonRatings", [])
-    
-    # Initialize lists for ratings and big club ratings
-    all_ratings = []
-    big_game_ratings = []
-    big_game_count = 0
-
-    for rating_data in season_ratings:
-        # Extract relevant data
-        rating = rating_data.get("rating")
-        is_home = rating_data.get("isHome")
-        home_team = rating_data["event"]["homeTeam"]["id"]
-        away_team = rating_data["event"]["awayTeam"]["id"]
-        
-        # Determine opponent team ID
-        own_team_id = home_team if is_home else away_team
-        opponent_team_id = away_team if is_home else home_team
-        
-        # Add the rating to the overall list
-        if rating is not None:
-            all_ratings.append(rating)
-            
-            # If the opponent is a big club, add the rating to the big club list
-            # TODO: Implement more scenarios to big game selection. e.g. All games in UCL
-            if opponent_team_id in big_club_ids:
-                big_game_ratings.append(rating)
-                big_game_count += 1
-    
-    # Calculate statistics
-    games_count = len(all_ratings)
-    average_rating = np.mean(all_ratings) if all_ratings else None
-    rating_std_dev = np.std(all_ratings) if all_ratings else None
-    average_big_game_rating = np.mean(big_game_ratings) if big_game_ratings else None
-    
-    # Return the results as a dictionary
-    return {
-        "game_count": games_count,
-        "big_game_count": big_game_count,
-        "average_rating": average_rating,
-        "rating_std_dev": rating_std_dev,
-        "average_big_game_rating": average_big_game_rating,
-    }
+    return process_ratings_batch([(0, data, big_club_ids)], strength=opponent_strength())[0]
 
+@execution_step
 def request_player_season_ratings(player_id, tournament_id, unique_season_id):
     url = f"https://www.sofascore.com/api/v1/player/{player_id}/unique-tournament/{tournament_id}/season/{unique_season_id}/ratings"
     if USE_PROXIES:
         for i, proxy in enumerate(PROXIES):
             try:
                 start_time = time.time()  # Start the timer
-                response = requests.get(url, proxies={"http": proxy}, timeout=10)
+                response = requests.get(url, proxies={"http": proxy}, timeout=request_timeout(10))
                 response_time = time.time() - start_time  # Calculate response time
                 if response.status_code == 200:
                     print(f"Success with proxy number {i+1} : {proxy} in {response_time:.2f} seconds")
                     return response.json()
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 time.sleep(2)  # Add delay to avoid bans
         raise Exception("All proxies failed!")
     else:
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, timeout=request_timeout(10))
         return response.json()
 
 def retrieve_player_season_ratings(player_name: str, param: dict, big_club_ids: List[int]) -> PlayerSeasonRatings:
@@ -330,18 +337,38 @@ def retrieve_player_season_ratings(player_name: str, param: dict, big_club_ids:
     if None in [player_id, tournament_id, unique_season_id]:
         raise ValueError("One of the ratings url parameters is None.")
 
-    ratings = request_player_season_ratings(player_id, tournament_id, unique_season_id)
+    # Leaderboards filter on the position of the player, requested once
+    request_player_position(player_id)
+    # Finished seasons are answered by the archive without a request
+    ratings = SEASON_ARCHIVE.ratings_response(player_id, unique_season_id) or request_player_season_ratings(player_id, tournament_id, unique_season_id)
+
+    return build_player_season_ratings(player_name=player_name, param=param, ratings=ratings, big_club_ids=big_club_ids)
 
+def ratings_played(ratings: dict) -> bool:
+    """False when the player did not play in the season, raises for any other failed request."""
     if ratings.get("error"):
         if ratings.get("error").get("code") == 404:
             error_info = "Player did not play in this tournament for this particular season"
-            return None
+            return False
         else:
             raise ValueError(f"URL request failed with code {ratings.get('error').get('code')} and message {ratings.get('error').get('message')}")
-    else:
+    return True
+
+def build_player_season_ratings(
+        player_name: str,
+        param: dict,
+        ratings: dict,
+        big_club_ids: List[int],
+        ratings_processed: ProcessedRating | None = None
+    ) -> PlayerSeasonRatings | None:
+    player_id, tournament_id, unique_season_id, tournament_name, season_year = param.get("PLAYER_ID"), param.get("TOURNAMENT_ID"), param.get("UNIQUE_SEASON_ID"), param.get("TOURNAMENT_NAME"), param.get("SEASON_YEAR")
+
+    if not ratings_played(ratings):
+        return None
+    if ratings_processed is None:
         ratings_processed = process_player_ratings(data=ratings, big_club_ids=big_club_ids)
 
-    return PlayerSeasonRatings(
+    player_season_ratings = PlayerSeasonRatings(
         player_id=int(player_id),
         player_name=player_name,
         tournament_name=tournament_name,
@@ -352,8 +379,44 @@ def retrieve_player_season_ratings(player_name: str, param: dict, big_club_ids:
         average_big_game_rating=ratings_processed["average_big_game_rating"],
         game_count=ratings_processed["game_count"],
         big_game_count=ratings_processed["big_game_count"],
-        rating_std_dev=ratings_processed["rating_std_dev"]
+        rating_std_dev=ratings_processed["rating_std_dev"],
+        opponent_band_ratings=ratings_processed.get("opponent_band_ratings"),
+        **season_form(key=(int(player_id), int(unique_season_id)), data=ratings)
     )
+    cache_season_ratings(player_season_ratings)
+    return player_season_ratings
+
+def cache_season_ratings(player_season_ratings: PlayerSeasonRatings):
+    key = (player_season_ratings.player_id, player_season_ratings.unique_season_id)
+    with SEASON_RATINGS_CACHE_LOCK:
+        SEASON_RATINGS_CACHE[key] = player_season_ratings
+        SEASON_RATINGS_CACHE.move_to_end(key)
+        if len(SEASON_RATINGS_CACHE) > SEASON_STATS_CACHE_SIZE:
+            SEASON_RATINGS_CACHE.popitem(last=False)
+
+def season_ratings_snapshot() -> Dict[Tuple[int, int], PlayerSeasonRatings]:
+    """A copy of `SEASON_RATINGS_CACHE` that is safe to iterate while the fetch pool adds to the cache."""
+    with SEASON_RATINGS_CACHE_LOCK:
+        return OrderedDict(SEASON_RATINGS_CACHE)
+
+def build_season_ratings_batch(items: List[Tuple[str, dict, dict, List[int]]]) -> List[PlayerSeasonRatings | None]:
+    """
+    Build the `PlayerSeasonRatings` of many player seasons with one pass of the vectorized ratings engine.
+
+    Args:
+        items (List[Tuple[str, dict, dict, List[int]]]): (player name, url param, ratings response, big club ids) of every season.
+
+    Returns:
+        List[PlayerSeasonRatings | None]: In the order of `items`, None for the seasons the player did not play.
+    """
+    played = [index for index, (_, _, ratings, _) in enumerate(items) if ratings_played(ratings)]
+    processed = process_ratings_batch([(index, items[index][2], items[index][3]) for index in played], strength=opponent_strength())
+
+    return [
+        build_player_season_ratings(player_name, param, ratings, big_club_ids, ratings_processed=processed[index])
+        if index in processed else None
+        for index, (player_name, param, ratings, big_club_ids) in enumerate(items)
+    ]
 
 def obtain_player_ratings(
         player_name: str, 
@@ -380,13 +443,88 @@ def obtain_player_ratings(
         table_name="dim_unique_seasons"
     )
     
-    player_ratings = []
+    items = []
     for param in url_params:
-        player_season_ratings = retrieve_player_season_ratings(player_name=player_name, param=param, big_club_ids=big_club_ids)
-        if player_season_ratings:
-            player_ratings.append(player_season_ratings)
+        if None in [param.get("PLAYER_ID"), param.get("TOURNAMENT_ID"), param.get("UNIQUE_SEASON_ID")]:
+            raise ValueError("One of the ratings url parameters is None.")
+        ratings = (SEASON_ARCHIVE.ratings_response(param.get("PLAYER_ID"), param.get("UNIQUE_SEASON_ID"))
+                   or request_player_season_ratings(param.get("PLAYER_ID"), param.get("TOURNAMENT_ID"), param.get("UNIQUE_SEASON_ID")))
+        items.append((player_name, param, ratings, big_club_ids))
+
+    # Every season of the player is processed in one pass
+    return [player_season_ratings for player_season_ratings in build_season_ratings_batch(items) if player_season_ratings]
+
+def create_season_ratings_jobs(player_ratings_parameters: List[PlayerSeasonParameters]) -> Tuple[List[dict], List[tuple]]:
+    """
+    Resolve the players and their big club opponents for every parameter set and list the season ratings requests they need.
 
-    return player_ratings
+    Returns:
+        Tuple[List[dict], List[tuple]]: Error dictionaries for bad inputs, and (key, function, args) fetch jobs
+            where the key is (parameter index, season index).
+    """
+    if OPPONENT_STRENGTH_MODEL == "elo":
+        refresh_team_strength()
+
+    error_messages = []
+    jobs = []
+    player_id_cache = {}
+    big_club_ids_cache = {}
+
+    for index, params in enumerate(player_ratings_parameters):
+        player_name = params.player_name
+        tournament_name = params.tournament_name
+        season_year = params.season_year
+        tournament_country = params.tournament_country
+        
+        player_id = player_id_cache.get(player_name)
+        if player_id is None:
+            player_id = get_player_property(player_name=player_name, col_name="PLAYER_ID")
+            player_id_cache[player_name] = player_id
+
+        if isinstance(player_id,list):
+            error_messages.append({"error": {"message": "404", "parameter": "player_name", "value": player_name}})
+            continue
+        elif player_id is None:
+            error_messages.append({"error": {"message": "405", "parameter": "player_name", "value": player_name}}) # Duplication
+            continue
+        elif isinstance(player_id, Decimal):
+            player_id = int(player_id)
+        
+        if player_name not in big_club_ids_cache:
+            team_id = get_player_property(player_name=player_name, col_name="TEAM_ID")
+            big_club_ids_cache[player_name] = get_big_club_ids(input_team_id=team_id, table_name="dim_teams")
+        big_club_ids = big_club_ids_cache[player_name]
+        
+        url_params = create_url_params(
+            player_id=player_id, 
+            tournament_name=tournament_name,
+            tournament_country=tournament_country, 
+            season_year=season_year,
+            table_name="dim_unique_seasons"
+        )
+        check_deadline()
+
+        for position, param in enumerate(url_params):
+            jobs.append(((index, position), retrieve_player_season_ratings, (player_name, param, big_club_ids)))
+
+    return error_messages, jobs
+
+def iter_multiple_player_ratings(player_ratings_parameters: List[PlayerSeasonParameters]) -> Iterator[Tuple[tuple, PlayerSeasonRatings | dict]]:
+    """
+    Yield season level ratings for multiple players as soon as each season is fetched.
+
+    Yields:
+        Tuple[tuple, PlayerSeasonRatings | dict]: (order key, result) pairs, or only error dictionaries for bad inputs.
+    """
+    error_messages, jobs = create_season_ratings_jobs(player_ratings_parameters)
+    if error_messages:
+        for position, error in enumerate(error_messages):
+            yield (position,), error
+        return
+
+    for key, player_season_ratings in iter_completed(jobs):
+        if player_season_ratings:
+            yield key, player_season_ratings
 
 def obtain_multiple_player_ratings(player_ratings_parameters: List[PlayerSeasonParameters]) -> List[PlayerSeasonRatings] | List[dict]:
     """
@@ -410,46 +548,111 @@ def obtain_multiple_player_ratings(player_ratings_parameters: List[PlayerSeasonP
             "Mauro Icardi": {"tournament_name": None, "season_year": 2023}
         }
     """
-    all_player_ratings = []
-    error_messages = []
-    player_id_cache = {}
+    return collect_results(iter_multiple_player_ratings(player_ratings_parameters))
+
+###############################################################
+# ASYNC FETCH
+###############################################################
+
+async def aget_big_club_ids(input_team_id: int, table_name: str) -> List[int]:
+    """Async counterpart of `get_big_club_ids`."""
+    strength = opponent_strength()
+    big_club_ids = strength.big_club_ids(input_team_id) if strength else None
+    if big_club_ids is not None:
+        return big_club_ids
+    try:
+        response = await alambda_post(QUERY_LAMBDA_URL, {
+            "table_name": "dim_teams",
+            "index_name": 'TEAM_ID',
+            "operation": "eq",
+            "query_value": input_team_id
+        })
 
-    for params in player_ratings_parameters:
-        player_name = params.player_name
-        tournament_name = params.tournament_name
-        season_year = params.season_year
-        tournament_country = params.tournament_country
-        
-        player_id = player_id_cache.get(player_name)
-        if player_id is None:
-            player_id = get_player_property(player_name=player_name, col_name="PLAYER_ID")
-            player_id_cache[player_name] = player_id
+        if 'Items' not in response or len(response['Items']) == 0:
+            raise ValueError(f"Team ID {input_team_id} not found in the database.")
+
+        input_market_value = Decimal(response['Items'][0]['TOTAL_MARKET_VALUE'])
+        scan_payload = create_big_clubs_scan_payload(input_team_id=input_team_id, input_market_value=input_market_value, table_name=table_name)
+        scan_results = await alambda_post(SCAN_LAMBDA_URL, scan_payload, raise_for_status=True)
+
+        return [int(item['TEAM_ID']) for item in scan_results]
 
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"Error retrieving big clubs: {e}")
+        return []
+
+async def arequest_player_season_ratings(player_id, tournament_id, unique_season_id):
+    return await asofascore_get(f"https://www.sofascore.com/api/v1/player/{player_id}/unique-tournament/{tournament_id}/season/{unique_season_id}/ratings")
+
+async def aretrieve_player_season_ratings(player_name: str, param: dict, big_club_ids: List[int]) -> PlayerSeasonRatings:
+    player_id, tournament_id, unique_season_id = param.get("PLAYER_ID"), param.get("TOURNAMENT_ID"), param.get("UNIQUE_SEASON_ID")
+
+    if None in [player_id, tournament_id, unique_season_id]:
+        raise ValueError("One of the ratings url parameters is None.")
+
+    ratings = SEASON_ARCHIVE.ratings_response(player_id, unique_season_id)
+    if ratings is None:
+        ratings, _ = await asyncio.gather(arequest_player_season_ratings(player_id, tournament_id, unique_season_id), arequest_player_position(player_id))
+    else:
+        await arequest_player_position(player_id)
+    return build_player_season_ratings(player_name=player_name, param=param, ratings=ratings, big_club_ids=big_club_ids)
+
+async def _abig_club_ids_of_player(player_name: str) -> List[int]:
+    team_id = await aget_player_property(player_name=player_name, col_name="TEAM_ID")
+    return await aget_big_club_ids(input_team_id=team_id, table_name="dim_teams")
+
+async def acreate_season_ratings_jobs(player_ratings_parameters: List[PlayerSeasonParameters]) -> Tuple[List[dict], List[tuple]]:
+    """Async counterpart of `create_season_ratings_jobs`. Names, big clubs and url parameters are resolved concurrently."""
+    player_ids, _ = await asyncio.gather(
+        aresolve_player_ids([params.player_name for params in player_ratings_parameters]),
+        arefresh_team_strength() if OPPONENT_STRENGTH_MODEL == "elo" else asyncio.sleep(0)
+    )
+
+    error_messages = []
+    resolved = []
+    for index, params in enumerate(player_ratings_parameters):
+        player_id = player_ids[params.player_name]
         if isinstance(player_id,list):
-            error_messages.append({"error": {"message": "404", "parameter": "player_name", "value": player_name}})
+            error_messages.append({"error": {"message": "404", "parameter": "player_name", "value": params.player_name}})
         elif player_id is None:
-            error_messages.append({"error": {"message": "405", "parameter": "player_name", "value": player_name}}) # Duplication
-        elif isinstance(player_id, Decimal):
-            player_id = int(player_id)
-        
-        team_id = get_player_property(player_name=player_name, col_name="TEAM_ID")
-        
-        #team_data = pd.read_csv(r"C:\Users\herdogan\Documents\GitHub\langgraph-test\team_data.csv")
-        #big_club_ids = get_big_club_ids(df=team_data, input_team_id=team_id)
-        
-        big_club_ids = get_big_club_ids(input_team_id=team_id, table_name="dim_teams")
-        
-        all_player_ratings.extend(
-            obtain_player_ratings(
-                player_name=player_name,
-                tournament_name=tournament_name,
-                season_year=season_year,
-                tournament_country=tournament_country,
+            error_messages.append({"error": {"message": "405", "parameter": "player_name", "value": params.player_name}}) # Duplication
+        else:
+            resolved.append((index, params, int(player_id)))
+
+    player_names = list(dict.fromkeys(params.player_name for _, params, _ in resolved))
+    big_club_ids, all_url_params = await asyncio.gather(
+        asyncio.gather(*[_abig_club_ids_of_player(player_name) for player_name in player_names]),
+        asyncio.gather(*[
+            acreate_url_params(
                 player_id=player_id,
-                big_club_ids=big_club_ids
+                tournament_name=params.tournament_name,
+                tournament_country=params.tournament_country,
+                season_year=params.season_year,
+                table_name="dim_unique_seasons"
             )
-        )
+            for _, params, player_id in resolved
+        ])
+    )
+    big_club_ids = dict(zip(player_names, big_club_ids))
+    check_deadline()
+
+    jobs = []
+    for (index, params, _), url_params in zip(resolved, all_url_params):
+        for position, param in enumerate(url_params):
+            jobs.append(((index, position), aretrieve_player_season_ratings, (params.player_name, param, big_club_ids[params.player_name])))
+
+    return error_messages, jobs
+
+async def aiter_multiple_player_ratings(player_ratings_parameters: List[PlayerSeasonParameters]) -> AsyncIterator[Tuple[tuple, PlayerSeasonRatings | dict]]:
+    """Async counterpart of `iter_multiple_player_ratings`."""
+    error_messages, jobs = await acreate_season_ratings_jobs(player_ratings_parameters)
     if error_messages:
-        return error_messages
-    
-    return all_player_ratings
\ No newline at end of file
+        for position, error in enumerate(error_messages):
+            yield (position,), error
+        return
+
+    async for key, player_season_ratings in aiter_completed(jobs):
+        if player_season_ratings:
+            yield key, player_season_ratings
@@ -1,5 +1,5 @@
 from langchain_core.tools import tool
-from typing import Dict, List, Union, Optional, Literal, Any
+from typing import Dict, List, Union, Optional, Literal, Any, Iterator, AsyncIterator, Tuple
 import requests
 from boto3.dynamodb.conditions import Key
 from decimal import Decimal
@@ -7,27 +7,50 @@ from config import *
 import boto3
 from dataclasses import dataclass
 from tools.modules import *
+from tools.helper.deadline import request_timeout, check_deadline, DeadlineExceeded
+from tools.helper.execution_cache import execution_step
+from tools.helper.streaming import iter_completed, collect_results
+from tools.helper.async_fetch import asofascore_get, alambda_post, aquery_property, aiter_completed
+from tools.helper.season_archive import SEASON_ARCHIVE
+import asyncio
 import time
+import threading
+from collections import OrderedDict
 
+
+# (player id, unique season id) -> CompactPlayerSeasonStats of every season stats response fetched so far
+SEASON_STATS_CACHE = OrderedDict()
+# The fetch pool threads write the cache while other sessions read it, readers iterate `season_stats_snapshot()`
+SEASON_STATS_CACHE_LOCK = threading.Lock()
+# player id -> position letter (G, D, M, F) from the Sofascore player endpoint, requested with the first season stats of the player
+PLAYER_POSITIONS = {}
+# player id -> birth date as a unix timestamp, from the same response
+PLAYER_BIRTH_TIMESTAMPS = {}
+
+
+@execution_step
 def request_player_seasons(player_id: int) -> dict:
     url = f"https://www.sofascore.com/api/v1/player/{str(player_id)}/statistics/seasons"
     if USE_PROXIES:
         for i, proxy in enumerate(PROXIES):
             try:
                 start_time = time.time()  # Start the timer
-                response = requests.get(url, proxies={"http": proxy}, timeout=10)
+                response = requests.get(url, proxies={"http": proxy}, timeout=request_timeout(10))
                 response_time = time.time() - start_time  # Calculate response time
                 if response.status_code == 200:
                     print(f"Success with proxy number {i+1} : {proxy} in {response_time:.2f} seconds")
                     return response.json()
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 time.sleep(2)  # Add delay to avoid bans
         raise Exception("All proxies failed!")
     else:
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, timeout=request_timeout(10))
         if response.status_code == 200:
             return response.json()
 
+@execution_step
 def get_player_property(player_name: str, col_name: str) -> int | List[int] | None:
     """
     Tool to get the unique id or other property of a football player from DynamoDB.
@@ -46,6 +69,7 @@ def get_player_property(player_name: str, col_name: str) -> int | List[int] | No
         # Query DynamoDB for the player name
         response = requests.post(
             url=QUERY_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
             json = {
                 "table_name": "dim_players",
                 "gsi": "true",
@@ -77,9 +101,12 @@ def get_player_property(player_name: str, col_name: str) -> int | List[int] | No
             print(f"Player '{player_name}' not found in the database.")
             return None
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error retrieving data for player '{player_name}': {e}")
 
+@execution_step
 def create_url_params(player_id: int, tournament_name: str | None, tournament_country: str | None, season_year: int | None, table_name: str) -> List[dict]:
     """
     Tool to get the unique ids of tournaments and optionally a specific season.
@@ -95,96 +122,92 @@ def create_url_params(player_id: int, tournament_name: str | None, tournament_co
 
     # Reference the DynamoDB table dim_unique_seasons
 
-    if tournament_country and tournament_name:
-        tournament_query_field = "TOURNAMENT_FULL_NAME"
-        tournament_query_key = tournament_country + "-" + tournament_name
-    else:
-        tournament_query_field = "TOURNAMENT_NAME"
-        tournament_query_key = tournament_name
-
     if tournament_name is None:
         if season_year is None:
             # When both tournament_name and season_year are None
             raise ValueError("At least one of tournament_name or season_year must be provided.")
         else:
             # When only season_year is specified, query by season year
-            url_params = []
             response = request_player_seasons(player_id=player_id)  # Assuming this fetches necessary data
-            for item in response["uniqueTournamentSeasons"]:
-                tournament_id = item["uniqueTournament"]["id"]
-                for season in item["seasons"]:
-                    if season["year"] in [str(season_year), str(season_year)[-2:] + "/" + str(season_year+1)[-2:]]:
-                        url_params.append(
-                            {
-                                "PLAYER_ID": player_id,
-                                "TOURNAMENT_ID": tournament_id,
-                                "UNIQUE_SEASON_ID": season["id"],
-                                "TOURNAMENT_NAME": item["uniqueTournament"]["name"],
-                                "SEASON_YEAR": season_year
-                            }
-                        )
+            url_params = parse_player_seasons(response=response, player_id=player_id, season_year=season_year)
                 
     else:
-        if season_year is None:
-            # When only tournament_name is specified
-            url_params = []
-            # Query DynamoDB for the tournament name
-            response = requests.post(
-                url=QUERY_LAMBDA_URL,
-                json = {
-                    "table_name": table_name,
-                    "gsi": "true",
-                    "index_name": tournament_query_field,
-                    "operation": "eq",
-                    "query_value": tournament_query_key
-                }
-            ).json()
-            if 'Items' in response and len(response['Items']) > 0:
-                for item in response['Items']:
-                    item["PLAYER_ID"] = player_id
-                    url_params.append(item)
-            else:
-                print(f"Tournament '{tournament_name}' not found.")
-        else:
-            # When both tournament_name and season_year are specified
-            url_params = []
-            response = requests.post(
-                url=QUERY_LAMBDA_URL,
-                json = {
-                    "table_name": table_name,
-                    "gsi": "true",
-                    "index_name": tournament_query_field,
-                    "operation": "eq",
-                    "query_value": tournament_query_key
-                }
-            ).json()
-            if 'Items' in response and len(response['Items']) > 0:
-                for item in response['Items']:
-                    # Assuming that "SEASON_YEAR" is part of the item and matches
-                    if item["SEASON_YEAR"] == season_year:
-                        item["PLAYER_ID"] = player_id
-                        url_params.append(item)
-            else:
-                print(f"Tournament '{tournament_name}' not found.")
+        # Query DynamoDB for the tournament name
+        response = requests.post(
+            url=QUERY_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
+            json=create_tournament_seasons_payload(tournament_name, tournament_country, table_name)
+        ).json()
+        url_params = parse_tournament_seasons(response=response, player_id=player_id, tournament_name=tournament_name, season_year=season_year)
 
     return url_params
 
+def create_tournament_seasons_payload(tournament_name: str, tournament_country: str | None, table_name: str) -> dict:
+    if tournament_country and tournament_name:
+        tournament_query_field = "TOURNAMENT_FULL_NAME"
+        tournament_query_key = tournament_country + "-" + tournament_name
+    else:
+        tournament_query_field = "TOURNAMENT_NAME"
+        tournament_query_key = tournament_name
+
+    return {
+        "table_name": table_name,
+        "gsi": "true",
+        "index_name": tournament_query_field,
+        "operation": "eq",
+        "query_value": tournament_query_key
+    }
+
+def parse_player_seasons(response: dict, player_id: int, season_year: int) -> List[dict]:
+    """The url parameters of every tournament season of the player in `season_year`, from the player seasons response."""
+    url_params = []
+    for item in response["uniqueTournamentSeasons"]:
+        tournament_id = item["uniqueTournament"]["id"]
+        for season in item["seasons"]:
+            if season["year"] in [str(season_year), str(season_year)[-2:] + "/" + str(season_year+1)[-2:]]:
+                url_params.append(
+                    {
+                        "PLAYER_ID": player_id,
+                        "TOURNAMENT_ID": tournament_id,
+                        "UNIQUE_SEASON_ID": season["id"],
+                        "TOURNAMENT_NAME": item["uniqueTournament"]["name"],
+                        "SEASON_YEAR": season_year
+                    }
+                )
+    return url_params
+
+def parse_tournament_seasons(response: dict, player_id: int, tournament_name: str, season_year: int | None) -> List[dict]:
+    """The url parameters of the tournament seasons in a `dim_unique_seasons` response, all of them when `season_year` is None."""
+    url_params = []
+    if 'Items' in response and len(response['Items']) > 0:
+        for item in response['Items']:
+            # Assuming that "SEASON_YEAR" is part of the item and matches
+            if season_year is None or item["SEASON_YEAR"] == season_year:
+                item["PLAYER_ID"] = player_id
+                url_params.append(item)
+    else:
+        print(f"Tournament '{tournament_name}' not found.")
+    return url_params
+
+@execution_step
 def request_player_season_stats(player_id, tournament_id, unique_season_id):
     url = f"https://www.sofascore.com/api/v1/player/{player_id}/unique-tournament/{tournament_id}/season/{unique_season_id}/statistics/overall"
     if USE_PROXIES:
         for i, proxy in enumerate(PROXIES):
             try:
                 start_time = time.time()  # Start the timer
-                response = requests.get(url, proxies={"http": proxy}, timeout=10)
+                response = requests.get(url, proxies={"http": proxy}, timeout=request_timeout(10))
                 response_time = time.time() - start_time  # Calculate response time
                 if response.status_code == 200:
                     print(f"Success with proxy number {i+1} : {proxy} in {response_time:.2f} seconds")
                     return response.json()
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 time.sleep(2)  # Add delay to avoid bans
         raise Exception("All proxies failed!")
     else:
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, timeout=request_timeout(10))
         return response.json()
 
 def create_player_season_stats(player_name: str, param: dict) -> PlayerSeasonStats:
@@ -193,7 +216,15 @@ def create_player_season_stats(player_name: str, param: dict) -> PlayerSeasonSta
     if None in [player_id, tournament_id, unique_season_id]:
         raise ValueError("One of the stats url parameters is None.")
 
-    stats = request_player_season_stats(player_id, tournament_id, unique_season_id)
+    # The position and birth date of the player are requested once, every cached season is indexed with them
+    request_player_position(player_id)
+    # Finished seasons are answered by the archive without a request
+    stats = SEASON_ARCHIVE.stats_response(player_id, unique_season_id) or request_player_season_stats(player_id, tournament_id, unique_season_id)
+
+    return build_player_season_stats(player_name=player_name, param=param, stats=stats)
+
+def build_player_season_stats(player_name: str, param: dict, stats: dict) -> PlayerSeasonStats | None:
+    player_id, tournament_id, unique_season_id, tournament_name, season_year = param.get("PLAYER_ID"), param.get("TOURNAMENT_ID"), param.get("UNIQUE_SEASON_ID"), param.get("TOURNAMENT_NAME"), param.get("SEASON_YEAR")
 
     if stats.get("error"):
         if stats.get("error").get("code") == 404:
@@ -202,15 +233,59 @@ def create_player_season_stats(player_name: str, param: dict) -> PlayerSeasonSta
         else:
             raise ValueError(f"URL request failed with code {stats.get('error').get('code')} and message {stats.get('error').get('message')}")
 
-    return PlayerSeasonStats(
+    statistics = stats.get("statistics")
+    archived = statistics if isinstance(statistics, StatBlock) else None
+    player_season_stats = PlayerSeasonStats(
         player_id=int(player_id),
         player_name=player_name,
         tournament_name=tournament_name,
         tournament_id=int(tournament_id),
         unique_season_id=int(unique_season_id),
         season_year=int(season_year),
-        stats=stats.get("statistics")
+        stats=archived.to_dict() if archived is not None else statistics,
+        position=PLAYER_POSITIONS.get(int(player_id))
     )
+    cache_season_stats(player_season_stats, archived)
+
+    return player_season_stats
+
+def cache_season_stats(player_season_stats: PlayerSeasonStats, archived: StatBlock | None = None):
+    """Cache the compact season. An archived `StatBlock` is cached as it is, its values stay a view of the archive file."""
+    key = (player_season_stats.player_id, player_season_stats.unique_season_id)
+    compact = compact_result(player_season_stats)
+    if archived is not None:
+        compact.stats = archived
+    with SEASON_STATS_CACHE_LOCK:
+        SEASON_STATS_CACHE[key] = compact
+        SEASON_STATS_CACHE.move_to_end(key)
+        if len(SEASON_STATS_CACHE) > SEASON_STATS_CACHE_SIZE:
+            SEASON_STATS_CACHE.popitem(last=False)
+
+def season_stats_snapshot() -> Dict[Tuple[int, int], CompactPlayerSeasonStats]:
+    """A copy of `SEASON_STATS_CACHE` that is safe to iterate while the fetch pool adds to the cache."""
+    with SEASON_STATS_CACHE_LOCK:
+        return OrderedDict(SEASON_STATS_CACHE)
+
+def store_player_profile(player_id: int, response: dict | None):
+    player = (response or {}).get("player", {})
+    PLAYER_POSITIONS[player_id] = player.get("position")
+    PLAYER_BIRTH_TIMESTAMPS[player_id] = player.get("dateOfBirthTimestamp")
+
+@execution_step
+def request_player_position(player_id: int) -> str | None:
+    """The position letter of a player, requested once per player. The birth date of the player is kept as well."""
+    player_id = int(player_id)
+    if player_id not in PLAYER_POSITIONS:
+        url = f"https://www.sofascore.com/api/v1/player/{player_id}"
+        try:
+            response = requests.get(url, timeout=request_timeout(10))
+            store_player_profile(player_id, response.json() if response.status_code == 200 else None)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"Error retrieving position of player {player_id}: {e}")
+            return None
+    return PLAYER_POSITIONS[player_id]
 
 def obtain_player_stats(
         player_name: str, 
@@ -245,6 +320,68 @@ def obtain_player_stats(
 
     return player_stats
 
+def create_season_stats_jobs(player_stats_parameters: List[PlayerSeasonParameters]) -> Tuple[List[dict], List[tuple]]:
+    """
+    Resolve the players of every parameter set and list the season stats requests they need.
+
+    Returns:
+        Tuple[List[dict], List[tuple]]: Error dictionaries for bad inputs, and (key, function, args) fetch jobs
+            where the key is (parameter index, season index).
+    """
+    error_messages = []
+    jobs = []
+    player_id_cache = {}
+    for index, params in enumerate(player_stats_parameters):
+        player_name = params.player_name
+        tournament_name = params.tournament_name
+        season_year = params.season_year
+        tournament_country = params.tournament_country
+
+        player_id = player_id_cache.get(player_name)
+        if player_id is None:
+            player_id = get_player_property(player_name=player_name, col_name="PLAYER_ID")
+            player_id_cache[player_name] = player_id
+        
+        if isinstance(player_id,list):
+            error_messages.append({"error": {"message": "404", "parameter": "player_name", "value": player_name}})
+            continue
+        elif player_id is None:
+            error_messages.append({"error": {"message": "405", "parameter": "player_name", "value": player_name}}) # Duplication
+            continue
+        elif isinstance(player_id, Decimal):
+            player_id = int(player_id)
+
+        url_params = create_url_params(
+            player_id=player_id, 
+            tournament_name=tournament_name,
+            tournament_country=tournament_country, 
+            season_year=season_year,
+            table_name="dim_unique_seasons"
+        )
+        check_deadline()
+
+        for position, param in enumerate(url_params):
+            jobs.append(((index, position), create_player_season_stats, (player_name, param)))
+
+    return error_messages, jobs
+
+def iter_multiple_player_season_stats(player_stats_parameters: List[PlayerSeasonParameters]) -> Iterator[Tuple[tuple, PlayerSeasonStats | dict]]:
+    """
+    Yield season level statistics for multiple players as soon as each season is fetched.
+
+    Yields:
+        Tuple[tuple, PlayerSeasonStats | dict]: (order key, result) pairs, or only error dictionaries for bad inputs.
+    """
+    error_messages, jobs = create_season_stats_jobs(player_stats_parameters)
+    if error_messages:
+        for position, error in enumerate(error_messages):
+            yield (position,), error
+        return
+
+    for key, player_season_stats in iter_completed(jobs):
+        if player_season_stats:
+            yield key, player_season_stats
+
 def obtain_multiple_player_season_stats(player_stats_parameters: List[PlayerSeasonParameters]) -> List[PlayerSeasonStats] | List[dict]:
     """
     Fetch season level statistics for multiple players. The tool queries DynamoDB for parameters, retrieves stats from external APIs, and returns results.
@@ -266,41 +403,109 @@ def obtain_multiple_player_season_stats(player_stats_parameters: List[PlayerSeas
             "Lionel Messi": {"tournament_name": "La Liga", "season_year": 2021}
         }
     """
-    all_player_stats = []
-    error_messages = []
-    player_id_cache = {}
-    for params in player_stats_parameters:
-        player_name = params.player_name
-        tournament_name = params.tournament_name
-        season_year = params.season_year
-        tournament_country = params.tournament_country
+    return collect_results(iter_multiple_player_season_stats(player_stats_parameters))
 
-        player_id = player_id_cache.get(player_name)
-        if player_id is None:
-            player_id = get_player_property(player_name=player_name, col_name="PLAYER_ID")
-            player_id_cache[player_name] = player_id
-        
+
+###############################################################
+# ASYNC FETCH
+###############################################################
+
+async def aget_player_property(player_name: str, col_name: str) -> int | List[int] | None:
+    return await aquery_property(table_name="dim_players", index_name='PLAYER_NAME', query_value=player_name, col_name=col_name, gsi=True, not_found=None)
+
+async def arequest_player_seasons(player_id: int) -> dict:
+    return await asofascore_get(f"https://www.sofascore.com/api/v1/player/{str(player_id)}/statistics/seasons", require_ok=True)
+
+async def acreate_url_params(player_id: int, tournament_name: str | None, tournament_country: str | None, season_year: int | None, table_name: str) -> List[dict]:
+    if tournament_name is None:
+        if season_year is None:
+            raise ValueError("At least one of tournament_name or season_year must be provided.")
+        response = await arequest_player_seasons(player_id=player_id)
+        return parse_player_seasons(response=response, player_id=player_id, season_year=season_year)
+
+    response = await alambda_post(QUERY_LAMBDA_URL, create_tournament_seasons_payload(tournament_name, tournament_country, table_name))
+    return parse_tournament_seasons(response=response, player_id=player_id, tournament_name=tournament_name, season_year=season_year)
+
+async def arequest_player_position(player_id: int) -> str | None:
+    player_id = int(player_id)
+    if player_id not in PLAYER_POSITIONS:
+        try:
+            response = await asofascore_get(f"https://www.sofascore.com/api/v1/player/{player_id}", require_ok=True)
+            store_player_profile(player_id, response)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"Error retrieving position of player {player_id}: {e}")
+            return None
+    return PLAYER_POSITIONS[player_id]
+
+async def arequest_player_season_stats(player_id, tournament_id, unique_season_id):
+    return await asofascore_get(f"https://www.sofascore.com/api/v1/player/{player_id}/unique-tournament/{tournament_id}/season/{unique_season_id}/statistics/overall")
+
+async def acreate_player_season_stats(player_name: str, param: dict) -> PlayerSeasonStats:
+    player_id, tournament_id, unique_season_id = param.get("PLAYER_ID"), param.get("TOURNAMENT_ID"), param.get("UNIQUE_SEASON_ID")
+
+    if None in [player_id, tournament_id, unique_season_id]:
+        raise ValueError("One of the stats url parameters is None.")
+
+    stats = SEASON_ARCHIVE.stats_response(player_id, unique_season_id)
+    if stats is None:
+        stats, _ = await asyncio.gather(arequest_player_season_stats(player_id, tournament_id, unique_season_id), arequest_player_position(player_id))
+    else:
+        await arequest_player_position(player_id)
+    return build_player_season_stats(player_name=player_name, param=param, stats=stats)
+
+async def aresolve_player_ids(player_names: List[str]) -> Dict[str, Any]:
+    """Resolve every distinct player name concurrently."""
+    player_names = list(dict.fromkeys(player_names))
+    player_ids = await asyncio.gather(*[aget_player_property(player_name=name, col_name="PLAYER_ID") for name in player_names])
+    return dict(zip(player_names, player_ids))
+
+async def acreate_season_stats_jobs(player_stats_parameters: List[PlayerSeasonParameters]) -> Tuple[List[dict], List[tuple]]:
+    """Async counterpart of `create_season_stats_jobs`. Names and url parameters are resolved concurrently."""
+    player_ids = await aresolve_player_ids([params.player_name for params in player_stats_parameters])
+
+    error_messages = []
+    resolved = []
+    for index, params in enumerate(player_stats_parameters):
+        player_id = player_ids[params.player_name]
         if isinstance(player_id,list):
-            error_messages.append({"error": {"message": "404", "parameter": "player_name", "value": player_name}})
+            error_messages.append({"error": {"message": "404", "parameter": "player_name", "value": params.player_name}})
         elif player_id is None:
-            error_messages.append({"error": {"message": "405", "parameter": "player_name", "value": player_name}}) # Duplication
-        elif isinstance(player_id, Decimal):
-            player_id = int(player_id)
+            error_messages.append({"error": {"message": "405", "parameter": "player_name", "value": params.player_name}}) # Duplication
+        else:
+            resolved.append((index, params, int(player_id)))
 
-        all_player_stats.extend(
-            obtain_player_stats(
-                player_name=player_name,
-                tournament_name=tournament_name,
-                tournament_country=tournament_country,
-                season_year=season_year,
-                player_id=player_id
-            )
+    all_url_params = await asyncio.gather(*[
+        acreate_url_params(
+            player_id=player_id,
+            tournament_name=params.tournament_name,
+            tournament_country=params.tournament_country,
+            season_year=params.season_year,
+            table_name="dim_unique_seasons"
         )
+        for _, params, player_id in resolved
+    ])
+    check_deadline()
+
+    jobs = []
+    for (index, params, _), url_params in zip(resolved, all_url_params):
+        for position, param in enumerate(url_params):
+            jobs.append(((index, position), acreate_player_season_stats, (params.player_name, param)))
+
+    return error_messages, jobs
 
+async def aiter_multiple_player_season_stats(player_stats_parameters: List[PlayerSeasonParameters]) -> AsyncIterator[Tuple[tuple, PlayerSeasonStats | dict]]:
+    """Async counterpart of `iter_multiple_player_season_stats`."""
+    error_messages, jobs = await acreate_season_stats_jobs(player_stats_parameters)
     if error_messages:
-        return error_messages
-    
-    return all_player_stats
+        for position, error in enumerate(error_messages):
+            yield (position,), error
+        return
+
+    async for key, player_season_stats in aiter_completed(jobs):
+        if player_season_stats:
+            yield key, player_season_stats
 
 
 ###############################################################
@@ -0,0 +1,294 @@
+from typing import Dict, List, Tuple
+from datetime import datetime
+import heapq
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from config import *
+from tools.modules import *
+from tools.helper.percentile_index import percentile_metrics
+
+
+# Columns of the `ids` matrix, one row per indexed player season
+_ID_COLUMNS = ("player_id", "tournament_id", "unique_season_id", "season_year", "birth_timestamp")
+_SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+
+class SimilarityIndex:
+    """
+    Season stat profiles of every cached player season as one dense matrix, for "who plays like X" queries.
+
+    A profile is the `PERCENTILE_STAT_COLUMNS` of a season, per 90 minutes for counting stats, so only seasons
+    with at least `PERCENTILE_MIN_MINUTES` are indexed. Columns are standardized over the whole index before
+    a query, missing stats count as the column mean. Queries multiply the standardized matrix in blocks of
+    `SIMILARITY_BLOCK_ROWS` rows and only keep the running top k between blocks.
+
+    Positions and birth dates come from the player profiles requested with the season stats. Rows indexed before
+    the profile of their player arrived are completed by a later `update`.
+
+    `save` writes the matrices as .npy files of a new generation directory and swaps the `CURRENT` pointer file,
+    like `SeasonArchive.write`, so files other processes have mapped are never rewritten. `load` maps them back with
+    `np.load(mmap_mode="r")`, so a restarted app can answer queries without refetching the seasons. Queries only
+    `schedule_save`, the changes of `SIMILARITY_INDEX_SAVE_SECONDS` are written at once on a background thread.
+    """
+    def __init__(self):
+        self.values = np.empty((0, len(PERCENTILE_STAT_COLUMNS)))
+        self.ids = np.empty((0, len(_ID_COLUMNS)), dtype=np.int64)
+        self.labels: List[Dict[str, str]] = []
+        self._rows: Dict[Tuple[int, int], int] = {}
+        self._indexed: Dict[Tuple[int, int], StatBlock] = {}
+        # Rows whose position or birth date is not known yet
+        self._incomplete: set = set()
+        self._normalized = None
+        self.dirty = False
+        self.generation: str | None = None
+        self._save_timer: threading.Timer | None = None
+        # Sessions update and query the shared index at the same time, a query holds it from its target row to its result
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.ids[:, _ID_COLUMNS.index(name)]
+
+    def update(self, season_stats_cache: Dict[Tuple[int, int], CompactPlayerSeasonStats], positions: Dict[int, str], birth_timestamps: Dict[int, int]):
+        """
+        Add the cache entries that are new or changed since the last update. Rows are appended in one concatenation.
+        `season_stats_cache` should be a snapshot of the cache, see `season_stats_snapshot`.
+        """
+        with self.lock:
+            self._update(season_stats_cache, positions, birth_timestamps)
+
+    def _update(self, season_stats_cache: Dict[Tuple[int, int], CompactPlayerSeasonStats], positions: Dict[int, str], birth_timestamps: Dict[int, int]):
+        new_values, new_ids, new_labels, replaced = [], [], [], {}
+        for key, season_stats in season_stats_cache.items():
+            if season_stats.stats is None or self._indexed.get(key) is season_stats.stats:
+                continue
+            self._indexed[key] = season_stats.stats
+            metrics = percentile_metrics(season_stats.stats)
+            if metrics is None:
+                continue
+
+            ids = [season_stats.player_id, season_stats.tournament_id, season_stats.unique_season_id,
+                   season_stats.season_year or 0, birth_timestamps.get(season_stats.player_id) or 0]
+            label = {
+                "player_name": season_stats.player_name,
+                "tournament_name": season_stats.tournament_name,
+                "position": season_stats.position or positions.get(season_stats.player_id),
+            }
+            if key in self._rows:
+                replaced[self._rows[key]] = (metrics, ids, label)
+            else:
+                self._rows[key] = len(self.labels) + len(new_labels)
+                new_values.append(metrics)
+                new_ids.append(ids)
+                new_labels.append(label)
+
+        if new_values or replaced:
+            # Loaded matrices are read-only maps of the files, so they are copied before they change
+            self.values = np.concatenate([self.values, np.asarray(new_values).reshape(-1, self.values.shape[1])])
+            self.ids = np.concatenate([self.ids, np.asarray(new_ids, dtype=np.int64).reshape(-1, self.ids.shape[1])])
+            self.labels.extend(new_labels)
+            for row, (metrics, ids, label) in replaced.items():
+                self.values[row], self.ids[row], self.labels[row] = metrics, ids, label
+                self._incomplete.add(row)
+            self._incomplete.update(range(len(self.labels) - len(new_labels), len(self.labels)))
+            self._normalized = None
+            self.dirty = True
+        self._complete_profiles(positions, birth_timestamps)
+
+    def _complete_profiles(self, positions: Dict[int, str], birth_timestamps: Dict[int, int]):
+        """Fill in the positions and birth dates that arrived after their rows were indexed."""
+        birth_column = _ID_COLUMNS.index("birth_timestamp")
+        for row in sorted(self._incomplete):
+            player_id = int(self.ids[row, 0])
+            position = self.labels[row]["position"] or positions.get(player_id)
+            birth = int(self.ids[row, birth_column]) or birth_timestamps.get(player_id) or 0
+            if position != self.labels[row]["position"]:
+                # Labels are replaced, not changed, a background save may be writing the previous list
+                self.labels[row] = {**self.labels[row], "position": position}
+                self.dirty = True
+            if birth != self.ids[row, birth_column]:
+                if not self.ids.flags.writeable:
+                    self.ids = np.array(self.ids)
+                self.ids[row, birth_column] = birth
+                self.dirty = True
+            if position and birth:
+                self._incomplete.discard(row)
+
+    def normalized(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Standardized profiles and their squared norms, recomputed after every change of the index."""
+        if self._normalized is None:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.nanmean(self.values, axis=0) if len(self) else np.zeros(self.values.shape[1])
+                std = np.nanstd(self.values, axis=0) if len(self) else np.ones(self.values.shape[1])
+                matrix = np.nan_to_num((self.values - mean) / np.where(std > 0, std, np.nan))
+            self._normalized = (matrix, np.einsum("ij,ij->i", matrix, matrix))
+        return self._normalized
+
+    def mask(
+            self,
+            tournament_name: str | None = None,
+            season_year: int | None = None,
+            position: str | None = None,
+            min_age: int | None = None,
+            max_age: int | None = None
+    ) -> np.ndarray:
+        """Rows that pass the filters. Rows without a known birth date fail age filters."""
+        mask = np.ones(len(self), dtype=bool)
+        if tournament_name:
+            mask &= np.array([(label["tournament_name"] or "").casefold() == tournament_name.casefold() for label in self.labels], dtype=bool)
+        if season_year:
+            mask &= self.column("season_year") == season_year
+        if position:
+            mask &= np.array([label["position"] == position for label in self.labels], dtype=bool)
+        if min_age is not None or max_age is not None:
+            birth = self.column("birth_timestamp")
+            age = (datetime.now().timestamp() - birth) / _SECONDS_PER_YEAR
+            mask &= birth != 0
+            if min_age is not None:
+                mask &= age >= min_age
+            if max_age is not None:
+                mask &= age < max_age + 1
+        return mask
+
+    def age(self, row: int) -> int | None:
+        birth = self.ids[row, _ID_COLUMNS.index("birth_timestamp")]
+        return int((datetime.now().timestamp() - birth) // _SECONDS_PER_YEAR) if birth else None
+
+    def rows_of(self, player_name: str) -> List[int]:
+        return [row for row, label in enumerate(self.labels) if (label["player_name"] or "").casefold() == player_name.casefold()]
+
+    def query(self, row: int, k: int, metric: str = "cosine", mask: np.ndarray | None = None) -> List[Tuple[int, float]]:
+        """
+        The k rows most similar to `row`, other seasons of the same player excluded.
+
+        Args:
+            metric (str): "cosine" for the similarity of the profile shapes (higher is closer), "euclidean" for the
+                distance between the standardized profiles (lower is closer).
+
+        Returns:
+            List[Tuple[int, float]]: (row, similarity or distance) pairs, closest first.
+        """
+        matrix, squared_norms = self.normalized()
+        target = matrix[row]
+        mask = np.ones(len(self), dtype=bool) if mask is None else mask.copy()
+        mask &= self.column("player_id") != self.ids[row, 0]
+
+        best = []
+        for start in range(0, len(self), SIMILARITY_BLOCK_ROWS):
+            end = min(start + SIMILARITY_BLOCK_ROWS, len(self))
+            block_mask = mask[start:end]
+            if not block_mask.any():
+                continue
+            products = matrix[start:end] @ target
+            if metric == "cosine":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    scores = products / np.sqrt(squared_norms[start:end] * squared_norms[row])
+                scores = np.nan_to_num(scores, nan=-1.0)
+            else:
+                # Negated distance, so the highest score is the closest row for both metrics
+                scores = -np.sqrt(np.maximum(squared_norms[start:end] - 2 * products + squared_norms[row], 0))
+            scores = np.where(block_mask, scores, -np.inf)
+
+            candidates = np.flatnonzero(block_mask)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+            best = heapq.nlargest(k, best + [(scores[index], start + index) for index in candidates])
+
+        return [(int(index), float(score if metric == "cosine" else -score)) for score, index in best]
+
+    def _pointer(self, path: str) -> str:
+        return os.path.join(path, "CURRENT")
+
+    def schedule_save(self, delay: float = SIMILARITY_INDEX_SAVE_SECONDS):
+        """Save the index on a background thread in `delay` seconds, once for every change made until then."""
+        with self.lock:
+            if not self.dirty or self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(delay, self._background_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _background_save(self):
+        with self.lock:
+            self._save_timer = None
+        try:
+            self.save()
+        except OSError as e:
+            logger.info(f"Could not save the similarity index: {e}")
+
+    def save(self, path: str = SIMILARITY_INDEX_PATH):
+        """Write a new generation with the current rows, then point `CURRENT` at it. Only the copy of the rows holds the lock."""
+        with self.lock:
+            values, ids, labels = np.array(self.values), np.array(self.ids), list(self.labels)
+            self.dirty = False
+        try:
+            generation = f"{time.time_ns()}-{os.getpid()}"
+            directory = os.path.join(path, generation)
+            os.makedirs(directory)
+            np.save(os.path.join(directory, "values.npy"), values)
+            np.save(os.path.join(directory, "ids.npy"), ids)
+            with open(os.path.join(directory, "labels.json"), "w", encoding="utf-8") as file:
+                json.dump(labels, file, ensure_ascii=False)
+
+            # Processes still mapping the previous generation keep it, removed files stay readable while they are mapped
+            temporary = f"{self._pointer(path)}.{generation}"
+            with open(temporary, "w", encoding="utf-8") as file:
+                file.write(generation)
+            os.replace(temporary, self._pointer(path))
+        except OSError:
+            self.dirty = True
+            raise
+        previous, self.generation = self.generation, generation
+        for name in os.listdir(path):
+            if name not in (generation, previous) and os.path.isdir(os.path.join(path, name)):
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    def save_if_dirty(self, path: str = SIMILARITY_INDEX_PATH):
+        if self.dirty:
+            try:
+                self.save(path)
+            except OSError as e:
+                logger.info(f"Could not save the similarity index: {e}")
+
+    @classmethod
+    def load(cls, path: str = SIMILARITY_INDEX_PATH) -> "SimilarityIndex":
+        """The index of the current generation at `path`, memory-mapped. An empty index when nothing was saved yet."""
+        index = cls()
+        try:
+            with open(index._pointer(path), encoding="utf-8") as file:
+                generation = file.read().strip()
+            directory = os.path.join(path, generation)
+            values = np.load(os.path.join(directory, "values.npy"), mmap_mode="r")
+            ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode="r")
+            with open(os.path.join(directory, "labels.json"), encoding="utf-8") as file:
+                labels = json.load(file)
+        except (FileNotFoundError, ValueError) as e:
+            logger.info(f"No similarity index loaded from {path}: {e}")
+            return index
+        if values.shape[1] != len(PERCENTILE_STAT_COLUMNS) or not (len(values) == len(ids) == len(labels)):
+            logger.info(f"The similarity index at {directory} does not match the current schema and is ignored.")
+            return index
+
+        index.values, index.ids, index.labels, index.generation = values, ids, labels, generation
+        index._rows = {(int(player_id), int(unique_season_id)): row for row, (player_id, unique_season_id) in enumerate(ids[:, [0, 2]].tolist())}
+        index._incomplete = {row for row, label in enumerate(labels) if not label["position"] or not ids[row, _ID_COLUMNS.index("birth_timestamp")]}
+        return index
+
+
+SIMILARITY_INDEX = None
+
+def similarity_index() -> SimilarityIndex:
+    """The shared index, loaded from `SIMILARITY_INDEX_PATH` on first use."""
+    global SIMILARITY_INDEX
+    if SIMILARITY_INDEX is None:
+        SIMILARITY_INDEX = SimilarityIndex.load()
+        # Changes still waiting for their scheduled save are written when the app exits
+        atexit.register(SIMILARITY_INDEX.save_if_dirty)
+    return SIMILARITY_INDEX
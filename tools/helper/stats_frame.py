@@ -0,0 +1,194 @@
+from typing import Dict, List, Tuple, Any, Sequence
+from dataclasses import dataclass, field
+import numpy as np
+from config import *
+from tools.modules import *
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+_SCHEMA_COLUMNS = frozenset(SEASON_STAT_COLUMNS + EVENT_STAT_COLUMNS)
+
+
+@dataclass
+class StatsFrame:
+    """
+    Statistics of many players, matches or seasons as one float matrix under a fixed column schema.
+
+    `labels` describe the rows (player, team, season or match), `values` holds one row per result and one
+    column per stat, NaN where Sofascore did not report the stat. Every operation works on whole columns.
+    """
+    labels: List[Dict[str, Any]]
+    columns: Tuple[str, ...]
+    values: np.ndarray
+    _positions: Dict[str, int] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self._positions = {column: position for position, column in enumerate(self.columns)}
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[:, self._positions[name]]
+
+    def label(self, name: str) -> List[Any]:
+        return [label.get(name) for label in self.labels]
+
+    def _take(self, rows: np.ndarray) -> "StatsFrame":
+        return StatsFrame(labels=[self.labels[row] for row in rows], columns=self.columns, values=self.values[rows])
+
+    def select(self, columns: Sequence[str]) -> "StatsFrame":
+        positions = [self._positions[column] for column in columns]
+        return StatsFrame(labels=self.labels, columns=tuple(columns), values=self.values[:, positions])
+
+    def filter(self, mask: np.ndarray) -> "StatsFrame":
+        """Keep the rows where `mask` is True, e.g. `frame.filter(frame.column("minutesPlayed") >= 900)`."""
+        return self._take(np.flatnonzero(mask))
+
+    def sort_by(self, column: str, descending: bool = True, limit: int | None = None) -> "StatsFrame":
+        """Rows ordered by one column, missing values last."""
+        values = self.column(column)
+        keys = np.where(np.isnan(values), -np.inf if descending else np.inf, values)
+        rows = np.argsort(-keys if descending else keys, kind="stable")
+        return self._take(rows[:limit])
+
+    def with_columns(self, columns: Dict[str, np.ndarray]) -> "StatsFrame":
+        """A frame with derived columns appended."""
+        if not columns:
+            return self
+        names = tuple(columns)
+        added = np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in names])
+        return StatsFrame(labels=self.labels, columns=self.columns + names, values=np.hstack([self.values, added]))
+
+    def to_records(self, drop_missing: bool = True) -> List[Dict[str, Any]]:
+        """One dictionary per row, labels first. Missing stats are left out unless `drop_missing` is False."""
+        records = []
+        for label, row in zip(self.labels, self.values.tolist()):
+            record = dict(label)
+            for column, value in zip(self.columns, row):
+                if not (drop_missing and value != value):
+                    record[column] = value
+            records.append(record)
+        return records
+
+    def to_arrow(self):
+        """The frame as a `pyarrow.Table`. Requires pyarrow."""
+        if pa is None:
+            raise ImportError("pyarrow is required for StatsFrame.to_arrow. Install it with `pip install pyarrow`.")
+        label_names = list(dict.fromkeys(name for label in self.labels for name in label))
+        arrays = [pa.array(self.label(name)) for name in label_names]
+        arrays += [pa.array(self.values[:, position], from_pandas=True) for position in range(len(self.columns))]
+        return pa.table(arrays, names=label_names + list(self.columns))
+
+
+def _stats_matrix(stats_dicts: List[dict | None], columns: Tuple[str, ...]) -> np.ndarray:
+    positions = {column: position for position, column in enumerate(columns)}
+    values = np.full((len(stats_dicts), len(columns)), np.nan)
+    for row, stats in enumerate(stats_dicts):
+        for key, value in (stats or {}).items():
+            position = positions.get(key)
+            if position is not None and isinstance(value, (int, float)):
+                values[row, position] = value
+    return values
+
+def season_stats_frame(player_stats: List[PlayerSeasonStats]) -> StatsFrame:
+    """Build a `StatsFrame` with the `SEASON_STAT_COLUMNS` schema from season stats results."""
+    player_stats = [item for item in player_stats if isinstance(item, PlayerSeasonStats)]
+    labels = [
+        {
+            "player_name": item.player_name,
+            "player_id": item.player_id,
+            "tournament_name": item.tournament_name,
+            "season_year": item.season_year,
+        }
+        for item in player_stats
+    ]
+    return StatsFrame(
+        labels=labels,
+        columns=SEASON_STAT_COLUMNS,
+        values=_stats_matrix([item.stats for item in player_stats], SEASON_STAT_COLUMNS)
+    )
+
+def event_stats_frame(player_stats: List[PlayerEventStats]) -> StatsFrame:
+    """Build a `StatsFrame` with the `EVENT_STAT_COLUMNS` schema from event stats results."""
+    player_stats = [item for item in player_stats if isinstance(item, PlayerEventStats)]
+    labels = [
+        {
+            "player_name": item.player_name,
+            "player_id": item.player_id,
+            "player_team_name": item.player_team_name,
+            "opponent_team_name": item.opponent_team_name,
+            "event_date": item.event_date,
+        }
+        for item in player_stats
+    ]
+    return StatsFrame(
+        labels=labels,
+        columns=EVENT_STAT_COLUMNS,
+        values=_stats_matrix([item.stats for item in player_stats], EVENT_STAT_COLUMNS)
+    )
+
+def additive_columns(frame: StatsFrame) -> List[str]:
+    return [column for column in frame.columns if column in _SCHEMA_COLUMNS and column not in NON_ADDITIVE_STAT_COLUMNS]
+
+def per_90(frame: StatsFrame, columns: Sequence[str] | None = None) -> Dict[str, np.ndarray]:
+    """
+    Per 90 minutes rates of the counting stats of every row, in one matrix operation.
+
+    Returns:
+        Dict[str, np.ndarray]: "<column>_per_90" -> rates, NaN for rows without minutes.
+    """
+    columns = list(columns) if columns is not None else additive_columns(frame)
+    minutes = frame.column("minutesPlayed")
+    positions = [frame._positions[column] for column in columns]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = frame.values[:, positions] * (90.0 / np.where(minutes > 0, minutes, np.nan))[:, None]
+    return {f"{column}_per_90": rates[:, index] for index, column in enumerate(columns)}
+
+def ratios(frame: StatsFrame, definitions: Dict[str, Tuple[str, str]]) -> Dict[str, np.ndarray]:
+    """Derived ratios like pass accuracy, see `SEASON_STAT_RATIOS` and `EVENT_STAT_RATIOS`. NaN where the denominator is 0."""
+    names = list(definitions)
+    numerators = frame.values[:, [frame._positions[definitions[name][0]] for name in names]]
+    denominators = frame.values[:, [frame._positions[definitions[name][1]] for name in names]]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = numerators / np.where(denominators != 0, denominators, np.nan)
+    return {name: values[:, index] for index, name in enumerate(names)}
+
+def team_shares(frame: StatsFrame, group_labels: Sequence[str] = ("player_team_name", "event_date"), columns: Sequence[str] | None = None) -> Dict[str, np.ndarray]:
+    """
+    Share of every row in the total of its team in the same match, for the rows in the frame, e.g. a squad
+    requested without a player name.
+
+    Returns:
+        Dict[str, np.ndarray]: "<column>_team_share" -> share between 0 and 1, NaN when the team total is 0
+            or the row is the only one of its team.
+    """
+    columns = list(columns) if columns is not None else additive_columns(frame)
+    keys = ["|".join(str(label.get(name)) for name in group_labels) for label in frame.labels]
+    teams, team_index = np.unique(np.asarray(keys, dtype=object).astype(str), return_inverse=True)
+    values = np.nan_to_num(frame.values[:, [frame._positions[column] for column in columns]])
+
+    totals = np.zeros((len(teams), len(columns)))
+    np.add.at(totals, team_index, values)
+    row_totals = np.where((np.bincount(team_index, minlength=len(teams)) > 1)[team_index, None], totals[team_index], 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = values / np.where(row_totals != 0, row_totals, np.nan)
+    return {f"{column}_team_share": shares[:, index] for index, column in enumerate(columns)}
+
+def derived_columns(frame: StatsFrame) -> List[str]:
+    """The columns added to the stat schema, e.g. by `season_comparison_frame`."""
+    return [column for column in frame.columns if column not in _SCHEMA_COLUMNS]
+
+def season_comparison_frame(player_stats: List[PlayerSeasonStats], columns: Sequence[str] | None = None) -> StatsFrame:
+    """Season stats with the per-90 rates of `columns` (every counting stat when None) and `SEASON_STAT_RATIOS` appended."""
+    frame = season_stats_frame(player_stats)
+    return frame.with_columns({**per_90(frame, columns), **ratios(frame, SEASON_STAT_RATIOS)})
+
+def event_comparison_frame(player_stats: List[PlayerEventStats], columns: Sequence[str] | None = None) -> StatsFrame:
+    """Event stats with `EVENT_STAT_RATIOS` and the team shares of `columns` (every counting stat when None) appended."""
+    frame = event_stats_frame(player_stats)
+    return frame.with_columns({**ratios(frame, EVENT_STAT_RATIOS), **team_shares(frame, columns=columns)})
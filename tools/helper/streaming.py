@@ -0,0 +1,136 @@
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+import contextvars
+from config import *
+from tools.modules import *
+from tools.helper.deadline import DeadlineExceeded, remaining_time
+
+
+# Sorts after every (parameter index, ...) key, so the partial marker ends up last
+PARTIAL_KEY = (float("inf"),)
+
+# Called with every result a tool function collects. Set it with `progress_callback` to show partial progress.
+PROGRESS_CALLBACK = contextvars.ContextVar("progress_callback", default=None)
+
+
+@contextmanager
+def progress_callback(callback: Callable[[Any], None]):
+    """
+    Report every result the tool functions collect to `callback` while the context is active.
+    The callback is inherited by the worker threads LangGraph and the fetch pool run tools in.
+    """
+    token = PROGRESS_CALLBACK.set(callback)
+    try:
+        yield
+    finally:
+        PROGRESS_CALLBACK.reset(token)
+
+def report_progress(item: Any):
+    callback = PROGRESS_CALLBACK.get()
+    if callback is None:
+        return
+    try:
+        callback(item)
+    except Exception as e:
+        print(f"Progress callback failed: {e}")
+
+def describe_result(item: Any) -> str:
+    """A one line description of a tool result for progress messages."""
+    if isinstance(item, PlayerEventStats):
+        return f"{item.player_name} vs {item.opponent_team_name} ({item.event_date})"
+    elif isinstance(item, (PlayerSeasonStats, PlayerSeasonRatings)):
+        return f"{item.player_name} - {item.tournament_name} {item.season_year}"
+    elif isinstance(item, EventSummary):
+        return f"{item.home_team} {item.home_team_score} - {item.away_team_score} {item.away_team}"
+    return str(item)
+
+def iter_completed(jobs: Iterable[Tuple[Any, Callable, tuple]]) -> Iterator[Tuple[Any, Any]]:
+    """
+    Run fetch jobs on a thread pool and yield their results as soon as each one finishes.
+    The jobs inherit the deadline of the current tool call; jobs that have not started when it runs out are cancelled.
+
+    Args:
+        jobs (Iterable[Tuple[Any, Callable, tuple]]): (key, function, args) triples.
+
+    Yields:
+        Tuple[Any, Any]: (key, result) pairs in completion order.
+
+    Raises:
+        DeadlineExceeded: When the time budget runs out before every job finished.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(jobs)))
+    try:
+        futures = {
+            executor.submit(contextvars.copy_context().run, function, *args): key
+            for key, function, args in jobs
+        }
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=remaining_time()):
+                pending.discard(future)
+                yield futures[future], future.result()
+        except (FuturesTimeoutError, DeadlineExceeded):
+            raise DeadlineExceeded(pending=len(pending))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def is_error(item: Any) -> bool:
+    return isinstance(item, dict) and "error" in item
+
+def is_partial_marker(item: Any) -> bool:
+    return isinstance(item, dict) and "partial" in item
+
+def is_complete(result: Any) -> bool:
+    """False when a tool result holds an error dictionary or a partial marker, at any depth of its lists."""
+    if isinstance(result, (list, tuple)):
+        return all(is_complete(item) for item in result)
+    return not (is_error(result) or is_partial_marker(result))
+
+def partial_marker(completed: int, cancelled: int) -> dict:
+    return {
+        "partial": {
+            "message": "The time budget of this tool call ran out before all data was fetched. These results are incomplete.",
+            "completed": completed,
+            "cancelled": cancelled
+        }
+    }
+
+def guard_deadline(results: Iterable[Tuple[tuple, Any]]) -> Iterator[Tuple[tuple, Any]]:
+    """
+    Pass a keyed result stream through and end it with a partial marker when the time budget runs out.
+    """
+    completed = 0
+    try:
+        for key, item in results:
+            completed += 1
+            yield key, item
+    except DeadlineExceeded as e:
+        logger.info(f"Tool call ran out of time after {completed} results, {e.pending} requests cancelled.")
+        yield PARTIAL_KEY, partial_marker(completed=completed, cancelled=e.pending)
+
+def collect_results(results: Iterable[Tuple[tuple, Any]]) -> List[Any]:
+    """
+    Collect a keyed result stream into the list the tool functions have always returned.
+
+    Results are put back in the order of their keys. When the stream contains error dictionaries
+    only the errors are returned, like before. A partial marker, if the time budget ran out, comes last.
+    """
+    collected = []
+    for key, item in guard_deadline(results):
+        report_progress(item)
+        collected.append((key, item))
+    return finish_collected(collected)
+
+def finish_collected(collected: List[Tuple[tuple, Any]]) -> List[Any]:
+    collected.sort(key=lambda pair: pair[0])
+    items = [item for _, item in collected]
+
+    errors = [item for item in items if is_error(item) or is_partial_marker(item)]
+    if any(is_error(item) for item in errors):
+        return errors
+    return items
@@ -0,0 +1,250 @@
+from typing import Dict, List, Tuple
+import asyncio
+import threading
+import time
+import numpy as np
+import requests
+from config import *
+from tools.modules import *
+from tools.helper.deadline import request_timeout, remaining_time, DeadlineExceeded
+from tools.helper.async_fetch import alambda_post
+
+
+class TeamStrength:
+    """
+    Elo ratings of every team in the `dim_events` history.
+
+    Matches of the same date are applied together as one update, so `update` only applies the events it has not
+    seen and new results extend the ratings incrementally. A rating depends on every earlier match day, so the full
+    build is still one Python step per match day; with a handful of matches per day that is no faster than a loop
+    over the matches. The per-day update is kept for the incremental refreshes, not for the speed of the full build.
+
+    After every update the teams are split into `TEAM_STRENGTH_BANDS` by rating quantiles. The split is kept as a
+    lookup table (sorted team ids, band of every team), so the band of many opponents is one `searchsorted`.
+
+    Sessions read the ratings while a refresh updates them, updates and reads hold `lock`. Only one refresh scans
+    at a time, see `refresh_team_strength`.
+    """
+    def __init__(self):
+        self.team_index: Dict[int, int] = {}
+        self.team_names: Dict[int, str] = {}
+        self.team_ids = np.zeros(0, dtype=np.int64)
+        self.ratings = np.zeros(0)
+        self.games = np.zeros(0, dtype=np.int64)
+        self.seen_event_ids = np.zeros(0, dtype=np.int64)
+        self.last_date: str | None = None
+        self.refreshed_at: float | None = None
+        # Set when a scan failed, the next one waits until then instead of repeating the full history scan on every call
+        self.retry_at: float | None = None
+        self._lookup_ids = np.zeros(0, dtype=np.int64)
+        self._lookup_bands = np.zeros(0, dtype=np.int64)
+        # An update grows the team index and the arrays one after the other, readers wait until they match again
+        self.lock = threading.RLock()
+        # Held by a sync refresh from its scan to its update, concurrent sessions wait for it instead of scanning too
+        self.refresh_lock = threading.Lock()
+        # The async refresh running on the event loop, awaited by every coroutine that needs a refresh meanwhile
+        self.refresh_task: asyncio.Future | None = None
+
+    def __len__(self) -> int:
+        return len(self.team_index)
+
+    def _indices(self, team_ids: np.ndarray) -> np.ndarray:
+        """Rating index of every team id. Teams seen for the first time start at `ELO_INITIAL_RATING`."""
+        unique_ids, inverse = np.unique(team_ids, return_inverse=True)
+        new_ids = [team_id for team_id in unique_ids.tolist() if team_id not in self.team_index]
+        if new_ids:
+            for team_id in new_ids:
+                self.team_index[team_id] = len(self.team_index)
+            self.team_ids = np.concatenate([self.team_ids, np.array(new_ids, dtype=np.int64)])
+            self.ratings = np.concatenate([self.ratings, np.full(len(new_ids), float(ELO_INITIAL_RATING))])
+            self.games = np.concatenate([self.games, np.zeros(len(new_ids), dtype=np.int64)])
+        return np.array([self.team_index[team_id] for team_id in unique_ids.tolist()], dtype=np.int64)[inverse]
+
+    def update(self, events: List[dict]) -> int:
+        """
+        Apply the finished events that were not applied yet, in date order.
+
+        Args:
+            events (List[dict]): `dim_events` rows. Rows without a winner code or a score are skipped.
+
+        Returns:
+            int: The number of events applied.
+        """
+        with self.lock:
+            return self._update(events)
+
+    def _update(self, events: List[dict]) -> int:
+        if not events:
+            return 0
+        event_ids = np.array([event["EVENT_ID"] for event in events], dtype=np.int64)
+        dates = np.array([event["EVENT_DATE"] for event in events])
+        home_ids = np.array([event["HOME_TEAM_ID"] for event in events], dtype=np.int64)
+        away_ids = np.array([event["AWAY_TEAM_ID"] for event in events], dtype=np.int64)
+        # Missing scores become NaN
+        home_score = np.array([event.get("HOME_SCORE") for event in events], dtype=np.float64)
+        away_score = np.array([event.get("AWAY_SCORE") for event in events], dtype=np.float64)
+        finished = np.array([bool(event.get("WINNER_CODE")) for event in events])
+
+        keep = finished & ~np.isnan(home_score) & ~np.isnan(away_score) & ~np.isin(event_ids, self.seen_event_ids)
+        rows = np.flatnonzero(keep)
+        rows = rows[np.unique(event_ids[rows], return_index=True)[1]]
+        rows = rows[np.lexsort((event_ids[rows], dates[rows]))]
+        if not len(rows):
+            return 0
+        event_ids, dates, home_score, away_score = event_ids[rows], dates[rows], home_score[rows], away_score[rows]
+        teams = self._indices(np.concatenate([home_ids[rows], away_ids[rows]]))
+        home, away = teams[:len(rows)], teams[len(rows):]
+        for side, side_ids in (("HOME", home_ids), ("AWAY", away_ids)):
+            # One event per team is enough to know its name
+            team_ids, first = np.unique(side_ids[rows], return_index=True)
+            for team_id, row in zip(team_ids.tolist(), rows[first].tolist()):
+                if team_id not in self.team_names and events[row].get(f"{side}_TEAM_NAME"):
+                    self.team_names[team_id] = events[row][f"{side}_TEAM_NAME"]
+
+        result = np.where(home_score > away_score, 1.0, np.where(home_score == away_score, 0.5, 0.0))
+        goal_difference = np.abs(home_score - away_score)
+        # World Football Elo margin multiplier
+        margin = np.where(goal_difference <= 1, 1.0, np.where(goal_difference == 2, 1.5, (11 + goal_difference) / 8))
+
+        day_starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+        day_ends = np.r_[day_starts[1:], len(rows)]
+        for start, end in zip(day_starts.tolist(), day_ends.tolist()):
+            h, a = home[start:end], away[start:end]
+            difference = self.ratings[h] + ELO_HOME_ADVANTAGE - self.ratings[a]
+            expected = 1 / (1 + 10 ** (-difference / 400))
+            delta = ELO_K_FACTOR * margin[start:end] * (result[start:end] - expected)
+            # bincount adds up the deltas of a team that plays twice on the same date
+            self.ratings += np.bincount(h, weights=delta, minlength=len(self.ratings)) - np.bincount(a, weights=delta, minlength=len(self.ratings))
+
+        self.games += np.bincount(teams, minlength=len(self.games))
+        self.seen_event_ids = np.union1d(self.seen_event_ids, event_ids)
+        self.last_date = max(self.last_date or "", str(dates[-1]))
+        self._build_lookup()
+        return len(rows)
+
+    def _build_lookup(self):
+        order = np.argsort(self.team_ids)
+        edges = np.quantile(self.ratings, np.linspace(0, 1, len(TEAM_STRENGTH_BANDS) + 1)[1:-1]) if len(self) else []
+        # Band 0 is the strongest
+        bands = len(TEAM_STRENGTH_BANDS) - 1 - np.searchsorted(edges, self.ratings, side="right")
+        self._lookup_ids = self.team_ids[order]
+        self._lookup_bands = bands[order]
+
+    def rating(self, team_id: int) -> float | None:
+        with self.lock:
+            index = self.team_index.get(int(team_id))
+            return None if index is None else float(self.ratings[index])
+
+    def opponent_bands(self, team_ids: np.ndarray) -> np.ndarray:
+        """Band index of every team id, -1 for teams without a rating."""
+        team_ids = np.asarray(team_ids, dtype=np.int64)
+        with self.lock:
+            lookup_ids, lookup_bands = self._lookup_ids, self._lookup_bands
+        if not len(lookup_ids):
+            return np.full(len(team_ids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(lookup_ids, team_ids), len(lookup_ids) - 1)
+        return np.where(lookup_ids[positions] == team_ids, lookup_bands[positions], -1)
+
+    def big_club_ids(self, team_id: int) -> List[int] | None:
+        """
+        The Elo counterpart of `get_big_club_ids`: other teams rated at most `ELO_BIG_GAME_MARGIN` below the team.
+        None when the team has no rating.
+        """
+        with self.lock:
+            rating = self.rating(team_id)
+            if rating is None:
+                return None
+            strong = (self.ratings >= rating - ELO_BIG_GAME_MARGIN) & (self.team_ids != int(team_id))
+            return self.team_ids[strong].tolist()
+
+    def needs_refresh(self) -> bool:
+        now = time.time()
+        if self.retry_at is not None and now < self.retry_at:
+            return False
+        return self.refreshed_at is None or now - self.refreshed_at > TEAM_STRENGTH_REFRESH_SECONDS
+
+    def refresh_failed(self, error):
+        print(f"Error refreshing team strength: {error}")
+        self.retry_at = time.time() + TEAM_STRENGTH_RETRY_SECONDS
+
+    def apply_refresh(self, events: List[dict]):
+        logger.info(f"Team strength: {self.update(events)} new events applied")
+        self.refreshed_at = time.time()
+        self.retry_at = None
+
+
+TEAM_STRENGTH = TeamStrength()
+
+
+def create_event_history_scan_payload(since: str | None) -> dict:
+    """The `dim_events` rows from `since` on, from `TEAM_STRENGTH_HISTORY_START` when None. Seen events are skipped later."""
+    return {
+        "table_name": "dim_events",
+        "filter": {
+            "type": "atomic",
+            "attribute": "EVENT_DATE",
+            "operation": "gte",
+            "value": since or TEAM_STRENGTH_HISTORY_START
+        }
+    }
+
+def refresh_team_strength(strength: TeamStrength = TEAM_STRENGTH) -> TeamStrength:
+    """
+    Apply the events played since the last refresh. Runs at most once per `TEAM_STRENGTH_REFRESH_SECONDS`.
+    Concurrent calls wait for the running refresh, within their time budget, instead of scanning again.
+    """
+    if not strength.needs_refresh():
+        return strength
+    timeout = remaining_time()
+    if not strength.refresh_lock.acquire(timeout=-1 if timeout is None else timeout):
+        # Another session is still scanning, the ratings of the last refresh are used
+        return strength
+    try:
+        if strength.needs_refresh():
+            _refresh_team_strength(strength)
+    finally:
+        strength.refresh_lock.release()
+    return strength
+
+def _refresh_team_strength(strength: TeamStrength):
+    try:
+        events = requests.post(
+            url=SCAN_LAMBDA_URL,
+            timeout=request_timeout(LAMBDA_TIMEOUT),
+            json=create_event_history_scan_payload(strength.last_date)
+        ).json()
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        strength.refresh_failed(e)
+        return
+    if not isinstance(events, list):
+        # The lambda answers errors with a body instead of a status code
+        strength.refresh_failed(events)
+        return
+    strength.apply_refresh(events)
+
+async def arefresh_team_strength(strength: TeamStrength = TEAM_STRENGTH) -> TeamStrength:
+    """Async counterpart of `refresh_team_strength`. Coroutines that need a refresh while one runs await the same task."""
+    if not strength.needs_refresh():
+        return strength
+    task = strength.refresh_task
+    if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+        task = strength.refresh_task = asyncio.ensure_future(_arefresh_team_strength(strength))
+    # A waiter that is cancelled leaves the scan running for the others
+    await asyncio.shield(task)
+    return strength
+
+async def _arefresh_team_strength(strength: TeamStrength):
+    try:
+        events = await alambda_post(SCAN_LAMBDA_URL, create_event_history_scan_payload(strength.last_date))
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        strength.refresh_failed(e)
+        return
+    if not isinstance(events, list):
+        # The lambda answers errors with a body instead of a status code
+        strength.refresh_failed(events)
+        return
+    strength.apply_refresh(events)
@@ -1,6 +1,9 @@
 from pydantic import BaseModel
 from typing import Dict, List, Union, Optional, Literal, TypedDict
 from dataclasses import dataclass
+from array import array
+import math
+import sys
 
 # INPUT CLASSES
 
@@ -20,7 +23,8 @@ class PlayerEventParameters(BaseModel):
     opponent_team_name: Union[str,None]
     player_team_name: Union[str,None]
     tournament_name: Union[str,None]
-    player_name: str
+    # None: the whole squad of player_team_name
+    player_name: Union[str,None]
 
 class PlayerEventPerformanceArgs(BaseModel):
     parameters: List[PlayerEventParameters]
@@ -35,6 +39,27 @@ class PlayerSeasonPerformanceArgs(BaseModel):
     parameters: List[PlayerSeasonParameters]
     endpoint: Literal["stats", "ratings", "both"]
 
+class SeasonLeaderboardArgs(BaseModel):
+    tournament_name: str
+    season_year: Union[int,None]
+    stat: str
+    k: Union[int,None]
+    per_90: Union[bool,None]
+    min_minutes: Union[int,None]
+    position: Union[Literal["G", "D", "M", "F"],None]
+
+class SimilarPlayersArgs(BaseModel):
+    player_name: str
+    tournament_name: Union[str,None]
+    season_year: Union[int,None]
+    k: Union[int,None]
+    metric: Union[Literal["cosine", "euclidean"],None]
+    candidate_tournament_name: Union[str,None]
+    candidate_season_year: Union[int,None]
+    position: Union[Literal["G", "D", "M", "F"],None]
+    min_age: Union[int,None]
+    max_age: Union[int,None]
+
 @dataclass
 class EventSummary:
     home_team: str
@@ -60,6 +85,11 @@ class PlayerSeasonRatings:
     game_count: int = None
     big_game_count: int = None
     rating_std_dev: float = None
+    form_last_5: float = None
+    form_last_10: float = None
+    form_ewma: float = None
+    form_trend: float = None
+    opponent_band_ratings: dict = None
     info: str = None
 
 @dataclass
@@ -71,6 +101,8 @@ class PlayerSeasonStats:
     season_year: int = None
     unique_season_id : int = None
     stats: dict = None
+    position: str = None
+    percentiles: dict = None
 
 @dataclass
 class PlayerEventStats:
@@ -86,9 +118,311 @@ class PlayerEventStats:
     match_result : Literal["Won", "Draw", "Lost"] = None
     stats : dict = None
 
+@dataclass
+class SeasonLeaderboard:
+    tournament_name: str
+    season_year: int = None
+    stat: str = None
+    per_90: bool = False
+    min_minutes: int = None
+    min_games: int = None
+    position: str = None
+    players_considered: int = None
+    entries: List[dict] = None
+    info: str = None
+
+@dataclass
+class SimilarPlayers:
+    player_name: str
+    tournament_name: str = None
+    season_year: int = None
+    metric: str = None
+    filters: dict = None
+    seasons_considered: int = None
+    entries: List[dict] = None
+    info: str = None
+
 class ProcessedRating(TypedDict):
     total_games: int
     average_rating: float
     std_dev_rating: float
     average_big_club_rating: float
-    big_games_count: int
\ No newline at end of file
+    big_games_count: int
+
+# STAT SCHEMAS
+# Fixed column order of the numeric Sofascore statistics, shared by every stats table built from the results.
+# The groups let compact tool outputs keep only the stats that matter for a position.
+
+SEASON_STAT_GROUPS = {
+    # Appearances and rating
+    "appearances": (
+        "appearances", "matchesStarted", "minutesPlayed", "rating", "totalRating", "countRating", "totwAppearances",
+    ),
+    "scoring": (
+        "goals", "expectedGoals", "goalsAssistsSum", "scoringFrequency", "goalConversionPercentage",
+        "totalShots", "shotsOnTarget", "shotsOffTarget", "blockedShots", "hitWoodwork",
+        "shotsFromInsideTheBox", "shotsFromOutsideTheBox", "goalsFromInsideTheBox", "goalsFromOutsideTheBox",
+        "headedGoals", "leftFootGoals", "rightFootGoals", "freeKickGoal", "shotFromSetPiece", "setPieceConversion",
+        "penaltiesTaken", "penaltyGoals", "penaltyConversion", "penaltyWon",
+        "attemptPenaltyTarget", "attemptPenaltyPost", "attemptPenaltyMiss",
+        "bigChancesMissed", "offsides",
+    ),
+    "creativity": (
+        "assists", "expectedAssists", "bigChancesCreated", "keyPasses", "passToAssist", "totalAttemptAssist",
+    ),
+    "passing": (
+        "totalPasses", "accuratePasses", "inaccuratePasses", "accuratePassesPercentage",
+        "totalOwnHalfPasses", "accurateOwnHalfPasses", "totalOppositionHalfPasses", "accurateOppositionHalfPasses",
+        "accurateFinalThirdPasses", "totalLongBalls", "accurateLongBalls", "accurateLongBallsPercentage",
+        "totalChippedPasses", "accurateChippedPasses", "totalCross", "accurateCrosses", "accurateCrossesPercentage",
+    ),
+    # Possession and duels
+    "possession": (
+        "touches", "totalContest", "successfulDribbles", "successfulDribblesPercentage",
+        "possessionLost", "dispossessed", "possessionWonAttThird", "ballRecovery", "wasFouled",
+        "totalDuelsWon", "totalDuelsWonPercentage", "duelLost", "groundDuelsWon", "groundDuelsWonPercentage",
+        "aerialDuelsWon", "aerialLost", "aerialDuelsWonPercentage",
+    ),
+    "defending": (
+        "tackles", "tacklesWon", "tacklesWonPercentage", "interceptions", "clearances", "dribbledPast",
+        "errorLeadToShot", "errorLeadToGoal", "ownGoals", "penaltyConceded", "fouls",
+    ),
+    "discipline": (
+        "yellowCards", "yellowRedCards", "redCards", "directRedCards",
+    ),
+    "goalkeeping": (
+        "saves", "savesCaught", "savesParried", "savedShotsFromInsideTheBox", "savedShotsFromOutsideTheBox",
+        "goalsConceded", "goalsConcededInsideTheBox", "goalsConcededOutsideTheBox", "cleanSheet",
+        "penaltyFaced", "penaltySave", "punches", "highClaims", "crossesNotClaimed", "runsOut", "successfulRunsOut", "goalKicks",
+    ),
+}
+
+SEASON_STAT_COLUMNS = tuple(column for group in SEASON_STAT_GROUPS.values() for column in group)
+
+EVENT_STAT_GROUPS = {
+    "appearances": (
+        "minutesPlayed", "rating", "touches",
+    ),
+    "scoring": (
+        "goals", "expectedGoals", "onTargetScoringAttempt", "shotOffTarget", "blockedScoringAttempt", "hitWoodwork",
+        "bigChanceMissed", "penaltyWon", "penaltyMiss", "totalOffside",
+    ),
+    # Creativity and passing
+    "creativity": (
+        "goalAssist", "expectedAssists", "bigChanceCreated", "keyPass",
+        "totalPass", "accuratePass", "totalLongBalls", "accurateLongBalls", "totalCross", "accurateCross",
+    ),
+    # Possession and duels
+    "possession": (
+        "totalContest", "wonContest", "possessionLostCtrl", "dispossessed", "wasFouled",
+        "duelWon", "duelLost", "aerialWon", "aerialLost", "challengeLost",
+    ),
+    "defending": (
+        "totalTackle", "interceptionWon", "totalClearance", "outfielderBlock", "ballRecovery",
+        "errorLeadToAShot", "errorLeadToAGoal", "ownGoals", "penaltyConceded", "fouls",
+    ),
+    "goalkeeping": (
+        "saves", "savedShotsFromInsideTheBox", "punches", "goodHighClaim", "goalsPrevented",
+    ),
+}
+
+EVENT_STAT_COLUMNS = tuple(column for group in EVENT_STAT_GROUPS.values() for column in group)
+
+# Derived ratios: name -> (numerator column, denominator column)
+SEASON_STAT_RATIOS = {
+    "pass_accuracy": ("accuratePasses", "totalPasses"),
+    "long_ball_accuracy": ("accurateLongBalls", "totalLongBalls"),
+    "cross_accuracy": ("accurateCrosses", "totalCross"),
+    "shot_accuracy": ("shotsOnTarget", "totalShots"),
+    "dribble_success": ("successfulDribbles", "totalContest"),
+    "goals_per_xg": ("goals", "expectedGoals"),
+    "assists_per_xa": ("assists", "expectedAssists"),
+}
+
+EVENT_STAT_RATIOS = {
+    "pass_accuracy": ("accuratePass", "totalPass"),
+    "long_ball_accuracy": ("accurateLongBalls", "totalLongBalls"),
+    "cross_accuracy": ("accurateCross", "totalCross"),
+    "dribble_success": ("wonContest", "totalContest"),
+    "goals_per_xg": ("goals", "expectedGoals"),
+}
+
+# Stats a season is ranked on within its tournament, season and position
+PERCENTILE_STAT_COLUMNS = (
+    "rating", "goals", "expectedGoals", "totalShots", "shotsOnTarget", "bigChancesCreated", "assists", "expectedAssists",
+    "keyPasses", "accuratePasses", "accuratePassesPercentage", "accurateFinalThirdPasses", "accurateLongBalls",
+    "successfulDribbles", "touches", "possessionLost", "totalDuelsWonPercentage", "aerialDuelsWon",
+    "tackles", "interceptions", "clearances", "ballRecovery", "saves", "goalsConceded",
+)
+# Percentile columns where a lower value is better, their percentile is the share of the group at or above the player
+LOWER_IS_BETTER_STAT_COLUMNS = frozenset(["possessionLost", "goalsConceded"])
+
+# Columns that are rates, ratings or appearance counts, so per-90 values and team shares make no sense for them
+NON_ADDITIVE_STAT_COLUMNS = frozenset(
+    [column for column in SEASON_STAT_COLUMNS if column.endswith(("Percentage", "Conversion"))]
+    + ["appearances", "matchesStarted", "minutesPlayed", "rating", "totalRating", "countRating",
+       "totwAppearances", "scoringFrequency", "cleanSheet", "goalsPrevented"]
+)
+
+
+# COMPACT RESULT CLASSES
+# Slotted variants of the result classes for results that are kept in memory. Stat keys are interned and
+# stat values are stored in a float array under the shared schemas above.
+
+_SCHEMA_POSITIONS = {
+    schema: {column: position for position, column in enumerate(schema)}
+    for schema in (SEASON_STAT_COLUMNS, EVENT_STAT_COLUMNS)
+}
+
+
+def intern_keys(value):
+    """Rebuild a parsed JSON value with every dictionary key and string value interned."""
+    if isinstance(value, dict):
+        return {sys.intern(key) if isinstance(key, str) else key: intern_keys(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [intern_keys(item) for item in value]
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+class StatBlock:
+    """
+    A Sofascore stats dictionary stored as one float array under a shared schema.
+
+    Numeric schema stats go into `values` (NaN when missing) and a bit mask remembers which of them were ints.
+    Every other key, e.g. `ratingVersions`, is kept in `extras` with interned keys. `to_dict` rebuilds an equal dictionary.
+    """
+    __slots__ = ("schema", "values", "int_mask", "extras")
+
+    def __init__(self, schema: tuple, values: array, int_mask: int, extras: dict | None):
+        self.schema = schema
+        self.values = values
+        self.int_mask = int_mask
+        self.extras = extras
+
+    @classmethod
+    def from_dict(cls, stats: dict, schema: tuple) -> "StatBlock":
+        positions = _SCHEMA_POSITIONS[schema]
+        values = array("d", [math.nan]) * len(schema)
+        int_mask = 0
+        extras = {}
+        for key, value in stats.items():
+            position = positions.get(key)
+            if position is not None and type(value) in (int, float) and value == value:
+                values[position] = value
+                if type(value) is int:
+                    int_mask |= 1 << position
+            else:
+                extras[sys.intern(key)] = intern_keys(value)
+        return cls(schema, values, int_mask, extras or None)
+
+    def to_dict(self) -> dict:
+        stats = {}
+        for position, value in enumerate(self.values):
+            if value == value:
+                stats[self.schema[position]] = int(value) if self.int_mask >> position & 1 else value
+        if self.extras:
+            stats.update(self.extras)
+        return stats
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, StatBlock) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"StatBlock({self.to_dict()})"
+
+
+def _compact_stats(stats: dict | None, schema: tuple) -> StatBlock | None:
+    return None if stats is None else StatBlock.from_dict(stats, schema)
+
+def _expand_stats(stats: StatBlock | None) -> dict | None:
+    return None if stats is None else stats.to_dict()
+
+
+@dataclass(slots=True)
+class CompactPlayerSeasonStats:
+    player_name: str
+    player_id: int = None
+    tournament_name: str = None
+    tournament_id: int = None
+    season_year: int = None
+    unique_season_id : int = None
+    stats: StatBlock = None
+    position: str = None
+    percentiles: dict = None
+
+    @classmethod
+    def from_result(cls, result: PlayerSeasonStats) -> "CompactPlayerSeasonStats":
+        fields = {name: intern_keys(value) for name, value in vars(result).items() if name != "stats"}
+        return cls(**fields, stats=_compact_stats(result.stats, SEASON_STAT_COLUMNS))
+
+    def to_result(self) -> PlayerSeasonStats:
+        return PlayerSeasonStats(**self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__} | {"stats": _expand_stats(self.stats)}
+
+@dataclass(slots=True)
+class CompactPlayerEventStats:
+    player_id: int
+    player_name: str
+    tournament_name: str = None
+    event_date : str = None
+    opponent_team_name: str = None
+    player_team_name: str = None
+    is_home : bool = None
+    opponent_team_score: int = None
+    player_team_score: int = None
+    match_result : Literal["Won", "Draw", "Lost"] = None
+    stats : StatBlock = None
+
+    @classmethod
+    def from_result(cls, result: PlayerEventStats) -> "CompactPlayerEventStats":
+        fields = {name: intern_keys(value) for name, value in vars(result).items() if name != "stats"}
+        return cls(**fields, stats=_compact_stats(result.stats, EVENT_STAT_COLUMNS))
+
+    def to_result(self) -> PlayerEventStats:
+        return PlayerEventStats(**self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__} | {"stats": _expand_stats(self.stats)}
+
+@dataclass(slots=True)
+class CompactEventSummary:
+    home_team: str
+    away_team: str
+    home_team_squad: dict
+    away_team_squad: dict
+    comments: List[dict]
+    winner: str
+    home_team_score: int
+    away_team_score: int
+
+    @classmethod
+    def from_result(cls, result: EventSummary) -> "CompactEventSummary":
+        return cls(**{name: intern_keys(value) for name, value in vars(result).items()})
+
+    def to_result(self) -> EventSummary:
+        return EventSummary(**self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+_COMPACT_CLASSES = {
+    PlayerSeasonStats: CompactPlayerSeasonStats,
+    PlayerEventStats: CompactPlayerEventStats,
+    EventSummary: CompactEventSummary,
+}
+
+def compact_result(result):
+    """The compact variant of a result object. Anything else, e.g. error dictionaries, is returned unchanged."""
+    compact_class = _COMPACT_CLASSES.get(type(result))
+    return compact_class.from_result(result) if compact_class else result
+
+def expand_result(result):
+    """Inverse of `compact_result`."""
+    if isinstance(result, (CompactPlayerSeasonStats, CompactPlayerEventStats, CompactEventSummary)):
+        return result.to_result()
+    return result
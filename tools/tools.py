@@ -1,4 +1,16 @@
-from tools.functions import obtain_season_performance_data, obtain_event_performance_data, obtain_summary_of_event
+from tools.functions import (
+    obtain_season_performance_data,
+    obtain_event_performance_data,
+    obtain_summary_of_event,
+    aobtain_season_performance_data,
+    aobtain_event_performance_data,
+    aobtain_summary_of_event,
+    obtain_season_leaderboard,
+    aobtain_season_leaderboard,
+    obtain_similar_players,
+    aobtain_similar_players,
+)
+from tools.helper.compaction import compacted
 from pydantic import BaseModel
 from typing import Dict, Literal, List, Optional
 from langchain.tools import StructuredTool
@@ -7,7 +19,9 @@ from langchain_community.tools.tavily_search import TavilySearchResults
 
 
 SEASON_PERFORMANCE_TOOL = StructuredTool.from_function(
-    func=obtain_season_performance_data,
+    func=compacted(obtain_season_performance_data, "obtain_season_performance_data"),
+    coroutine=compacted(aobtain_season_performance_data, "obtain_season_performance_data"),
+    response_format="content_and_artifact",
     name="obtain_season_performance_data",
     description="""
         Fetch season level data for players. 
@@ -21,15 +35,19 @@ SEASON_PERFORMANCE_TOOL = StructuredTool.from_function(
 )
 
 EVENT_PERFORMANCE_TOOL = StructuredTool.from_function(
-    func=obtain_event_performance_data,
+    func=compacted(obtain_event_performance_data, "obtain_event_performance_data"),
+    coroutine=compacted(aobtain_event_performance_data, "obtain_event_performance_data"),
+    response_format="content_and_artifact",
     name="obtain_event_performance_data",
-    description="Fetch event level data for players. This tool should be used when asked about a player's performance in a specific football match / set of matches",
+    description="Fetch event level data for players. This tool should be used when asked about a player's performance in a specific football match / set of matches. Without a player name it returns every player of player_team_name who played.",
     args_schema=PlayerEventPerformanceArgs,  # Explicit schema
     infer_schema=False  # Ensure schema inference is disabled
 )
 
 EVENT_SUMMARY_TOOL = StructuredTool.from_function(
-    func=obtain_summary_of_event,
+    func=compacted(obtain_summary_of_event, "obtain_summary_of_event"),
+    coroutine=compacted(aobtain_summary_of_event, "obtain_summary_of_event"),
+    response_format="content_and_artifact",
     name="obtain_summary_of_event",
     description="""
     Fetches the summary of a football match. 
@@ -39,3 +57,32 @@ EVENT_SUMMARY_TOOL = StructuredTool.from_function(
     args_schema=EventSummaryArgs,
     infer_schema=False
 )
+
+SEASON_LEADERBOARD_TOOL = StructuredTool.from_function(
+    func=compacted(obtain_season_leaderboard, "obtain_season_leaderboard"),
+    coroutine=compacted(aobtain_season_leaderboard, "obtain_season_leaderboard"),
+    response_format="content_and_artifact",
+    name="obtain_season_leaderboard",
+    description="""
+    Ranks the players of a tournament season on one stat, e.g. top scorers or best rated players of a league.
+    This tool should be used when asked for the best players of a tournament season in a stat rather than about named players.
+    It only knows the players whose season data was fetched before, so the leaderboard can miss players.
+    'stat' is a Sofascore season stat like 'goals', 'assists', 'expectedGoals', 'tackles', 'saves' or a rating field like 'average_rating', 'form_last_5'.
+    """,
+    args_schema=SeasonLeaderboardArgs,
+    infer_schema=False
+)
+
+SIMILAR_PLAYERS_TOOL = StructuredTool.from_function(
+    func=compacted(obtain_similar_players, "obtain_similar_players"),
+    coroutine=compacted(aobtain_similar_players, "obtain_similar_players"),
+    response_format="content_and_artifact",
+    name="obtain_similar_players",
+    description="""
+    Finds players whose season stat profile is similar to a given player's season, e.g. to scout a replacement.
+    This tool should be used when asked who plays like a player or who could replace a player.
+    Candidates are the player seasons fetched so far, optionally filtered by tournament, season, position and age.
+    """,
+    args_schema=SimilarPlayersArgs,
+    infer_schema=False
+)